@@ -12,89 +12,158 @@ if BASE_DIR not in sys.path:
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
-import cv2
-import numpy as np
 import streamlit as st
 from datetime import datetime
 import json
-import csv
-
-from src.align.align import align_image   # <- corrigido
-from src import layout, extract, export_pdf
-
-def processar(gabarito_file, alunos_files, out_dir, materia, turma, escola, data, metodo="auto_fallback"):
+import zipfile
+
+# A pilha de correção (OpenCV, numpy, ReportLab) é importada no primeiro uso:
+# a página abre sem esperar por ela (ver _aquecimento)
+from src.layout_cache import get_default_cache
+from src.metrics import nova_execucao
+from src.warmup import get_aquecimento
+
+# Gabaritos já preparados nesta instância do app (hash do upload -> layout e respostas)
+MAX_GABARITOS = 16
+
+
+@st.cache_resource
+def _aquecimento():
+    """
+    Aquece o servidor em segundo plano, uma vez: enquanto o usuário envia as
+    provas, a pilha de correção é carregada e exercitada (src/warmup.py).
+    """
+    aquecimento = get_aquecimento()
+    aquecimento.iniciar()
+    return aquecimento
+
+
+@st.cache_resource
+def _gabaritos():
+    return {}
+
+
+def carregar_gabarito(dados, metodo, debug_dir, metricas):
+    """
+    Layout e respostas do gabarito, reaproveitados entre execuções do script
+    pelo conteúdo do upload (sem decodificar a imagem de novo).
+    """
+    from src.engine import decode_image, preparar_gabarito, DECODE_MIN_LADO
+    from src.ratio_store import content_hash
+
+    cache = _gabaritos()
+    chave = (content_hash(dados), metodo)
+    if chave in cache:
+        metricas.registrar_gabarito({}, cache_hit=True)
+        return cache[chave]
+
+    tempos_gab = {}
+    layout, ans_key, warped_key = preparar_gabarito(decode_image(dados, cinza=True, min_lado=DECODE_MIN_LADO), metodo=metodo, debug_dir=debug_dir,
+                                                    cache=get_default_cache(), tempos=tempos_gab)
+    metricas.registrar_gabarito(tempos_gab, cache_hit=warped_key is None)
+    if len(cache) >= MAX_GABARITOS:
+        cache.pop(next(iter(cache)))
+    cache[chave] = (layout, ans_key)
+    return layout, ans_key
+
+
+def processar(gabarito_file, alunos_files, out_dir, materia, turma, escola, data, metodo="auto_fallback",
+              workers=None, esparso=False):
     os.makedirs(out_dir, exist_ok=True)
     debug_dir = os.path.join(out_dir, "debug")
     os.makedirs(debug_dir, exist_ok=True)
 
+    _aquecimento().pronto.wait()
+    from src.engine import make_context, regrade_batch, export_reports
+    from src.ratio_store import get_default_store
+    from src.result_store import ResultStore, assinatura, duplicata_de
+    from src.export_pdf import export_class_pdf
+
+    metricas = nova_execucao()
+
     # Gabarito
-    img_key = cv2.imdecode(np.frombuffer(gabarito_file.read(), np.uint8), cv2.IMREAD_COLOR)
-    warped_key, metodo_key, ok_key = align_image(img_key, metodo=metodo, debug_dir=debug_dir)
-    if not ok_key:
+    try:
+        layout_data, ans_key = carregar_gabarito(gabarito_file.getvalue(), metodo, debug_dir, metricas)
+    except Exception:
         st.error("Falha no alinhamento do gabarito.")
-        return
-
-    layout_data, thr = layout.learn_layout_from_key(warped_key)
-    ans_key, _ = extract.choose_option(warped_key, layout_data, thr)
-
-    resultados = []
-
-    for aluno_file in alunos_files:
-        img = cv2.imdecode(np.frombuffer(aluno_file.read(), np.uint8), cv2.IMREAD_COLOR)
-        aluno_nome = os.path.splitext(aluno_file.name)[0]
-
-        warped, metodo_usado, ok = align_image(img, metodo=metodo, debug_dir=debug_dir)
-        if not ok:
-            st.warning(f"Não foi possível alinhar a prova de {aluno_nome}")
-            continue
-
-        ans_stu, metrics = extract.choose_option(warped, layout_data)
-        stats = extract.compare_answers(ans_stu, ans_key)
-
-        meta = {
-            "aluno": aluno_nome,
-            "materia": materia,
-            "turma": turma,
-            "escola": escola,
-            "data": data,
-            "score": stats["score"],
-            "correct": stats["correct"],
-            "total": len(ans_key),
-            "percentual": stats["score"]
-        }
-
-        pdf_path = os.path.join(out_dir, f"{aluno_nome}.pdf")
-        export_pdf.export_pdf(pdf_path, meta, stats["per_q"])
-
-        resultados.append({
-            "aluno": aluno_nome,
-            "nota": stats["score"],
-            "acertos": stats["correct"],
-            "erros": stats["wrong"],
-            "brancos": stats["blank"],
-            "multiplas": stats["multi"]
-        })
-
-    # Salvar CSV e JSON
-    csv_path = os.path.join(out_dir, "resultados.csv")
-    with open(csv_path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["aluno","nota","acertos","erros","brancos","multiplas"])
-        writer.writeheader()
-        for r in resultados:
-            writer.writerow(r)
-
-    json_path = os.path.join(out_dir, "resultados.json")
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(resultados, f, ensure_ascii=False, indent=2)
+        return None
+
+    ctx = make_context(layout_data, ans_key, out_dir, metodo=metodo, debug_dir=debug_dir,
+                       meta={"materia": materia, "turma": turma, "escola": escola, "data": data},
+                       esparso=esparso, pdf=False)
+
+    # PDFs gerados a cada bloco de resultados gravado
+    def ao_gravar(bloco):
+        corrigidos = [r for r in bloco if r["ok"]]
+        export_reports(corrigidos, out_dir, workers=workers)
+        metricas.registrar_pdfs(corrigidos)
+
+    store = ResultStore(os.path.join(out_dir, "blocos"), list(ctx["ans_key"]), layout_data["options"],
+                        chave=assinatura(ctx["layout_id"], ctx["ans_key"], metodo=metodo, esparso=esparso,
+                                         meta=ctx["meta"]),
+                        ao_gravar=ao_gravar)
+    pendentes = [f for f in alunos_files if f.name not in store.feitos]
+    itens = [(os.path.splitext(f.name)[0], f.getvalue()) for f in pendentes]
+
+    # Provas já vistas com este layout (mesmo arquivo ou a mesma foto
+    # recomprimida) são recorrigidas pelas proporções guardadas, sem alinhar;
+    # a tabela e a barra de progresso são atualizadas a cada prova
+    barra = st.progress(0.0, text="Corrigindo...")
+    tabela = st.empty()
+    campos = ["aluno", "nota", "acertos", "erros", "brancos", "multiplas", "duplicata_de"]
+    parciais = []
+    passo = max(1, len(itens) // 50)
+    lote = regrade_batch(itens, ctx, get_default_store(), workers=workers)
+    for i, (f, r) in enumerate(zip(pendentes, lote), 1):
+        metricas.registrar_resultado(r)
+        if not r["ok"]:
+            st.warning(f"Não foi possível corrigir a prova de {r['aluno']}: {r['erro']}")
+        else:
+            if duplicata_de(r):
+                st.warning(f"A prova de {r['aluno']} é a mesma foto da prova de {duplicata_de(r)}.")
+            stats = r["stats"]
+            parciais.append({"aluno": r["aluno"], "nota": stats["score"], "acertos": stats["correct"],
+                             "erros": stats["wrong"], "brancos": stats["blank"], "multiplas": stats["multi"],
+                             "duplicata_de": duplicata_de(r)})
+        store.adicionar(r, f.name)
+        if i % passo == 0 or i == len(itens):
+            barra.progress(i / len(itens), text=f"Corrigidas {i} de {len(itens)} provas")
+            tabela.dataframe(parciais)
+    store.fechar()
+    metricas.finalizar().salvar(os.path.join(out_dir, "metricas.json"))
+    barra.empty()
+    tabela.empty()
+
+    # PDF da turma, CSV e JSON a partir dos blocos gravados
+    export_class_pdf(os.path.join(out_dir, "turma.pdf"), store.relatorios(ctx["ans_key"], ctx["meta"]))
+    csv_path = store.exportar_csv(os.path.join(out_dir, "resultados.csv"), campos)
+    json_path = store.exportar_json(os.path.join(out_dir, "resultados.json"), campos)
+    resultados = [{c: linha[c] for c in campos} for linha in store.linhas()]
 
     return resultados, csv_path, json_path, out_dir
 
 
+def zip_relatorios(out_dir, alunos):
+    """
+    Um único ZIP com os PDFs individuais, montado só quando pedido.
+    """
+    zip_path = os.path.join(out_dir, "relatorios.zip")
+    tmp = zip_path + ".tmp"
+    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_STORED) as zf:
+        for aluno in alunos:
+            pdf_file = os.path.join(out_dir, f"{aluno}.pdf")
+            if os.path.exists(pdf_file):
+                zf.write(pdf_file, f"{aluno}.pdf")
+    os.replace(tmp, zip_path)
+    return zip_path
+
+
 # -------------------------------
 # Interface Streamlit
 # -------------------------------
 st.set_page_config(page_title="CorriJá - Correção de Provas", layout="wide")
 st.title(" CorriJá - Correção Automática de Provas")
+_aquecimento()
 
 with st.sidebar:
     st.header("Configurações")
@@ -104,6 +173,8 @@ with st.sidebar:
     escola = st.text_input("Escola", "Colégio Estadual MS")
     data = st.date_input("Data da prova", datetime.today()).strftime("%d/%m/%Y")
     metodo = st.selectbox("Método de alinhamento", ["auto_fallback", "auto", "aruco"], index=0)
+    workers = st.number_input("Processos em paralelo (0 = todos os núcleos)", min_value=0, value=0, step=1)
+    esparso = st.checkbox("Leitura esparsa (só as regiões das bolhas)", value=False)
 
 gabarito_file = st.file_uploader("Upload do gabarito", type=["jpg","jpeg","png"])
 alunos_files = st.file_uploader("Upload das provas dos alunos", type=["jpg","jpeg","png"], accept_multiple_files=True)
@@ -113,10 +184,15 @@ if st.button("🚀 Processar") and gabarito_file and alunos_files:
     out_dir = os.path.join(os.getcwd(), "saida_streamlit")
     os.makedirs(out_dir, exist_ok=True)
 
-    resultados, csv_path, json_path, out_dir = processar(
-        gabarito_file, alunos_files, out_dir, materia, turma, escola, data, metodo
+    # guardado na sessão: os botões de download disparam novas execuções do script
+    st.session_state["saida"] = processar(
+        gabarito_file, alunos_files, out_dir, materia, turma, escola, data, metodo, int(workers), esparso
     )
+    st.session_state.pop("zip", None)
 
+saida = st.session_state.get("saida")
+if saida:
+    resultados, csv_path, json_path, out_dir = saida
     if resultados:
         st.success("✅ Processamento concluído!")
         st.subheader("📊 Resultados")
@@ -129,10 +205,22 @@ if st.button("🚀 Processar") and gabarito_file and alunos_files:
         with open(json_path, "rb") as f:
             st.download_button("📥 Baixar JSON", f, "resultados.json")
 
-        # PDFs individuais
+        metricas_path = os.path.join(out_dir, "metricas.json")
+        if os.path.exists(metricas_path):
+            with st.expander("⏱️ Tempo por estágio"):
+                with open(metricas_path, "r", encoding="utf-8") as f:
+                    st.json(json.load(f))
+
+        turma_pdf = os.path.join(out_dir, "turma.pdf")
+        if os.path.exists(turma_pdf):
+            with open(turma_pdf, "rb") as f:
+                st.download_button("📥 Baixar PDF da turma", f, "turma.pdf", "application/pdf")
+
+        # PDFs individuais: um ZIP só, montado quando pedido
         st.subheader("📑 Relatórios Individuais")
-        for r in resultados:
-            pdf_file = os.path.join(out_dir, f"{r['aluno']}.pdf")
-            if os.path.exists(pdf_file):
-                with open(pdf_file, "rb") as f:
-                    st.download_button(f"📥 {r['aluno']}.pdf", f, f"{r['aluno']}.pdf", "application/pdf")
+        if st.button("📦 Preparar ZIP dos relatórios"):
+            st.session_state["zip"] = zip_relatorios(out_dir, [r["aluno"] for r in resultados])
+        zip_path = st.session_state.get("zip")
+        if zip_path and os.path.exists(zip_path):
+            with open(zip_path, "rb") as f:
+                st.download_button("📥 Baixar relatórios (ZIP)", f, "relatorios.zip", "application/zip")
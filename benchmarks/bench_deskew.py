@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+"""
+Compara o deskew antigo (todas as coordenadas da imagem em int64 +
+minAreaRect) com o atual (ângulo estimado numa miniatura).
+
+    python benchmarks/bench_deskew.py [--mp 12] [--angulo 4] [--repeticoes 3]
+
+Mostra latência, pico de memória alocada (tracemalloc) e a inclinação que
+sobra na saída. O resíduo é medido pela geometria conhecida da foto
+sintética (os cantos da folha, levados pela rotação aplicada e pela matriz
+que cada deskew devolve), e não por um estimador de ângulo, que daria razão
+a si mesmo.
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import cv2
+import numpy as np
+
+from src.align.align import deskew
+
+
+def deskew_legado(img_bgr):
+    """
+    Implementação anterior, mantida aqui só para comparação.
+    """
+    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+    gray = cv2.bitwise_not(gray)
+    coords = np.column_stack(np.where(gray > 0))
+    angle = cv2.minAreaRect(coords)[-1]
+
+    if angle < -45:
+        angle = -(90 + angle)
+    else:
+        angle = -angle
+
+    (h, w) = img_bgr.shape[:2]
+    M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
+    rotated = cv2.warpAffine(img_bgr, M, (w, h),
+                             flags=cv2.INTER_CUBIC,
+                             borderMode=cv2.BORDER_REPLICATE)
+    return rotated, M
+
+
+def foto_inclinada(megapixels, angulo, seed=0):
+    """
+    Folha de bolhas sobre fundo escuro, girada `angulo` graus, com ~megapixels.
+    Retorna (foto, cantos da folha na foto: sup. esq., sup. dir., inf. dir.,
+    inf. esq.).
+    """
+    rng = np.random.default_rng(seed)
+    folha = np.full((1400, 1000, 3), 255, np.uint8)
+    for q in range(60):
+        for o in range(5):
+            cx, cy = 120 + (q // 20) * 300 + o * 45, 180 + (q % 20) * 55
+            cv2.circle(folha, (cx, cy), 14, (0, 0, 0), 2)
+            if o == rng.integers(0, 5):
+                cv2.circle(folha, (cx, cy), 11, (0, 0, 0), -1)
+
+    folha = cv2.copyMakeBorder(folha, 120, 120, 120, 120, cv2.BORDER_CONSTANT, value=(70, 70, 70))
+    h, w = folha.shape[:2]
+    escala = np.sqrt(megapixels * 1e6 / (h * w))
+    out_w, out_h = int(w * escala), int(h * escala)
+    M = cv2.getRotationMatrix2D((w / 2, h / 2), angulo, escala)
+    M[0, 2] += out_w / 2 - w / 2
+    M[1, 2] += out_h / 2 - h / 2
+    foto = cv2.warpAffine(folha, M, (out_w, out_h), borderValue=(70, 70, 70))
+    ruido = rng.normal(0, 6, foto.shape)
+    cantos = np.float32([[120, 120], [1120, 120], [1120, 1520], [120, 1520]])
+    cantos = cv2.transform(cantos.reshape(-1, 1, 2), M).reshape(-1, 2)
+    return np.clip(foto + ruido, 0, 255).astype(np.uint8), cantos
+
+
+def inclinacao(cantos):
+    """
+    Inclinação (graus, anti-horária positiva como em getRotationMatrix2D)
+    das bordas superior e inferior da folha, pelos cantos.
+    """
+    d = (cantos[1] - cantos[0]) + (cantos[2] - cantos[3])
+    return float(np.degrees(np.arctan2(-d[1], d[0])))
+
+
+def medir(fn, img, repeticoes):
+    fn(img)  # aquecimento
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        fn(img)
+        tempos.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    _, M = fn(img)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(tempos), pico, M
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do deskew")
+    parser.add_argument("--mp", type=float, default=12.0, help="Megapixels da foto sintética")
+    parser.add_argument("--angulo", type=float, default=4.0, help="Inclinação aplicada (graus)")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    img, cantos = foto_inclinada(args.mp, args.angulo)
+    print(f"Imagem: {img.shape[1]}x{img.shape[0]} ({img.nbytes / 1e6:.0f} MB), "
+          f"inclinação {inclinacao(cantos):.2f}°")
+    print(f"{'versão':<8} {'tempo (ms)':>11} {'pico (MB)':>10} {'resíduo (°)':>12}")
+    for nome, fn in (("legado", deskew_legado), ("atual", deskew)):
+        tempo, pico, M = medir(fn, img, args.repeticoes)
+        residuo = inclinacao(cv2.transform(cantos.reshape(-1, 1, 2), M).reshape(-1, 2))
+        print(f"{nome:<8} {tempo * 1000:>11.0f} {pico / 1e6:>10.1f} {residuo:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+"""
+Benchmark por estágio e do pipeline completo, sobre provas sintéticas
+(src/synth.py) com respostas conhecidas.
+
+    python benchmarks/bench_pipeline.py [--mp 2,8,12] [--lote 8,32] [--workers 1]
+
+Para cada tamanho de imagem (megapixels) e tamanho de lote mostra, por estágio
+(decode, alinhamento, extração, comparação, PDF; layout no gabarito) e para o
+pipeline inteiro (grade_batch + PDFs em lote): provas/s, latência p50/p95/p99,
+pico de RSS e a acurácia contra a verdade do gerador.
+
+O pico de RSS de cada estágio vem do VmHWM do Linux, zerado antes de cada
+chamada (/proc/self/clear_refs) depois de devolver ao sistema a memória livre
+do alocador (malloc_trim), e é mostrado como acréscimo sobre o RSS de antes
+da chamada; onde isso não existe, cai no ru_maxrss do processo (que só cresce). Com --workers > 1, "workers" é o maior pico entre
+os processos filhos já encerrados.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import ctypes
+import resource
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import numpy as np
+
+from src.synth import gerar_gabarito, gerar_lote, encode_jpeg, MARCADORES
+from src.engine import (decode_image, preparar_gabarito, make_context, grade_batch,
+                        export_reports, DECODE_MIN_LADO)
+from src.align.align import align_image
+from src.layout import learn_layout_from_key
+from src.extract import choose_option, compare_answers
+from src.export_pdf import export_pdf
+from src.sheet import Sheet
+
+
+# -------------------------
+# Memória
+# -------------------------
+def _status_kb(campo):
+    try:
+        with open("/proc/self/status") as f:
+            for linha in f:
+                if linha.startswith(campo):
+                    return int(linha.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def rss_mb():
+    kb = _status_kb("VmRSS:")
+    return kb / 1024 if kb is not None else float("nan")
+
+
+try:
+    _LIBC = ctypes.CDLL("libc.so.6")
+except OSError:
+    _LIBC = None
+
+
+def zerar_pico():
+    """
+    Devolve a memória livre do malloc ao sistema e zera o VmHWM, para que o
+    próximo pico reflita só o que for alocado daqui em diante.
+    """
+    if _LIBC is not None:
+        _LIBC.malloc_trim(0)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def pico_mb():
+    kb = _status_kb("VmHWM:")
+    if kb is None:
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 1024
+
+
+def pico_filhos_mb():
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+
+class Estagio:
+    """
+    Acumula latências e pico de RSS de um estágio.
+    """
+
+    def __init__(self, nome):
+        self.nome = nome
+        self.tempos = []
+        self.pico = 0.0
+
+    def medir(self, fn, *args, **kwargs):
+        zerar_pico()
+        antes = rss_mb()
+        t0 = time.perf_counter()
+        out = fn(*args, **kwargs)
+        self.tempos.append(time.perf_counter() - t0)
+        self.pico = max(self.pico, pico_mb() - antes)
+        return out
+
+    def resumo(self):
+        t = np.array(self.tempos) * 1000
+        return {
+            "estagio": self.nome,
+            "n": len(t),
+            "provas_s": len(t) / (t.sum() / 1000) if t.sum() > 0 else float("nan"),
+            "p50_ms": float(np.percentile(t, 50)),
+            "p95_ms": float(np.percentile(t, 95)),
+            "p99_ms": float(np.percentile(t, 99)),
+            "pico_mb": self.pico,
+        }
+
+
+# -------------------------
+# Cenários
+# -------------------------
+def _acertos(respostas, verdade):
+    return sum(respostas.get(q, "") == r for q, r in verdade.items())
+
+
+def _decode_opts(cor):
+    """
+    Decodificação do pipeline (cinza, reduzida para fotos grandes) ou, com cor, BGR inteira.
+    """
+    return {"cinza": False, "min_lado": None} if cor else {"cinza": True, "min_lado": DECODE_MIN_LADO}
+
+
+def bench_estagios(gab_jpeg, provas, repeticoes, pdf_dir, cor=False):
+    """
+    Cada estágio isolado, prova a prova, no processo atual.
+    """
+    est = {n: Estagio(n) for n in ("layout", "decode", "alinhamento", "extracao", "comparacao", "pdf")}
+    opts = _decode_opts(cor)
+
+    img_key = decode_image(gab_jpeg, **opts)
+    warped_key, _, ok = align_image(img_key)
+    if not ok:
+        raise RuntimeError("Falha no alinhamento do gabarito sintético")
+    for _ in range(repeticoes):
+        layout, _ = est["layout"].medir(learn_layout_from_key, Sheet(warped_key))
+    ans_key, _ = choose_option(Sheet(warped_key), layout)
+
+    acertos = total = 0
+    for nome, dados, verdade in provas:
+        img = est["decode"].medir(decode_image, dados, **opts)
+        warped, _, _ = est["alinhamento"].medir(align_image, img)
+        del img
+        respostas, _ = est["extracao"].medir(choose_option, Sheet(warped), layout)
+        del warped
+        stats = est["comparacao"].medir(compare_answers, respostas, ans_key)
+        meta = {"aluno": nome, "score": stats["score"], "correct": stats["correct"],
+                "total": len(ans_key)}
+        est["pdf"].medir(export_pdf, os.path.join(pdf_dir, f"{nome}.pdf"), meta, stats["per_q"])
+        acertos += _acertos(respostas, verdade)
+        total += len(verdade)
+    return [e.resumo() for e in est.values()], acertos / max(total, 1)
+
+
+def bench_pipeline(gab_jpeg, provas, workers, esparso, out_dir, cor=False):
+    """
+    Pipeline completo como no main.py: correção em fluxo + PDFs em lote.
+    A latência de cada prova vai de quando ela é lida até o resultado sair.
+    """
+    opts = _decode_opts(cor)
+    layout, ans_key, _ = preparar_gabarito(decode_image(gab_jpeg, **opts))
+    ctx = make_context(layout, ans_key, out_dir, esparso=esparso, pdf=False, **opts)
+    verdade = {nome: v for nome, _, v in provas}
+    entrada = {}
+
+    def itens():
+        for nome, dados, _ in provas:
+            entrada[nome] = time.perf_counter()
+            yield nome, dados
+
+    zerar_pico()
+    antes = rss_mb()
+    t0 = time.perf_counter()
+    latencias, resultados = [], []
+    acertos = total = 0
+    for r in grade_batch(itens(), ctx, workers=workers):
+        latencias.append(time.perf_counter() - entrada[r["aluno"]])
+        resultados.append(r)
+        if r["ok"]:
+            per_q = r["stats"]["per_q"]
+            acertos += _acertos({q: v["student"] for q, v in per_q.items()}, verdade[r["aluno"]])
+        total += len(verdade[r["aluno"]])
+    export_reports(resultados, out_dir, workers=workers)
+    dt = time.perf_counter() - t0
+
+    t = np.array(latencias) * 1000
+    return {
+        "estagio": "pipeline",
+        "n": len(t),
+        "provas_s": len(t) / dt,
+        "p50_ms": float(np.percentile(t, 50)),
+        "p95_ms": float(np.percentile(t, 95)),
+        "p99_ms": float(np.percentile(t, 99)),
+        "pico_mb": pico_mb() - antes,
+        "pico_workers_mb": pico_filhos_mb() if workers > 1 else None,
+    }, acertos / max(total, 1)
+
+
+# -------------------------
+# CLI
+# -------------------------
+def _lista(tipo):
+    return lambda s: [tipo(x) for x in s.split(",") if x]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark por estágio e do pipeline completo")
+    parser.add_argument("--mp", type=_lista(float), default=[2.0, 8.0, 12.0], help="Megapixels (lista)")
+    parser.add_argument("--lote", type=_lista(int), default=[8, 32], help="Tamanhos de lote (lista)")
+    parser.add_argument("--questoes", type=int, default=40)
+    parser.add_argument("--colunas", type=int, default=2)
+    parser.add_argument("--marcador", default="aruco", choices=MARCADORES)
+    parser.add_argument("--workers", type=int, default=1, help="Processos no pipeline completo")
+    parser.add_argument("--esparso", action="store_true", help="Pipeline no modo esparso")
+    parser.add_argument("--cor", action="store_true",
+                        help="Decodifica em BGR na resolução original (para comparar com o modo cinza)")
+    parser.add_argument("--repeticoes", type=int, default=3, help="Repetições do aprendizado do layout")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Grava os resultados neste arquivo")
+    args = parser.parse_args()
+
+    linhas = []
+    print(f"{'MP':>5} {'lote':>5} {'estágio':<12} {'provas/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'+pico MB':>8}")
+    for mp in args.mp:
+        gab = gerar_gabarito(args.seed, args.questoes, colunas=args.colunas, marcador=args.marcador,
+                             megapixels=mp)
+        gab_jpeg = encode_jpeg(gab["img"])
+        del gab["img"]
+        for n in args.lote:
+            provas = [(p["nome"], encode_jpeg(p["img"]), p["respostas"])
+                      for p in gerar_lote(n, gab, seed=args.seed)]
+            with tempfile.TemporaryDirectory() as tmp:
+                estagios, acc_est = bench_estagios(gab_jpeg, provas, args.repeticoes, tmp, cor=args.cor)
+            with tempfile.TemporaryDirectory() as tmp:
+                pipe, acc_pipe = bench_pipeline(gab_jpeg, provas, args.workers, args.esparso, tmp, cor=args.cor)
+
+            for r in estagios + [pipe]:
+                r.update({"mp": mp, "lote": n})
+                linhas.append(r)
+                print(f"{mp:>5g} {n:>5} {r['estagio']:<12} {r['provas_s']:>9.1f} {r['p50_ms']:>8.1f} "
+                      f"{r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['pico_mb']:>8.0f}")
+            if pipe["pico_workers_mb"] is not None:
+                print(f"{'':>11} pico dos workers: {pipe['pico_workers_mb']:.0f} MB")
+            print(f"{'':>11} acurácia: estágios {acc_est:.3f}, pipeline {acc_pipe:.3f}  "
+                  f"(RSS atual {rss_mb():.0f} MB)")
+            linhas.append({"mp": mp, "lote": n, "acuracia_estagios": acc_est,
+                           "acuracia_pipeline": acc_pipe})
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(linhas, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+"""
+Correção e análise de itens de uma turma grande: compare_answers aluno a
+aluno (dicts) contra a matriz alunos x questões de src/scoring.py.
+
+    python benchmarks/bench_scoring.py [--alunos 5000] [--questoes 90]
+
+Mostra o tempo de cada caminho, a memória ocupada pelas respostas (dicts
+medidos com tracemalloc, matriz pelo nbytes) e confere que as notas batem.
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import numpy as np
+
+from src.extract import compare_answers
+from src.scoring import codificar_respostas, codificar_chave, corrigir_turma, analise_itens
+
+
+def gerar(n_alunos, n_questoes, options, seed):
+    rng = np.random.default_rng(seed)
+    ans_key = {}
+    for q in range(1, n_questoes + 1):
+        if rng.random() < 0.05:  # algumas questões com duas alternativas corretas
+            ans_key[q] = [str(x) for x in rng.choice(options, 2, replace=False)]
+        else:
+            ans_key[q] = str(rng.choice(options))
+    habilidade = rng.uniform(0.2, 0.95, n_alunos)
+    alunos = []
+    for i in range(n_alunos):
+        resp = {}
+        for q, key in ans_key.items():
+            s = rng.random()
+            if s < 0.04:
+                resp[q] = ""
+            elif s < 0.04 + habilidade[i] * 0.96:
+                resp[q] = key[0] if isinstance(key, list) else key
+            else:
+                resp[q] = str(rng.choice(options))
+        alunos.append(resp)
+    return ans_key, alunos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Correção vetorizada x compare_answers")
+    parser.add_argument("--alunos", type=int, default=5000)
+    parser.add_argument("--questoes", type=int, default=90)
+    parser.add_argument("--opcoes", default="ABCDE")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    options = list(args.opcoes)
+
+    ans_key, alunos = gerar(args.alunos, args.questoes, options, args.seed)
+    qids = list(ans_key)
+
+    # caminho atual: um compare_answers por aluno + estatísticas a partir dos dicts
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    stats = [compare_answers(resp, ans_key) for resp in alunos]
+    acertos_q = {qid: sum(s["per_q"][qid]["result"] == "ok" for s in stats) for qid in qids}
+    dt_dicts = time.perf_counter() - t0
+    mem_dicts = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # matriz
+    t0 = time.perf_counter()
+    R = codificar_respostas(alunos, qids, options)
+    K = codificar_chave(ans_key, qids, options)
+    dt_cod = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    turma = corrigir_turma(R, K)
+    analise = analise_itens(R, K, turma["acerto"])
+    dt_mat = time.perf_counter() - t0
+
+    assert np.allclose(turma["score"], [s["score"] for s in stats])
+    assert np.array_equal(turma["acerto"].sum(axis=0), [acertos_q[q] for q in qids])
+
+    print(f"{args.alunos} alunos x {args.questoes} questões")
+    print(f"  dicts  : {dt_dicts * 1000:8.1f} ms  {mem_dicts / 2**20:8.1f} MB")
+    print(f"  matriz : {dt_mat * 1000:8.1f} ms  {(R.nbytes + K.nbytes) / 2**20:8.2f} MB  "
+          f"(+{dt_cod * 1000:.0f} ms para codificar os dicts)")
+    print(f"  p médio {analise['p'].mean():.3f}, discriminação média {analise['discriminacao'].mean():.3f}")
+
+
+if __name__ == "__main__":
+    main()
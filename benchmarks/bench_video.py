@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+"""
+Benchmark do modo vídeo (src/video.py) sobre um vídeo sintético
+(src/synth.py, gerar_video) com respostas conhecidas.
+
+    python benchmarks/bench_video.py [--res 1280x720,1920x1080] [--folhas 4]
+
+Para cada resolução mostra quadros/s e ms por quadro (leitura do vídeo,
+detecção, rastreamento, leitura das bolhas) do modo vídeo, contra detectar e
+ler a folha em todo quadro (o caminho das fotos aplicado quadro a quadro),
+quantos resultados saíram (o certo é um por folha) e a acurácia por questão.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import cv2
+
+from src.synth import gerar_gabarito, gerar_video, encode_jpeg
+from src.engine import decode_image, preparar_gabarito, make_context, DECODE_MIN_LADO
+from src.align.align import estimate_homography
+from src.sparse import choose_option_sparse
+from src.video import CorretorVideo, abrir_fonte, VIDEO_DETECT_MAX_DIM
+
+
+def _lista_res(s):
+    return [tuple(int(v) for v in r.split("x")) for r in s.split(",")]
+
+
+def _ler_quadros(path):
+    cap = abrir_fonte(path)
+    quadros = []
+    t0 = time.perf_counter()
+    while True:
+        ok, q = cap.read()
+        if not ok:
+            break
+        quadros.append(q)
+    cap.release()
+    return quadros, (time.perf_counter() - t0) / max(1, len(quadros))
+
+
+def bench_video(quadros, ctx):
+    corretor = CorretorVideo(ctx)
+    t0 = time.perf_counter()
+    resultados = [r for r in map(corretor.processar, quadros) if r is not None]
+    dt = time.perf_counter() - t0
+    return resultados, dt, corretor.tempos
+
+
+def bench_por_quadro(quadros, ctx):
+    """
+    Detecta e lê a folha em todo quadro, sem rastreamento.
+    """
+    metodo = ctx["layout"].get("alinhamento") or "aruco"
+    opcoes = {"threshold": ctx["threshold"], "diff_min": ctx["diff_min"]}
+    t0 = time.perf_counter()
+    for q in quadros:
+        gray = cv2.cvtColor(q, cv2.COLOR_BGR2GRAY)
+        M, _, ok = estimate_homography(gray, metodo, max_dim=VIDEO_DETECT_MAX_DIM, avisar=False)
+        if ok:
+            choose_option_sparse(gray, M, ctx["layout"], **opcoes)
+    return time.perf_counter() - t0
+
+
+def _acuracia(resultados, verdade):
+    certas = total = 0
+    for r, v in zip(resultados, verdade):
+        for qid, info in r["stats"]["per_q"].items():
+            certas += info["student"] == v["respostas"][qid]
+            total += 1
+    return certas / total if total else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do modo vídeo")
+    parser.add_argument("--res", type=_lista_res, default=[(1280, 720), (1920, 1080)],
+                        help="Resoluções LxA (lista)")
+    parser.add_argument("--folhas", type=int, default=4, help="Folhas mostradas no vídeo")
+    parser.add_argument("--questoes", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Grava os resultados neste arquivo")
+    args = parser.parse_args()
+
+    gab = gerar_gabarito(args.seed, args.questoes)
+    img_key = decode_image(encode_jpeg(gab["img"]), cinza=True, min_lado=DECODE_MIN_LADO)
+    layout, ans_key, _ = preparar_gabarito(img_key)
+
+    linhas = []
+    print(f"{'res':>10} {'modo':<11} {'quadros/s':>9} {'ms/quadro':>9} {'folhas':>7} {'acurácia':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        ctx = make_context(layout, ans_key, tmp, esparso=True, pdf=False)
+        for largura, altura in args.res:
+            path = os.path.join(tmp, f"video_{largura}x{altura}.mp4")
+            verdade = gerar_video(path, gab, n_folhas=args.folhas, seed=args.seed,
+                                  largura=largura, altura=altura)
+            quadros, leitura_s = _ler_quadros(path)
+            n = len(quadros)
+
+            resultados, dt, tempos = bench_video(quadros, ctx)
+            dt_quadro = bench_por_quadro(quadros, ctx)
+            res = f"{largura}x{altura}"
+            acc = _acuracia(resultados, verdade)
+            print(f"{res:>10} {'video':<11} {n / dt:>9.1f} {dt * 1000 / n:>9.2f} "
+                  f"{len(resultados):>3}/{len(verdade):<3} {acc:>8.3f}")
+            print(f"{res:>10} {'por_quadro':<11} {n / dt_quadro:>9.1f} {dt_quadro * 1000 / n:>9.2f}")
+            ms = {k: round(v * 1000 / n, 2) for k, v in tempos.items()}
+            print(f"{'':>10} ms por quadro: leitura do vídeo {leitura_s * 1000:.2f}, {ms}")
+            linhas.append({"res": res, "quadros": n, "video_qps": n / dt, "por_quadro_qps": n / dt_quadro,
+                           "leitura_video_ms": leitura_s * 1000, "estagios_ms": ms,
+                           "folhas": len(verdade), "resultados": len(resultados), "acuracia": acc})
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(linhas, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+"""
+Conferência das notas: corrige provas sintéticas (src/synth.py) com
+respostas conhecidas e confere, questão a questão, se o acerto corrigido é o
+da verdade do gerador (a resposta marcada é a do gabarito), por padrão de
+preenchimento (cheio, parcial, x, fraco). Marcas fracas lidas como branco e
+acertos falsos aparecem aqui; uma marca errada lida como branco, não (vale
+zero do mesmo jeito). Questões com duas marcas em que uma é bem mais forte
+(diff_min) são lidas como essa marca, por regra: são contadas à parte e
+não reprovam a conferência.
+
+    python benchmarks/check_accuracy.py [--n 12] [--seeds 0,1] [--esparso]
+
+Sai com código 1 se a nota de alguma prova não é a da verdade (ou se o
+gabarito é lido errado): mudanças na binarização ou na extração que alterem
+notas aparecem aqui, em vez de passarem como "mesmas notas".
+"""
+import os
+import sys
+import argparse
+import tempfile
+from collections import defaultdict
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from src.synth import gerar_gabarito, gerar_lote, encode_jpeg
+from src.engine import decode_image, preparar_gabarito, make_context, grade_batch, DECODE_MIN_LADO
+
+
+def conferir(seed, n, questoes, esparso, pdf_dir):
+    """
+    Corrige um lote sintético. Retorna (erros do gabarito, linhas por prova),
+    com linha = (nome, padrão, acertos corrigidos, acertos da verdade, questões
+    com acerto diferente da verdade, múltiplas resolvidas pela diff_min).
+    """
+    gab = gerar_gabarito(seed, questoes)
+    img_key = decode_image(encode_jpeg(gab["img"]), cinza=True, min_lado=DECODE_MIN_LADO)
+    layout, ans_key, _ = preparar_gabarito(img_key)
+    erros_gab = sum(ans_key.get(q) != a for q, a in gab["respostas"].items())
+
+    provas = list(gerar_lote(n, gab, seed=seed))
+    ctx = make_context(layout, ans_key, pdf_dir, esparso=esparso, pdf=False, triagem=False)
+    itens = [(p["nome"], encode_jpeg(p["img"])) for p in provas]
+    linhas = []
+    for p, r in zip(provas, grade_batch(itens, ctx, workers=1)):
+        verdade = {q for q, v in p["respostas"].items() if v == gab["respostas"][q]}
+        per_q = r["stats"]["per_q"] if r["ok"] else {}
+        corrigidas = {q for q, d in per_q.items() if d["result"] == "ok"}
+        diferentes = verdade ^ corrigidas
+        resolvidas = diferentes & set(p["multiplas"])
+        linhas.append((p["nome"], p["params"]["padrao"], len(corrigidas), len(verdade),
+                       len(diferentes - resolvidas) if r["ok"] else len(p["respostas"]), len(resolvidas)))
+    return erros_gab, linhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confere as notas de provas sintéticas contra a verdade")
+    parser.add_argument("--n", type=int, default=12, help="Provas por seed")
+    parser.add_argument("--seeds", default="0,1,2", help="Seeds (lista)")
+    parser.add_argument("--questoes", type=int, default=40)
+    parser.add_argument("--esparso", action="store_true", help="Corrige também no modo esparso")
+    args = parser.parse_args()
+
+    modos = [False, True] if args.esparso else [False]
+    falhas = resolvidas_total = 0
+    por_padrao = defaultdict(lambda: [0, 0])
+    with tempfile.TemporaryDirectory() as tmp:
+        for seed in (int(s) for s in args.seeds.split(",")):
+            for esparso in modos:
+                modo = "esparso" if esparso else "denso"
+                erros_gab, linhas = conferir(seed, args.n, args.questoes, esparso, tmp)
+                if erros_gab:
+                    falhas += 1
+                    print(f"[ERRO] seed {seed} ({modo}): {erros_gab} questões do gabarito lidas errado")
+                for nome, padrao, acertos, esperados, diferentes, resolvidas in linhas:
+                    por_padrao[padrao][0] += 1
+                    resolvidas_total += resolvidas
+                    if diferentes:
+                        por_padrao[padrao][1] += 1
+                        falhas += 1
+                        print(f"[ERRO] seed {seed} ({modo}) {nome} [{padrao}]: {acertos} acertos, "
+                              f"verdade {esperados} ({diferentes} questões diferentes)")
+
+    for padrao, (provas, erradas) in sorted(por_padrao.items()):
+        print(f"{padrao:<8} {provas - erradas}/{provas} provas com a nota certa")
+    if resolvidas_total:
+        print(f"{resolvidas_total} questões com duas marcas lidas como a mais forte (regra diff_min)")
+    if falhas:
+        print(f"[ERRO] {falhas} provas com nota diferente da verdade")
+        sys.exit(1)
+    print("[OK] Todas as notas batem com a verdade")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+"""
+Conferência de lotes simultâneos no mesmo processo: corrige dois lotes
+sintéticos com gabaritos diferentes, um de cada vez e depois ao mesmo tempo
+em duas threads com workers=1 (como dois jobs da API ou o worker com
+--concorrencia), e confere que as notas de cada lote são as mesmas.
+
+    python benchmarks/check_concorrencia.py [--n 6] [--questoes 40] [--esparso]
+
+Sai com código 1 se algum lote simultâneo foi corrigido com o contexto
+(layout, gabarito) do outro.
+"""
+import os
+import sys
+import argparse
+import tempfile
+import threading
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from src.synth import gerar_gabarito, gerar_lote, encode_jpeg
+from src.engine import decode_image, preparar_gabarito, make_context, grade_batch, DECODE_MIN_LADO
+
+
+def preparar(seed, n, questoes, esparso, pdf_dir):
+    """
+    (ctx, itens) de um lote sintético com o gabarito da seed.
+    """
+    gab = gerar_gabarito(seed, questoes)
+    img_key = decode_image(encode_jpeg(gab["img"]), cinza=True, min_lado=DECODE_MIN_LADO)
+    layout, ans_key, _ = preparar_gabarito(img_key)
+    ctx = make_context(layout, ans_key, pdf_dir, esparso=esparso, pdf=False, triagem=False)
+    itens = [(p["nome"], encode_jpeg(p["img"])) for p in gerar_lote(n, gab, seed=seed)]
+    return ctx, itens
+
+
+def notas(ctx, itens):
+    return [(r["aluno"], r["stats"]["score"] if r["ok"] else None)
+            for r in grade_batch(itens, ctx, workers=1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confere lotes corrigidos ao mesmo tempo no mesmo processo")
+    parser.add_argument("--n", type=int, default=6, help="Provas por lote")
+    parser.add_argument("--questoes", type=int, default=40)
+    parser.add_argument("--esparso", action="store_true", help="Corrige no modo esparso")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        lotes = [preparar(seed, args.n, args.questoes, args.esparso, tmp) for seed in (0, 1)]
+        diferentes = sum(a != b for a, b in zip(lotes[0][0]["ans_key"].values(), lotes[1][0]["ans_key"].values()))
+        print(f"Gabaritos diferem em {diferentes}/{args.questoes} questões")
+        sozinhos = [notas(ctx, itens) for ctx, itens in lotes]
+
+        juntos = [None, None]
+        barreira = threading.Barrier(2)
+
+        def corrigir(i):
+            barreira.wait()
+            juntos[i] = notas(*lotes[i])
+
+        threads = [threading.Thread(target=corrigir, args=(i,)) for i in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    falhas = 0
+    for i, (esperadas, obtidas) in enumerate(zip(sozinhos, juntos)):
+        for (nome, nota), (_, obtida) in zip(esperadas, obtidas):
+            if nota != obtida:
+                falhas += 1
+                print(f"[ERRO] lote {i} {nome}: nota {obtida} em paralelo, {nota} sozinho")
+    if falhas:
+        print(f"[ERRO] {falhas} provas com nota diferente quando os lotes rodam juntos")
+        sys.exit(1)
+    print(f"[OK] {sum(len(s) for s in sozinhos)} provas com a mesma nota sozinhas e em paralelo")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,20 +12,62 @@ if BASE_DIR not in sys.path:
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
-import cv2
 import argparse
 import json
-import csv
 from datetime import datetime
 
-from corrij_mvp.src.align.align import align_image
-from corrij_mvp.src.layout import learn_layout_from_key
-from corrij_mvp.src.extract import choose_option, compare_answers
-from corrij_mvp.src import export_pdf
+from corrij_mvp.src.engine import (
+    decode_image, preparar_gabarito, make_context, grade_batch, export_reports,
+    DECODE_MIN_LADO
+)
+from corrij_mvp.src.layout_cache import get_default_cache
+from corrij_mvp.src.ratio_store import get_default_store, content_hash
+from corrij_mvp.src.metrics import nova_execucao
+from corrij_mvp.src.scoring import analisar_matriz, salvar_itens_csv
+from corrij_mvp.src.result_store import ResultStore, assinatura, duplicata_de, motivo_triagem
+from corrij_mvp.src.export_pdf import export_class_pdf
+from corrij_mvp.src.versions import RegistroVersoes
+
+
+def _carregar_gabarito(gabarito_path, store, recorrigir, metricas, metodo, debug_dir, usar_cache,
+                       threshold, diff_min):
+    """
+    Layout e respostas de um gabarito: do store na recorreção (sem abrir a
+    imagem) ou alinhando a imagem, com o cache de layouts.
+    Retorna (layout, ans_key).
+    """
+    h_gab = content_hash(gabarito_path) if store is not None else None
+    salvo = store.get_gabarito(h_gab) if recorrigir else None
+    # gabaritos guardados antes do marcador de versão são lidos de novo
+    if salvo is not None and "marcador_versao" in salvo[0]:
+        metricas.registrar_gabarito({}, cache_hit=True)
+        return salvo
+
+    img_key = decode_image(gabarito_path, cinza=True, min_lado=DECODE_MIN_LADO)
+    if img_key is None:
+        raise FileNotFoundError(f"Gabarito não encontrado: {gabarito_path}")
+    tempos_gab = {}
+    cache = get_default_cache() if usar_cache else None
+    layout, ans_key, warped_key = preparar_gabarito(img_key, metodo=metodo, debug_dir=debug_dir,
+                                                    cache=cache, tempos=tempos_gab,
+                                                    threshold=threshold, diff_min=diff_min)
+    metricas.registrar_gabarito(tempos_gab, cache_hit=cache is not None and warped_key is None)
+    if store is not None:
+        store.put_gabarito(h_gab, layout, ans_key)
+    return layout, ans_key
+
 
 def processar_provas(gabarito_path, alunos_dir, out_dir,
                      materia="", turma="", escola="", data="",
-                     metodo="auto_fallback"):
+                     metodo="auto_fallback", workers=None, usar_cache=True, esparso=False,
+                     pdf_turma=False, recorrigir=False, chave=None, threshold=0.25, diff_min=0.08,
+                     dedupe=True, triagem=True):
+    """
+    Corrige a pasta de provas. gabarito_path é a imagem do gabarito ou, numa
+    prova com várias versões, {versão: imagem}; cada prova é corrigida com o
+    gabarito da versão identificada (src/versions.py) e chave, se houver, é
+    {versão: {qid: resposta}}.
+    """
 
     os.makedirs(out_dir, exist_ok=True)
     debug_dir = os.path.join(out_dir, "debug")
@@ -34,85 +76,133 @@ def processar_provas(gabarito_path, alunos_dir, out_dir,
     # -----------------------
     # Processar gabarito
     # -----------------------
-    img_key = cv2.imread(gabarito_path)
-    if img_key is None:
-        raise FileNotFoundError(f"Gabarito não encontrado: {gabarito_path}")
+    gabaritos = gabarito_path if isinstance(gabarito_path, dict) else {None: gabarito_path}
+    for path in gabaritos.values():
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Gabarito não encontrado: {path}")
+    varias = len(gabaritos) > 1
 
-    warped_key, metodo_key, ok_key = align_image(img_key, metodo=metodo, debug_dir=debug_dir)
-    if not ok_key:
-        raise RuntimeError("Falha no alinhamento do gabarito")
+    metricas = nova_execucao()
+    store = get_default_store() if usar_cache else None
+    if recorrigir and store is None:
+        print("[WARN] --recorrigir precisa do cache; corrigindo todas as provas do zero")
+        recorrigir = False
 
-    layout, thr = learn_layout_from_key(warped_key)
-    ans_key, _ = choose_option(warped_key, layout, thr)
+    # na recorreção o gabarito também vem do store, sem abrir a imagem
+    versoes = RegistroVersoes()
+    for nome, path in gabaritos.items():
+        layout, ans_key = _carregar_gabarito(path, store, recorrigir, metricas, metodo, debug_dir,
+                                             usar_cache, threshold, diff_min)
+        # correções manuais do gabarito ({qid: resposta}) valem sobre as lidas da imagem
+        correcoes = (chave or {}).get(nome, {}) if varias else chave
+        if correcoes:
+            ans_key = dict(ans_key)
+            ans_key.update(correcoes)
+        versoes.adicionar(nome, layout, ans_key)
+    if varias:
+        versoes.validar()
 
     # -----------------------
-    # Processar provas dos alunos
+    # Processar provas dos alunos (retomando de onde parou, se for o caso)
     # -----------------------
-    resultados = []
-    for fname in os.listdir(alunos_dir):
-        if not fname.lower().endswith((".jpg", ".png", ".jpeg", ".tif", ".bmp")):
-            continue
+    ctx = make_context(layout, ans_key, out_dir, metodo=metodo, debug_dir=debug_dir,
+                       meta={"materia": materia, "turma": turma, "escola": escola, "data": data},
+                       esparso=esparso, pdf=False, threshold=threshold, diff_min=diff_min,
+                       triagem=triagem, versoes=versoes)
+    layout = ctx["layout"]
+    # numa prova com várias versões a matriz de respostas tem a união das questões
+    chaves = {v.nome: v.ans_key for v in versoes} if varias else None
+    qids = sorted({q for v in versoes for q in v.ans_key}) if varias else list(ctx["ans_key"])
 
-        aluno_nome = os.path.splitext(fname)[0]
-        img_path = os.path.join(alunos_dir, fname)
-        img = cv2.imread(img_path)
-        if img is None:
-            print(f"[ERRO] Falha ao abrir {img_path}")
-            continue
+    # PDFs gerados bloco a bloco, antes de o bloco ser confirmado no manifesto
+    def ao_gravar(bloco):
+        corrigidos = [r for r in bloco if r["ok"]]
+        export_reports(corrigidos, out_dir, workers=workers)
+        metricas.registrar_pdfs(corrigidos)
+
+    chave_exec = assinatura(ctx["layout_id"], ctx["ans_key"], metodo=metodo, esparso=esparso,
+                            threshold=threshold, diff_min=diff_min, meta=ctx["meta"], triagem=triagem,
+                            versoes={v.nome: [v.layout_id, v.ans_key] for v in versoes} if varias else None)
+    resultados = ResultStore(os.path.join(out_dir, "blocos"), qids, layout["options"],
+                             chave=chave_exec, ao_gravar=ao_gravar)
+    if len(resultados):
+        print(f"[OK] Retomando execução interrompida: {len(resultados)} provas já corrigidas")
 
-        warped, metodo_usado, ok = align_image(img, metodo=metodo, debug_dir=debug_dir)
-        if not ok:
-            print(f"[ERRO] Não foi possível alinhar a prova de {aluno_nome}")
+    # retomada pelo nome do arquivo (ana.jpg e ana.png são duas provas)
+    entradas, itens = [], []
+    for fname in sorted(os.listdir(alunos_dir)):
+        if not fname.lower().endswith((".jpg", ".png", ".jpeg", ".tif", ".bmp")):
             continue
+        if fname not in resultados.feitos:
+            entradas.append(fname)
+            itens.append((os.path.splitext(fname)[0], os.path.join(alunos_dir, fname)))
+
+    # provas já vistas (o mesmo arquivo ou uma cópia dele) são refeitas pelas proporções guardadas
+    lote = grade_batch(itens, ctx, workers=workers, store=store, dedupe=dedupe or recorrigir)
 
-        ans_stu, metrics = choose_option(warped, layout)
-        stats = compare_answers(ans_stu, ans_key)
-
-        meta = {
-            "aluno": aluno_nome,
-            "materia": materia,
-            "turma": turma,
-            "escola": escola,
-            "data": data,
-            "score": stats["score"],
-            "correct": stats["correct"],
-            "total": len(ans_key),
-            "percentual": stats["score"]
-        }
-
-        # salvar PDF individual
-        pdf_path = os.path.join(out_dir, f"{aluno_nome}.pdf")
-        export_pdf.export_pdf(pdf_path, meta, stats["per_q"])
-
-        # adicionar ao resumo
-        resultados.append({
-            "aluno": aluno_nome,
-            "nota": stats["score"],
-            "acertos": stats["correct"],
-            "erros": stats["wrong"],
-            "brancos": stats["blank"],
-            "multiplas": stats["multi"]
-        })
+    for entrada, r in zip(entradas, lote):
+        metricas.registrar_resultado(r)
+        if motivo_triagem(r):
+            print(f"[REVISAR] {r['aluno']}: {r['triagem']['descricao']}")
+        elif not r["ok"]:
+            print(f"[ERRO] {r['aluno']}: {r['erro']}")
+        elif duplicata_de(r):
+            print(f"[WARN] {r['aluno']}: mesma foto da prova de {duplicata_de(r)} (possível envio em dobro)")
+        resultados.adicionar(r, entrada)
+    resultados.fechar()
 
     # -----------------------
-    # Salvar CSV e JSON
+    # PDF da turma, CSV, JSON e análise de itens (a partir dos blocos gravados)
     # -----------------------
-    csv_path = os.path.join(out_dir, "resultados.csv")
-    with open(csv_path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["aluno","nota","acertos","erros","brancos","multiplas"])
-        writer.writeheader()
-        for r in resultados:
-            writer.writerow(r)
+    if pdf_turma:
+        export_class_pdf(os.path.join(out_dir, "turma.pdf"), resultados.relatorios(ctx["ans_key"], ctx["meta"],
+                                                                                   chaves=chaves))
 
-    json_path = os.path.join(out_dir, "resultados.json")
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(resultados, f, ensure_ascii=False, indent=2)
+    campos = ["aluno", "nota", "acertos", "erros", "brancos", "multiplas", "duplicata_de"]
+    if varias:
+        campos.insert(1, "versao")
+    resultados.exportar_csv(os.path.join(out_dir, "resultados.csv"), campos)
+    resultados.exportar_json(os.path.join(out_dir, "resultados.json"), campos)
+    # provas reprovadas na triagem ou com erro, para conferir à mão
+    resultados.exportar_revisao(os.path.join(out_dir, "revisao.csv"))
+
+    # análise de itens da turma (acerto, discriminação, distratores por questão),
+    # por versão quando há várias (as questões de uma versão não são as da outra)
+    if varias:
+        for v in versoes:
+            _, R = resultados.matriz(versao=v.nome, qids=list(v.ans_key))
+            salvar_itens_csv(os.path.join(out_dir, f"itens_{v.nome}.csv"),
+                             analisar_matriz(R, v.ans_key, v.layout["options"]))
+    else:
+        _, R = resultados.matriz()
+        salvar_itens_csv(os.path.join(out_dir, "itens.csv"), analisar_matriz(R, ctx["ans_key"], layout["options"]))
+
+    metricas.finalizar().salvar(os.path.join(out_dir, "metricas.json"))
 
     print(f"[OK] Processamento concluído! Resultados salvos em {out_dir}")
 
+def _ler_gabaritos(parser, valores):
+    """
+    Um --gabarito só com o caminho: prova de uma versão (retorna o caminho).
+    Vários, como VERSAO=caminho: {versão: caminho}, na ordem dada.
+    """
+    if len(valores) == 1 and "=" not in valores[0]:
+        return valores[0]
+    gabaritos = {}
+    for valor in valores:
+        nome, sep, path = valor.partition("=")
+        if not sep or not nome or not path:
+            parser.error(f"--gabarito repetido precisa ser VERSAO=imagem: {valor}")
+        if nome in gabaritos:
+            parser.error(f"Versão repetida em --gabarito: {nome}")
+        gabaritos[nome] = path
+    return gabaritos
+
 def main():
     parser = argparse.ArgumentParser(description="CorriJá - Correção de Provas")
-    parser.add_argument("--gabarito", required=True, help="Imagem do gabarito")
+    parser.add_argument("--gabarito", required=True, action="append",
+                        help="Imagem do gabarito; numa prova com várias versões, repetido como "
+                             "VERSAO=imagem (ex.: --gabarito A=gab_a.jpg --gabarito B=gab_b.jpg)")
     parser.add_argument("--alunos", required=True, help="Pasta com imagens das provas dos alunos")
     parser.add_argument("--out", required=True, help="Diretório de saída")
     parser.add_argument("--materia", default="")
@@ -121,12 +211,47 @@ def main():
     parser.add_argument("--data", default=datetime.today().strftime("%d/%m/%Y"))
     parser.add_argument("--metodo", default="auto_fallback", choices=["auto","aruco","auto_fallback"],
                         help="Método de alinhamento (default: auto_fallback)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Processos em paralelo (default: 0 = todos os núcleos)")
+    parser.add_argument("--sem-cache", action="store_true",
+                        help="Não usa o cache de layouts do gabarito")
+    parser.add_argument("--esparso", action="store_true",
+                        help="Lê só as regiões das bolhas pela homografia, sem retificar a folha inteira")
+    parser.add_argument("--pdf-turma", action="store_true",
+                        help="Gera também um PDF único da turma (turma.pdf), com índice")
+    parser.add_argument("--recorrigir", action="store_true",
+                        help="Reaproveita a extração já guardada de cada prova e o gabarito (sem abrir as imagens)")
+    parser.add_argument("--sem-dedupe", action="store_true",
+                        help="Corrige do zero também as provas que já estão no cache (mesma foto)")
+    parser.add_argument("--sem-triagem", action="store_true",
+                        help="Não reprova fotos escuras, desfocadas, cortadas ou sem folha antes de alinhar")
+    parser.add_argument("--chave", default=None,
+                        help='JSON com correções do gabarito, ex.: {"7": "C", "12": ["A", "B"]}; '
+                             'com várias versões, por versão: {"A": {"7": "C"}}')
+    parser.add_argument("--limiar", type=float, default=0.25,
+                        help="Preenchimento mínimo para considerar a bolha marcada (default: 0.25)")
+    parser.add_argument("--diff-min", type=float, default=0.08,
+                        help="Diferença mínima entre a 1ª e a 2ª bolha mais preenchidas (default: 0.08)")
     args = parser.parse_args()
 
-    processar_provas(args.gabarito, args.alunos, args.out,
+    gabarito = _ler_gabaritos(parser, args.gabarito)
+    chave = None
+    if args.chave:
+        with open(args.chave, "r", encoding="utf-8") as f:
+            chave = json.load(f)
+        if isinstance(gabarito, dict):
+            chave = {str(v): {int(k): r for k, r in c.items()} for v, c in chave.items()}
+        else:
+            chave = {int(k): v for k, v in chave.items()}
+
+    processar_provas(gabarito, args.alunos, args.out,
                      materia=args.materia, turma=args.turma,
                      escola=args.escola, data=args.data,
-                     metodo=args.metodo)
+                     metodo=args.metodo, workers=args.workers,
+                     usar_cache=not args.sem_cache, esparso=args.esparso,
+                     pdf_turma=args.pdf_turma, recorrigir=args.recorrigir, chave=chave,
+                     threshold=args.limiar, diff_min=args.diff_min, dedupe=not args.sem_dedupe,
+                     triagem=not args.sem_triagem)
 
-if __name__ == "_main_":
+if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,58 +1,157 @@
 #!/usr/bin/env python3
 # -- coding: utf-8 --
+import time
+from functools import lru_cache
+
 import cv2
 import numpy as np
 
+# Lado máximo da imagem usada na detecção (marcadores/contorno da folha).
+# Fotos maiores são reduzidas para detectar e os cantos são refinados na
+# resolução original; None desliga a redução.
+DETECT_MAX_DIM = 1600
+
+
 # -------------------------
-# Alinhamento via ArUco
+# Utilitários multi-escala
 # -------------------------
-def align_aruco(img_bgr, dict_name="DICT_4X4_50", ref_w=1000, ref_h=1400):
+@lru_cache(maxsize=None)
+def _get_aruco_detector(dict_name="DICT_4X4_50"):
     """
-    Alinha a folha usando marcadores ArUco (4 cantos).
+    Detector ArUco reutilizado entre chamadas (um por dicionário).
     """
-    # Define dicionário de ArUco
     aruco_dict = cv2.aruco.getPredefinedDictionary(getattr(cv2.aruco, dict_name))
     aruco_params = cv2.aruco.DetectorParameters()
+    return cv2.aruco.ArucoDetector(aruco_dict, aruco_params)
 
-    detector = cv2.aruco.ArucoDetector(aruco_dict, aruco_params)
-    corners, ids, _ = detector.detectMarkers(img_bgr)
 
-    if ids is None or len(ids) < 4:
-        raise RuntimeError("Menos de 4 marcadores ArUco detectados")
+def _downscale(img, max_dim):
+    """
+    Reduz a imagem por um fator inteiro para que o maior lado fique <= max_dim.
+    Retorna (imagem, escala), com escala = tamanho reduzido / original.
+    """
+    h, w = img.shape[:2]
+    if not max_dim or max(h, w) <= max_dim:
+        return img, 1.0
+    k = int(np.ceil(max(h, w) / float(max_dim)))
+    small = cv2.resize(img, None, fx=1.0 / k, fy=1.0 / k, interpolation=cv2.INTER_LINEAR)
+    return small, 1.0 / k
 
-    # Ordena os cantos
-    ids = ids.flatten()
-    ref_pts = []
-    for marker_id in [0, 1, 2, 3]:
-        idx = np.where(ids == marker_id)[0][0]
-        ref_pts.append(corners[idx][0][0])  # canto superior esquerdo de cada marcador
 
-    ref_pts = np.array(ref_pts, dtype="float32")
+def _upscale_pts(pts, scale):
+    """
+    Converte pontos da imagem reduzida para a original (centros de pixel alinhados).
+    """
+    pts = np.asarray(pts, dtype="float32")
+    if scale >= 1.0:
+        return pts
+    return (pts + 0.5) / scale - 0.5
+
+
+def _to_gray(img):
+    return img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+def _refine_corners(img, pts, scale):
+    """
+    Refina, em subpixel e na resolução original, cantos achados numa imagem reduzida.
+    Só converte para cinza pequenas janelas ao redor de cada canto.
+    """
+    pts = np.asarray(pts, dtype="float32").reshape(-1, 2)
+    if scale >= 1.0:
+        return pts
+
+    h, w = img.shape[:2]
+    win = int(np.ceil(1.0 / scale)) + 2
+    margin = 2 * win + 2
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+    out = pts.copy()
+    for i, (x, y) in enumerate(pts):
+        x0, y0 = max(0, int(x) - margin), max(0, int(y) - margin)
+        x1, y1 = min(w, int(x) + margin + 1), min(h, int(y) + margin + 1)
+        if x1 - x0 < 2 * win + 3 or y1 - y0 < 2 * win + 3:
+            continue
+        roi = _to_gray(img[y0:y1, x0:x1])
+        c = np.array([[[x - x0, y - y0]]], dtype="float32")
+        cv2.cornerSubPix(roi, c, (win, win), (-1, -1), criteria)
+        cx, cy = c[0, 0]
+        # descarta refinamentos que fugiram da janela (canto mal definido)
+        if abs(cx + x0 - x) <= win and abs(cy + y0 - y) <= win:
+            out[i] = (cx + x0, cy + y0)
+    return out
 
+
+def ref_homography(src_pts, ref_w=1000, ref_h=1400):
+    """
+    Homografia que leva os 4 cantos (TL, TR, BR, BL) da foto para a folha de referência.
+    """
     dst_pts = np.array([
         [0, 0],
         [ref_w - 1, 0],
         [ref_w - 1, ref_h - 1],
         [0, ref_h - 1]
     ], dtype="float32")
+    return cv2.getPerspectiveTransform(np.asarray(src_pts, dtype="float32"), dst_pts)
 
-    M = cv2.getPerspectiveTransform(ref_pts, dst_pts)
-    warped = cv2.warpPerspective(img_bgr, M, (ref_w, ref_h))
+
+def _warp_to_ref(img, src_pts, ref_w, ref_h):
+    M = ref_homography(src_pts, ref_w, ref_h)
+    warped = cv2.warpPerspective(img, M, (ref_w, ref_h))
     return warped, M
 
 
+# -------------------------
+# Alinhamento via ArUco
+# -------------------------
+def find_aruco_corners(img_bgr, dict_name="DICT_4X4_50", max_dim=DETECT_MAX_DIM):
+    """
+    Cantos de referência (canto superior esquerdo dos marcadores 0..3) na
+    resolução original. Detecta numa versão reduzida (max_dim) e refina em subpixel.
+    """
+    small, scale = _downscale(img_bgr, max_dim)
+    detector = _get_aruco_detector(dict_name)
+    corners, ids, _ = detector.detectMarkers(small)
+
+    if ids is None or len(ids) < 4:
+        raise RuntimeError("Menos de 4 marcadores ArUco detectados")
+
+    # Ordena os cantos
+    ids = ids.flatten()
+    ref_pts = []
+    for marker_id in [0, 1, 2, 3]:
+        found = np.where(ids == marker_id)[0]
+        if len(found) == 0:
+            raise RuntimeError(f"Marcador ArUco {marker_id} não encontrado")
+        ref_pts.append(corners[found[0]][0][0])  # canto superior esquerdo de cada marcador
+
+    ref_pts = _upscale_pts(ref_pts, scale)
+    return _refine_corners(img_bgr, ref_pts, scale)
+
+
+def align_aruco(img_bgr, dict_name="DICT_4X4_50", ref_w=1000, ref_h=1400, max_dim=DETECT_MAX_DIM):
+    """
+    Alinha a folha usando marcadores ArUco (4 cantos).
+    Detecta numa versão reduzida (max_dim), refina os cantos na resolução
+    original e faz um único warpPerspective.
+    """
+    ref_pts = find_aruco_corners(img_bgr, dict_name=dict_name, max_dim=max_dim)
+    return _warp_to_ref(img_bgr, ref_pts, ref_w, ref_h)
+
+
 # -------------------------
 # Alinhamento via contornos
 # -------------------------
-def align_auto(img_bgr, ref_w=1000, ref_h=1400):
+def find_page_corners(img_bgr, max_dim=DETECT_MAX_DIM):
     """
-    Alinha automaticamente usando detecção de contornos.
+    Cantos da folha (TL, TR, BR, BL) na resolução original, a partir do maior
+    contorno quadrilátero achado numa versão reduzida (max_dim).
     """
-    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+    small, scale = _downscale(img_bgr, max_dim)
+    gray = _to_gray(small)
     blur = cv2.GaussianBlur(gray, (5, 5), 0)
     edged = cv2.Canny(blur, 75, 200)
 
-    cnts, _ = cv2.findContours(edged.copy(), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    cnts, _ = cv2.findContours(edged, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
     cnts = sorted(cnts, key=cv2.contourArea, reverse=True)[:5]
 
     for c in cnts:
@@ -60,21 +159,23 @@ def align_auto(img_bgr, ref_w=1000, ref_h=1400):
         approx = cv2.approxPolyDP(c, 0.02 * peri, True)
 
         if len(approx) == 4:
-            pts = approx.reshape(4, 2)
+            pts = _upscale_pts(approx.reshape(4, 2), scale)
             rect = _order_points(pts)
-            dst = np.array([
-                [0, 0],
-                [ref_w - 1, 0],
-                [ref_w - 1, ref_h - 1],
-                [0, ref_h - 1]], dtype="float32")
-
-            M = cv2.getPerspectiveTransform(rect, dst)
-            warped = cv2.warpPerspective(img_bgr, M, (ref_w, ref_h))
-            return warped, M
+            return _refine_corners(img_bgr, rect, scale)
 
     raise RuntimeError("Não foi possível detectar contornos para alinhamento")
 
 
+def align_auto(img_bgr, ref_w=1000, ref_h=1400, max_dim=DETECT_MAX_DIM):
+    """
+    Alinha automaticamente usando detecção de contornos.
+    O contorno da folha é procurado numa versão reduzida (max_dim) e os
+    cantos são refinados na resolução original.
+    """
+    rect = find_page_corners(img_bgr, max_dim=max_dim)
+    return _warp_to_ref(img_bgr, rect, ref_w, ref_h)
+
+
 def _order_points(pts):
     """
     Ordena pontos no formato: top-left, top-right, bottom-right, bottom-left.
@@ -95,70 +196,219 @@ def _order_points(pts):
 # -------------------------
 # Fallback: deskew
 # -------------------------
+# Lado máximo da miniatura usada para estimar o ângulo do deskew.
+DESKEW_MAX_DIM = 1000
+
+
+def _profile_score(xs, ys, angle, n_bins):
+    """
+    Nitidez do perfil de projeção horizontal após girar os pontos por `angle`:
+    linhas de bolhas/texto alinhadas concentram os pixels em poucas faixas.
+    """
+    t = np.radians(angle)
+    proj = ys * np.cos(t) - xs * np.sin(t)
+    hist = np.bincount((proj - proj.min()).astype(np.intp), minlength=n_bins)
+    return float(np.dot(hist, hist))
+
+
+def _skew_angle(img, max_angle=20.0, max_pts=60000):
+    """
+    Estima a inclinação (graus) numa miniatura de até DESKEW_MAX_DIM pixels,
+    pelo perfil de projeção dos traços escuros (busca grossa e depois fina).
+    A memória usada depende só da miniatura e de max_pts.
+    """
+    small, _ = _downscale(img, DESKEW_MAX_DIM)
+    gray = _to_gray(small)
+    # limiar local: pega traços (bolhas, texto, borda da folha) e ignora
+    # regiões escuras uniformes, como a mesa em volta da folha
+    bw = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                               cv2.THRESH_BINARY_INV, 15, 15)
+    pts = cv2.findNonZero(bw)
+    if pts is None or len(pts) < 10:
+        raise RuntimeError("Imagem sem conteúdo para estimar a inclinação")
+
+    pts = pts.reshape(-1, 2)
+    if len(pts) > max_pts:
+        pts = pts[::int(np.ceil(len(pts) / max_pts))]
+    xs = pts[:, 0].astype(np.float32)
+    ys = pts[:, 1].astype(np.float32)
+    n_bins = int(np.hypot(*gray.shape[:2])) + 2
+
+    best = 0.0
+    for passo, raio in ((0.5, max_angle), (0.05, 0.5)):
+        candidatos = best + np.arange(-raio, raio + passo / 2, passo)
+        scores = [_profile_score(xs, ys, a, n_bins) for a in candidatos]
+        best = float(candidatos[int(np.argmax(scores))])
+    return best
+
+
 def deskew(img_bgr):
     """
     Corrige inclinação básica da imagem (deskew).
+    O ângulo é estimado numa miniatura; só a rotação final usa a imagem inteira.
     """
-    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
-    gray = cv2.bitwise_not(gray)
-    coords = np.column_stack(np.where(gray > 0))
-    angle = cv2.minAreaRect(coords)[-1]
-
-    if angle < -45:
-        angle = -(90 + angle)
-    else:
-        angle = -angle
+    angle = _skew_angle(img_bgr)
 
     (h, w) = img_bgr.shape[:2]
     M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
     rotated = cv2.warpAffine(img_bgr, M, (w, h),
-                             flags=cv2.INTER_CUBIC,
+                             flags=cv2.INTER_LINEAR,
                              borderMode=cv2.BORDER_REPLICATE)
     return rotated, M
 
 
+# -------------------------
+# Memória de métodos por lote
+# -------------------------
+class AlignTracker:
+    """
+    Guarda, para um lote (ou layout), quantas vezes cada método de alinhamento
+    foi tentado, deu certo ou falhou, e quanto tempo levou. No modo
+    auto_fallback, align_image usa isso para não pagar, em toda folha, por um
+    método que vem falhando no lote.
+
+    A ordem canônica (método do gabarito, depois ArUco -> Auto) define qual
+    referencial a folha recebe, então ela só é alterada quando um método falha
+    `max_falhas` vezes seguidas: aí ele vai para o fim da fila. A cada
+    `sondar_cada` folhas a ordem canônica é tentada de novo, para que um lote
+    heterogêneo volte ao método certo. O deskew fica sempre por último.
+    - preferido: método usado no gabarito (o referencial do layout)
+    """
+    PRECISOS = ("aruco", "auto")
+
+    def __init__(self, preferido=None, max_falhas=3, sondar_cada=10):
+        self.preferido = preferido
+        self.max_falhas = max_falhas
+        self.sondar_cada = sondar_cada
+        self.chamadas = 0
+        self.stats = {m: self._novo() for m in self.PRECISOS + ("deskew",)}
+        self.ultimas = []  # tentativas da última chamada: (metodo, ok, segundos)
+
+    @staticmethod
+    def _novo():
+        return {"tentativas": 0, "sucessos": 0, "falhas": 0, "falhas_seguidas": 0, "tempo": 0.0}
+
+    def registrar(self, metodo, ok, segundos):
+        st = self.stats.setdefault(metodo, self._novo())
+        st["tentativas"] += 1
+        st["tempo"] += segundos
+        if ok:
+            st["sucessos"] += 1
+            st["falhas_seguidas"] = 0
+        else:
+            st["falhas"] += 1
+            st["falhas_seguidas"] += 1
+        self.ultimas.append((metodo, ok, segundos))
+
+    def ordem(self):
+        """
+        Ordem de tentativa para a próxima folha.
+        """
+        self.chamadas += 1
+        canonica = list(self.PRECISOS)
+        if self.preferido in canonica:
+            canonica.remove(self.preferido)
+            canonica.insert(0, self.preferido)
+
+        if self.sondar_cada and self.chamadas % self.sondar_cada == 0:
+            return canonica + ["deskew"]
+
+        ativos = [m for m in canonica if self.stats[m]["falhas_seguidas"] < self.max_falhas]
+        rebaixados = [m for m in canonica if m not in ativos]
+        return ativos + rebaixados + ["deskew"]
+
+    def resumo(self):
+        return {m: dict(st, tempo=round(st["tempo"], 4)) for m, st in self.stats.items()}
+
+
 # -------------------------
 # Wrapper principal
 # -------------------------
-def align_image(img_bgr, metodo="auto_fallback", debug_dir=None):
+_ALIGNERS = {
+    "aruco": lambda img, max_dim: align_aruco(img, max_dim=max_dim)[0],
+    "auto": lambda img, max_dim: align_auto(img, max_dim=max_dim)[0],
+    "deskew": lambda img, max_dim: deskew(img)[0],
+}
+_HOMOGRAFIAS = {
+    "aruco": lambda img, max_dim: ref_homography(find_aruco_corners(img, max_dim=max_dim)),
+    "auto": lambda img, max_dim: ref_homography(find_page_corners(img, max_dim=max_dim)),
+}
+_NOMES = {"aruco": "ArUco", "auto": "Auto", "deskew": "Deskew"}
+
+
+def _tentar(fn, metodo, img_bgr, max_dim, tracker, avisar=True):
+    t0 = time.perf_counter()
+    try:
+        out = fn(img_bgr, max_dim)
+    except Exception as e:
+        if tracker is not None:
+            tracker.registrar(metodo, False, time.perf_counter() - t0)
+        if avisar:
+            print(f"[WARN] {_NOMES[metodo]} falhou: {e}")
+        else:
+            raise
+        return None
+    if tracker is not None:
+        tracker.registrar(metodo, True, time.perf_counter() - t0)
+    return out
+
+
+def _executar(fns, img_bgr, metodo, max_dim, tracker):
+    """
+    Roda o método pedido (ou a sequência do auto_fallback, restrita aos
+    métodos em fns). Retorna (saida, metodo_usado) ou (None, None).
+    """
+    if tracker is not None:
+        tracker.ultimas = []
+    if metodo in fns:
+        return _tentar(fns[metodo], metodo, img_bgr, max_dim, tracker, avisar=False), metodo
+
+    if metodo == "auto_fallback":
+        ordem = tracker.ordem() if tracker is not None else ["aruco", "auto", "deskew"]
+        for m in ordem:
+            if m not in fns:
+                continue
+            out = _tentar(fns[m], m, img_bgr, max_dim, tracker)
+            if out is not None:
+                return out, m
+    return None, None
+
+
+def align_image(img_bgr, metodo="auto_fallback", debug_dir=None, max_dim=DETECT_MAX_DIM, tracker=None):
     """
     Wrapper de alinhamento: tenta ArUco -> Auto -> Deskew -> Original.
     Sempre retorna (warped, metodo_usado, ok).
+    - max_dim: lado máximo usado na detecção (None = resolução original)
+    - tracker: AlignTracker do lote; com ele, o auto_fallback deixa de começar
+      por um método que vem falhando e as tentativas ficam registradas
     """
     try:
-        if metodo == "aruco":
-            warped, M = align_aruco(img_bgr)
-            return warped, "aruco", True
-
-        elif metodo == "auto":
-            warped, M = align_auto(img_bgr)
-            return warped, "auto", True
-
-        elif metodo == "auto_fallback":
-            # 1. Tenta ArUco
-            try:
-                warped, M = align_aruco(img_bgr)
-                return warped, "aruco", True
-            except Exception as e:
-                print(f"[WARN] ArUco falhou: {e}")
-
-            # 2. Tenta Auto
-            try:
-                warped, M = align_auto(img_bgr)
-                return warped, "auto", True
-            except Exception as e:
-                print(f"[WARN] Auto falhou: {e}")
-
-            # 3. Tenta Deskew
-            try:
-                warped, M = deskew(img_bgr)
-                return warped, "deskew", True
-            except Exception as e:
-                print(f"[WARN] Deskew falhou: {e}")
-
-            # 4. Se nada funcionar, retorna imagem original
+        warped, metodo_usado = _executar(_ALIGNERS, img_bgr, metodo, max_dim, tracker)
+        if warped is None:
+            # Se nada funcionar, retorna imagem original
             return img_bgr, "original", False
+        return warped, metodo_usado, True
 
     except Exception as e:
         print(f"[ERRO align_image] {e}")
-        return img_bgr, "error", False
\ No newline at end of file
+        return img_bgr, "error", False
+
+
+def estimate_homography(img_bgr, metodo="auto_fallback", max_dim=DETECT_MAX_DIM, tracker=None, avisar=True):
+    """
+    Como align_image, mas só calcula a homografia M (foto -> folha de
+    referência), sem warp. Só ArUco e contorno: o deskew não leva ao
+    referencial do layout. Retorna (M, metodo_usado, ok).
+    - avisar: False não imprime a falha do método pedido (ex.: quadros de
+      vídeo sem folha, em que falhar é o normal)
+    """
+    try:
+        M, metodo_usado = _executar(_HOMOGRAFIAS, img_bgr, metodo, max_dim, tracker)
+        if M is None:
+            return None, "original", False
+        return M, metodo_usado, True
+
+    except Exception as e:
+        if avisar:
+            print(f"[ERRO estimate_homography] {e}")
+        return None, "error", False
@@ -1,132 +1,403 @@
 #!/usr/bin/env python3
 # -- coding: utf-8 --
-from fastapi import FastAPI, UploadFile, Form
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi.responses import Response, JSONResponse, FileResponse, StreamingResponse, PlainTextResponse
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import List, Optional
+import os
+import re
+import json
 import shutil
-import tempfile
 import zipfile
-import cv2
-import numpy as np
 
-from src.align import align_image
-from src.layout import learn_layout_from_key, preprocess
-from src.extract import choose_option, compare_answers
-from src.export_pdf import export_pdf
+# Só módulos leves aqui: a pilha de correção (OpenCV, numpy, ReportLab) é
+# importada no aquecimento (src/warmup.py) ou no primeiro uso, para que a
+# API suba e responda /health enquanto ela carrega.
+from src.pipeline import iter_zip_images, zip_entradas
+from src.jobs import JobQueue, Worker, STATUS
+from src.metrics import nova_execucao, get_registry
+from src.warmup import get_aquecimento
 
-app = FastAPI(title="CorriJá API", description="Correção de provas via FastAPI", version="1.0")
+@asynccontextmanager
+async def lifespan(app):
+    # workers dentro da própria API (CORRIJA_MAX_JOBS=0: só enfileira, quem
+    # corrige são os processos `python -m src.worker`); só começam a pegar
+    # jobs depois do aquecimento (CORRIJA_AQUECER=0 pula o aquecimento)
+    locais = [Worker(fila, executar_job) for _ in range(int(os.environ.get("CORRIJA_MAX_JOBS", "1")))]
+
+    def iniciar_workers():
+        for w in locais:
+            w.iniciar()
+
+    aquecimento = get_aquecimento()
+    if os.environ.get("CORRIJA_AQUECER", "1") != "0":
+        aquecimento.iniciar(depois=iniciar_workers)
+    else:
+        aquecimento.status = "pronto"
+        aquecimento.pronto.set()
+        iniciar_workers()
+    yield
+    for w in locais:
+        w.parar.set()
+
+app = FastAPI(title="CorriJá API", description="Correção de provas via FastAPI", version="1.0",
+              lifespan=lifespan)
 
 def read_image(path):
-    img = cv2.imread(str(path))
+    from src.engine import decode_image, DECODE_MIN_LADO
+    img = decode_image(path, cinza=True, min_lado=DECODE_MIN_LADO)
     if img is None:
         raise FileNotFoundError(f"Não foi possível ler a imagem: {path}")
     return img
 
-def grade_pipeline(gabarito_path, alunos_zip_path, out_dir, metodo="auto_fallback"):
+def grade_pipeline(gabarito_path, alunos_zip_path, out_dir, metodo="auto_fallback", workers=None,
+                   on_result=None, esparso=False, pdf_turma=False, dedupe=True, triagem=True):
+    """
+    Corrige as provas do ZIP em fluxo. alunos_zip_path pode ser um caminho ou
+    um arquivo aberto (ex.: o upload), lido uma entrada por vez.
+    on_result(r), se dado, é chamado com o resultado de cada aluno assim que fica pronto
+    (antes do PDF: os relatórios são gerados em lote no fim).
+    dedupe: provas já corrigidas (o mesmo arquivo ou a mesma foto recomprimida)
+    são refeitas pelas proporções guardadas, sem alinhar.
+    triagem: fotos escuras, desfocadas, cortadas ou sem folha são reprovadas
+    antes do alinhamento e vão para csv/revisao.csv.
+    gabarito_path pode ser {versão: caminho} numa prova com várias versões:
+    cada prova é corrigida com o gabarito da sua versão, notas.csv ganha a
+    coluna versao e a análise de itens sai por versão (csv/itens_<versão>.csv).
+    """
+    import cv2
+    from src.engine import preparar_gabarito, make_context, grade_batch, export_reports
+    from src.layout_cache import get_default_cache
+    from src.ratio_store import get_default_store
+    from src.scoring import analisar_matriz, salvar_itens_csv
+    from src.result_store import ResultStore, assinatura, duplicata_de, motivo_triagem
+    from src.export_pdf import export_class_pdf
+    from src.versions import RegistroVersoes
+
     out_dir = Path(out_dir)
     (out_dir/"csv").mkdir(parents=True, exist_ok=True)
     (out_dir/"json").mkdir(parents=True, exist_ok=True)
     (out_dir/"pdf").mkdir(parents=True, exist_ok=True)
     (out_dir/"debug").mkdir(parents=True, exist_ok=True)
 
-    # 1) Warp gabarito
-    key_img = read_image(gabarito_path)
-    warped_key, metodo_key, ok_key = align_image(key_img, metodo=metodo, debug_dir=out_dir/"debug")
-    if not ok_key:
-        raise RuntimeError("Falha no alinhamento do gabarito")
+    metricas = nova_execucao()
 
-    cv2.imwrite(str(out_dir/"debug"/"warped_key.jpg"), warped_key)
+    # 1) Warp gabarito + 2) Layout do gabarito (de cada versão)
+    gabaritos = gabarito_path if isinstance(gabarito_path, dict) else {None: gabarito_path}
+    varias = len(gabaritos) > 1
+    versoes = RegistroVersoes()
+    for nome, path in gabaritos.items():
+        key_img = read_image(path)
+        tempos_gab = {}
+        layout, ans_key, warped_key = preparar_gabarito(key_img, metodo=metodo, debug_dir=out_dir/"debug",
+                                                        cache=get_default_cache(), tempos=tempos_gab)
+        metricas.registrar_gabarito(tempos_gab, cache_hit=warped_key is None)
+        if warped_key is not None:
+            sufixo = f"_{nome}" if varias else ""
+            cv2.imwrite(str(out_dir/"debug"/f"warped_key{sufixo}.jpg"), warped_key)
+        versoes.adicionar(nome, layout, ans_key)
+    if varias:
+        versoes.validar()
 
-    # 2) Layout do gabarito
-    layout, thr_key = learn_layout_from_key(warped_key)
-    ans_key, metrics_key = choose_option(warped_key, layout, thr_img=thr_key)
-    key_map = {int(k): v for k, v in ans_key.items()}
+    ctx = make_context(layout, ans_key, out_dir/"pdf", metodo=metodo,
+                       debug_dir=out_dir/"debug", esparso=esparso, pdf=False, triagem=triagem,
+                       versoes=versoes)
+    layout = ctx["layout"]
+    chaves = {v.nome: v.ans_key for v in versoes} if varias else None
+    qids = sorted({q for v in versoes for q in v.ans_key}) if varias else list(ctx["ans_key"])
 
-    # 3) Processar alunos.zip
-    notas = []
+    # 3) Processar alunos.zip: resultados em blocos, com os PDFs de cada bloco
+    def ao_gravar(bloco):
+        corrigidos = [r for r in bloco if r["ok"]]
+        export_reports(corrigidos, out_dir/"pdf", workers=workers)
+        metricas.registrar_pdfs(corrigidos)
+
+    resultados = ResultStore(out_dir/"blocos", qids, layout["options"],
+                             chave=assinatura(ctx["layout_id"], ctx["ans_key"], metodo=metodo, esparso=esparso,
+                                              triagem=triagem,
+                                              versoes={v.nome: [v.layout_id, v.ans_key] for v in versoes}
+                                              if varias else None),
+                             ao_gravar=ao_gravar)
     with zipfile.ZipFile(alunos_zip_path, 'r') as zf:
-        for info in zf.infolist():
-            if info.is_dir():
-                continue
-            name = info.filename
-            if not name.lower().endswith((".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")):
-                continue
-            data = zf.read(name)
-            file_bytes = np.frombuffer(data, dtype=np.uint8)
-            img = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-            if img is None:
-                print(f"[WARN] Não consegui abrir {name}")
-                continue
-            try:
-                warped, metodo_usado, ok = align_image(img, metodo=metodo, debug_dir=out_dir/"debug")
-                if not ok:
-                    print(f"[WARN] Falha no alinhamento de {name}")
-                    continue
-            except Exception as e:
-                print(f"[WARN] Falha no alinhamento de {name}: {e}")
-                continue
-
-            thr = preprocess(warped)
-            ans_student, metrics = choose_option(warped, layout, thr_img=thr)
-            comp = compare_answers(ans_student, key_map)
-            comp['total'] = len(key_map)
-
-            meta = {
-                "score": comp['score'],
-                "correct": comp['correct'],
-                "total": comp['total'],
-                "aluno": Path(name).stem,
-                "materia": "",
-                "data": "",
-                "turma": "",
-                "escola": "",
-            }
-            pdf_path = out_dir/"pdf"/f"{Path(name).stem}.pdf"
-            export_pdf(str(pdf_path), meta, comp['per_q'])
-
-            notas.append((Path(name).stem, comp['score'], comp['correct'], comp['total']))
-
-    # CSV final
-    csv_path = out_dir/"csv"/"notas.csv"
-    with open(csv_path, "w", encoding="utf-8") as f:
-        f.write("aluno,nota,acertos,total\n")
-        for (aluno, nota, acertos, total) in notas:
-            f.write(f"{aluno},{nota:.1f},{acertos},{total}\n")
+        # retomada pelo caminho no ZIP, com a lista fixada antes do lote: o
+        # produtor lê as entradas em outra thread enquanto feitos muda aqui
+        feitos = set(resultados.feitos)
+        entradas = [e for e in zip_entradas(zf) if e not in feitos]
+        itens = iter_zip_images(zf, entradas=entradas)
+        lote = grade_batch(itens, ctx, workers=workers, store=get_default_store(), dedupe=dedupe)
+        for entrada, r in zip(entradas, lote):
+            metricas.registrar_resultado(r)
+            if on_result is not None:
+                on_result(r)
+            if motivo_triagem(r):
+                print(f"[REVISAR] {r['aluno']}: {r['triagem']['descricao']}")
+            elif not r["ok"]:
+                print(f"[WARN] {r['aluno']}: {r['erro']}")
+            elif duplicata_de(r):
+                print(f"[WARN] {r['aluno']}: mesma foto da prova de {duplicata_de(r)} (possível envio em dobro)")
+            resultados.adicionar(r, entrada)
+    resultados.fechar()
+    metricas.finalizar().salvar(out_dir/"json"/"metricas.json")
+
+    # 4) PDF da turma (opcional), CSV final e análise de itens, a partir dos blocos
+    if pdf_turma:
+        export_class_pdf(str(out_dir/"pdf"/"turma.pdf"), resultados.relatorios(ctx["ans_key"], ctx["meta"],
+                                                                                 chaves=chaves))
+    campos = ["aluno", "versao", "nota", "acertos", "total"] if varias else ["aluno", "nota", "acertos", "total"]
+    csv_path = resultados.exportar_csv(out_dir/"csv"/"notas.csv", campos, formatos={"nota": "{:.1f}"})
+    resultados.exportar_revisao(out_dir/"csv"/"revisao.csv")
+    if varias:
+        for v in versoes:
+            _, R = resultados.matriz(versao=v.nome, qids=list(v.ans_key))
+            salvar_itens_csv(out_dir/"csv"/f"itens_{v.nome}.csv", analisar_matriz(R, v.ans_key, v.layout["options"]))
+    else:
+        _, R = resultados.matriz()
+        salvar_itens_csv(out_dir/"csv"/"itens.csv", analisar_matriz(R, ctx["ans_key"], layout["options"]))
 
     return csv_path, out_dir/"pdf"
 
 @app.post("/corrigir")
-async def corrigir(
-    gabarito: UploadFile,
+def corrigir(
     alunos: UploadFile,
-    metodo: str = Form("auto_fallback")
+    gabarito: Optional[UploadFile] = File(None),
+    gabaritos: Optional[List[UploadFile]] = File(None),
+    metodo: str = Form("auto_fallback"),
+    workers: int = Form(0),
+    esparso: bool = Form(False),
+    triagem: bool = Form(True)
 ):
+    """
+    Corrige e devolve o notas.csv no fim. A correção é um job da fila como
+    os de /jobs; se passar de CORRIJA_CORRIGIR_TIMEOUT segundos, responde 504
+    com o job_id para acompanhar em /jobs/{job_id}.
+    """
+    gabaritos = _gabaritos_enviados(gabarito, gabaritos)
     try:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            tmpdir = Path(tmpdir)
-            gabarito_path = tmpdir/"gabarito.jpg"
-            alunos_zip_path = tmpdir/"alunos.zip"
-            out_dir = tmpdir/"resultados"
-
-            # salvar arquivos enviados
-            with open(gabarito_path, "wb") as f:
-                shutil.copyfileobj(gabarito.file, f)
-            with open(alunos_zip_path, "wb") as f:
-                shutil.copyfileobj(alunos.file, f)
-
-            # processar
-            csv_path, pdf_dir = grade_pipeline(str(gabarito_path), str(alunos_zip_path), str(out_dir), metodo=metodo)
-
-            # retorna CSV como resposta
-            return FileResponse(path=csv_path, filename="notas.csv", media_type="text/csv")
+        job = _enfileirar(gabaritos, alunos, metodo=metodo, workers=workers, esparso=esparso, pdf_turma=False,
+                          triagem=triagem)
+        job = fila.esperar(job.id, timeout=float(os.environ.get("CORRIJA_CORRIGIR_TIMEOUT", "3600")))
+        if job.status == "erro":
+            return JSONResponse(status_code=500, content={"error": job.erro, "job_id": job.id})
+        if job.status != "concluido":
+            return JSONResponse(status_code=504, content={"error": "Correção ainda em andamento",
+                                                          **job.info()})
+        return FileResponse(job.out_dir/"csv"/"notas.csv", filename="notas.csv", media_type="text/csv")
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
-        
-        
+
+
+# -------------------------
+# Jobs assíncronos
+# -------------------------
+def _resumo(r):
+    from src.result_store import duplicata_de, motivo_triagem
+    stats = r["stats"] or {}
+    return {
+        "aluno": r["aluno"],
+        "ok": r["ok"],
+        "metodo": r["metodo"],
+        "erro": r["erro"],
+        "nota": stats.get("score"),
+        "acertos": stats.get("correct"),
+        "erros": stats.get("wrong"),
+        "brancos": stats.get("blank"),
+        "multiplas": stats.get("multi"),
+        "total": stats.get("total"),
+        "duplicata": r["duplicata"]["tipo"] if r.get("duplicata") else None,
+        "duplicata_de": duplicata_de(r) or None,
+        "triagem": motivo_triagem(r) or None,
+        "versao": r.get("versao"),
+    }
+
+def executar_job(job, publicar):
+    """
+    Corrige um job da fila (chamado pelos Workers, na API ou em src/worker.py).
+    Numa nova tentativa grade_pipeline retoma dos blocos já gravados em job.out_dir.
+    """
+    zip_path = job.dir/"alunos.zip"
+    with zipfile.ZipFile(zip_path) as zf:
+        fila.definir_total(job.id, len(zip_entradas(zf)))
+    versoes = job.params.get("versoes")
+    gabarito = {v: job.dir/"gabaritos"/f"{v}.jpg" for v in versoes} if versoes else job.dir/"gabarito.jpg"
+    grade_pipeline(gabarito, zip_path, job.out_dir,
+                   metodo=job.params["metodo"], workers=job.params["workers"],
+                   esparso=job.params["esparso"], pdf_turma=job.params["pdf_turma"],
+                   triagem=job.params.get("triagem", True),
+                   on_result=lambda r: publicar(_resumo(r)))
+
+fila = JobQueue()
+
+def _gabaritos_enviados(gabarito, gabaritos):
+    """
+    Um gabarito (prova de uma versão) ou vários, um por versão, com o nome da
+    versão no nome do arquivo (A.jpg, B.jpg, ...). Retorna {versão: upload},
+    com versão None para um gabarito só; 400 se os nomes não servem.
+    """
+    if gabaritos and len(gabaritos) > 1:
+        enviados = {}
+        for g in gabaritos:
+            nome = Path(g.filename or "").stem
+            if not re.fullmatch(r"[\w-]+", nome) or nome in enviados:
+                raise HTTPException(status_code=400,
+                                    detail=f"Nome de versão inválido ou repetido no gabarito: {g.filename}")
+            enviados[nome] = g
+        return enviados
+    unico = gabarito or (gabaritos[0] if gabaritos else None)
+    if unico is None:
+        raise HTTPException(status_code=400, detail="Envie o gabarito (ou um gabarito por versão em gabaritos)")
+    return {None: unico}
+
+def _enfileirar(gabaritos, alunos, **params):
+    versoes = [v for v in gabaritos if v is not None]
+    if versoes:
+        params["versoes"] = versoes
+    job = fila.criar(**params)
+    if versoes:
+        (job.dir/"gabaritos").mkdir(parents=True, exist_ok=True)
+    for versao, upload in gabaritos.items():
+        destino = job.dir/"gabaritos"/f"{versao}.jpg" if versao is not None else job.dir/"gabarito.jpg"
+        with open(destino, "wb") as f:
+            shutil.copyfileobj(upload.file, f)
+    with open(job.dir/"alunos.zip", "wb") as f:
+        shutil.copyfileobj(alunos.file, f)
+    return fila.enfileirar(job)
+
+def _get_job(job_id):
+    job = fila.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+def _exigir_concluido(job):
+    if job.status != "concluido":
+        raise HTTPException(status_code=409, detail=f"Job ainda não concluído ({job.status})")
+
+@app.post("/jobs", status_code=202)
+def criar_job(
+    alunos: UploadFile,
+    gabarito: Optional[UploadFile] = File(None),
+    gabaritos: Optional[List[UploadFile]] = File(None),
+    metodo: str = Form("auto_fallback"),
+    workers: int = Form(0),
+    esparso: bool = Form(False),
+    pdf_turma: bool = Form(False),
+    triagem: bool = Form(True)
+):
+    """
+    Enfileira uma correção. Numa prova com várias versões, envie em
+    gabaritos um arquivo por versão, com o nome da versão (A.jpg, B.jpg, ...).
+    """
+    job = _enfileirar(_gabaritos_enviados(gabarito, gabaritos), alunos, metodo=metodo, workers=workers, esparso=esparso, pdf_turma=pdf_turma,
+                      triagem=triagem)
+    return job.info()
+
+@app.get("/jobs/{job_id}")
+def status_job(job_id: str):
+    return _get_job(job_id).info()
+
+@app.get("/jobs/{job_id}/resultados")
+def resultados_job(job_id: str):
+    """
+    Um JSON por linha (NDJSON), enviado assim que cada aluno é corrigido.
+    """
+    _get_job(job_id)
+    linhas = (json.dumps(r, ensure_ascii=False) + "\n" for r in fila.iter_resultados(job_id))
+    return StreamingResponse(linhas, media_type="application/x-ndjson")
+
+@app.get("/jobs/{job_id}/csv")
+def csv_job(job_id: str):
+    job = _get_job(job_id)
+    _exigir_concluido(job)
+    return FileResponse(job.out_dir/"csv"/"notas.csv", filename="notas.csv", media_type="text/csv")
+
+@app.get("/jobs/{job_id}/itens")
+def itens_job(job_id: str, versao: Optional[str] = None):
+    """
+    Análise de itens: acerto, discriminação, ponto-bisserial e contagem por alternativa.
+    Numa prova com várias versões, a de uma versão (?versao=A).
+    """
+    job = _get_job(job_id)
+    _exigir_concluido(job)
+    versoes = job.params.get("versoes")
+    if versoes:
+        if versao not in versoes:
+            raise HTTPException(status_code=400, detail=f"Informe a versão (?versao=), uma de: {', '.join(versoes)}")
+        nome = f"itens_{versao}.csv"
+    else:
+        nome = "itens.csv"
+    return FileResponse(job.out_dir/"csv"/nome, filename=nome, media_type="text/csv")
+
+@app.get("/jobs/{job_id}/revisao")
+def revisao_job(job_id: str):
+    """
+    Provas que não foram corrigidas (reprovadas na triagem ou com erro), com o motivo.
+    """
+    job = _get_job(job_id)
+    _exigir_concluido(job)
+    return FileResponse(job.out_dir/"csv"/"revisao.csv", filename="revisao.csv", media_type="text/csv")
+
+@app.get("/jobs/{job_id}/pdfs")
+def pdfs_job(job_id: str):
+    job = _get_job(job_id)
+    _exigir_concluido(job)
+    zip_path = job.dir/"pdfs.zip"
+    if not zip_path.exists():
+        tmp = job.dir/"pdfs.zip.tmp"
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_STORED) as zf:
+            for pdf in sorted((job.out_dir/"pdf").glob("*.pdf")):
+                zf.write(pdf, pdf.name)
+        os.replace(tmp, zip_path)
+    return FileResponse(zip_path, filename="relatorios.zip", media_type="application/zip")
+
+@app.get("/jobs/{job_id}/metricas")
+def metricas_job(job_id: str):
+    job = _get_job(job_id)
+    _exigir_concluido(job)
+    return FileResponse(job.out_dir/"json"/"metricas.json", filename="metricas.json",
+                        media_type="application/json")
+
+
+# -------------------------
+# Observabilidade
+# -------------------------
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Métricas do processo no formato do Prometheus: tempo por estágio
+    (histograma), provas, métodos de alinhamento, falhas, brancos/múltiplas
+    e jobs por status, mais os tempos de inicialização (corrija_inicio_segundos).
+    """
+    texto = get_registry().prometheus() + get_aquecimento().prometheus()
+    por_status = fila.por_status()
+    linhas = ["# TYPE corrija_jobs gauge"]
+    for status in STATUS:
+        linhas.append(f'corrija_jobs{{status="{status}"}} {por_status.get(status, 0)}')
+    return PlainTextResponse(texto + "\n".join(linhas) + "\n",
+                             media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 def root():
     return {"status": "ok", "message": "CorriJá API rodando 🚀"}
 
 @app.get("/health")
 def health():
-    return {"alive": True}
\ No newline at end of file
+    """
+    Prontidão: 503 até o aquecimento terminar (ou se ele falhou), para o
+    balanceador só mandar provas para instâncias prontas. Para saber só se o
+    processo está vivo, use /.
+    """
+    aquecimento = get_aquecimento()
+    pronto = aquecimento.status == "pronto"
+    return JSONResponse(status_code=200 if pronto else 503,
+                        content={"alive": True, "pronto": pronto, "status": aquecimento.status,
+                                 "erro": aquecimento.erro})
+
+@app.get("/inicio")
+def inicio():
+    """
+    Relatório de inicialização: idade do processo ao começar o aquecimento,
+    tempo de cada etapa (importações, ArUco, PDF, prova sintética) e quando ficou pronto.
+    """
+    return get_aquecimento().relatorio()
\ No newline at end of file
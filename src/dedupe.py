@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+import cv2
+import numpy as np
+
+# Lado da miniatura (cinza, sem manter a proporção) guardada de cada prova
+MINI = 128
+
+# Bits de diferença no pHash (64 bits) para uma prova ser candidata a cópia.
+# Cópias da mesma foto (reenviada, redimensionada, recomprimida) ficam em 0-4;
+# fotos diferentes da mesma folha, acima de 20.
+DIST_MAX = 10
+
+# Maior diferença de pixel aceita entre as miniaturas normalizadas (média 0,
+# desvio 1). O pHash sozinho não separa duas provas que só diferem numa
+# bolha (dá 0-4 bits), a miniatura separa: uma bolha diferente (cheia,
+# parcial, fraca ou x) passa de 1.1, cópias recomprimidas ficam abaixo de 0.2.
+DIF_MAX = 0.5
+
+
+def miniatura(img, lado=MINI):
+    """
+    Miniatura uint8 (lado x lado) em tons de cinza da imagem decodificada.
+    """
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(img, (lado, lado), interpolation=cv2.INTER_AREA)
+
+
+def phash(mini):
+    """
+    Hash perceptual (64 bits, int): DCT da imagem em 32x32, 8x8 frequências
+    mais baixas comparadas com a mediana (sem o termo DC).
+    """
+    f = cv2.resize(mini.astype(np.float32), (32, 32), interpolation=cv2.INTER_AREA)
+    d = cv2.dct(f)[:8, :8].flatten()
+    bits = d > np.median(d[1:])
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def distancias(h, hashes):
+    """
+    Distância de Hamming entre h e cada hash de `hashes` (array uint64).
+    """
+    x = np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.uint64(h))
+    return np.unpackbits(x.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def mesma_imagem(a, b, dif_max=DIF_MAX):
+    """
+    True se as miniaturas vêm da mesma foto (mesmo com outra resolução,
+    compressão ou brilho): maior diferença de pixel depois de normalizar.
+    """
+    if a is None or b is None or a.shape != b.shape:
+        return False
+    a = a.astype(np.float32)
+    b = b.astype(np.float32)
+    a = (a - a.mean()) / (a.std() + 1e-6)
+    b = (b - b.mean()) / (b.std() + 1e-6)
+    return float(np.abs(a - b).max()) <= dif_max
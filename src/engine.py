@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+import io
+import os
+import time
+import multiprocessing as mp
+from collections import deque
+from functools import partial
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from src.align.align import align_image, estimate_homography, AlignTracker
+from src.layout import learn_layout_from_key
+from src.extract import choose_option, compare_answers, answers_from_ratios
+from src.export_pdf import export_pdf, render_batch, export_class_pdf
+from src.sheet import Sheet
+from src.sparse import choose_option_sparse
+from src.layout_cache import image_key
+from src.ratio_store import RatioStore, content_hash, layout_id
+from src.dedupe import miniatura, phash, mesma_imagem, DIST_MAX, DIF_MAX
+from src.triage import avaliar
+from src.versions import marcador_versao
+from src.pipeline import staged, prefetch
+from src.metrics import cronometrar
+
+# Contexto dos workers do pool (layout, gabarito, metadados). É enviado uma
+# única vez para cada processo pelo initializer, e não a cada prova. No modo
+# de um processo o contexto do lote é passado aos estágios, sem global: lotes
+# simultâneos no mesmo processo (jobs da API, threads do worker) não se misturam.
+_CTX = {}
+
+
+# -------------------------
+# Configuração
+# -------------------------
+def resolve_workers(workers=None):
+    """
+    Número de processos a usar. None ou <= 0 usa todos os núcleos.
+    """
+    if workers is None or workers <= 0:
+        return os.cpu_count() or 1
+    return int(workers)
+
+
+def _init_worker(ctx, cv_threads=1):
+    """
+    Initializer do pool: guarda o contexto e limita as threads do OpenCV
+    para que os processos não disputem os mesmos núcleos.
+    """
+    cv2.setNumThreads(cv_threads)
+    _set_context(ctx)
+
+
+def _contexto_lote(ctx):
+    """
+    Cópia do contexto para um lote, com um AlignTracker novo (e, no dedupe,
+    um RatioStore próprio).
+    """
+    lote = dict(ctx)
+    lote["tracker"] = AlignTracker(preferido=ctx["layout"].get("alinhamento"))
+    if ctx.get("dedupe"):
+        # cada processo consulta o store direto (o índice perceptual é lido aos poucos)
+        lote["store"] = RatioStore(ctx["dedupe"]["cache_dir"])
+    return lote
+
+
+def _set_context(ctx):
+    """
+    Instala o contexto do lote no processo do worker do pool.
+    """
+    _CTX.clear()
+    _CTX.update(_contexto_lote(ctx))
+
+
+# -------------------------
+# Gabarito
+# -------------------------
+# Decodificação reduzida (cinza, cor) por fator: o libjpeg já decodifica em
+# 1/2, 1/4 ou 1/8 da resolução, sem gerar a imagem inteira
+_REDUZIDA = {
+    (True, 2): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    (True, 4): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    (True, 8): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    (False, 2): cv2.IMREAD_REDUCED_COLOR_2,
+    (False, 4): cv2.IMREAD_REDUCED_COLOR_4,
+    (False, 8): cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Menor lado maior que uma foto pode ficar depois da decodificação reduzida.
+# Mantém a folha com resolução acima da referência (1000 x 1400) mesmo quando
+# ela ocupa só parte da foto: em provas sintéticas de 24 MP a redução por 2
+# (lado ~2800) não muda a acurácia; em 12 MP (lado ~2000) já piora um pouco.
+DECODE_MIN_LADO = 2400
+
+
+def image_size(dados):
+    """
+    (largura, altura) lidos só do cabeçalho do arquivo, sem decodificar.
+    Retorna None se o formato não for reconhecido.
+    """
+    try:
+        src = io.BytesIO(dados) if isinstance(dados, (bytes, bytearray, memoryview)) else str(dados)
+        with Image.open(src) as im:
+            return im.size
+    except Exception:
+        return None
+
+
+def decode_factor(size, min_lado=DECODE_MIN_LADO):
+    """
+    Maior fator (1, 2, 4 ou 8) que mantém o lado maior da imagem >= min_lado.
+    """
+    if not size or not min_lado:
+        return 1
+    for k in (8, 4, 2):
+        if max(size) / k >= min_lado:
+            return k
+    return 1
+
+
+def decode_image(dados, cinza=False, min_lado=None):
+    """
+    Decodifica uma imagem a partir de bytes ou de um caminho em disco.
+    Retorna None se não for possível abrir.
+    - cinza: decodifica direto em um canal (uint8); a correção não usa cor,
+      só os overlays de debug
+    - min_lado: se dado, fotos grandes são decodificadas já reduzidas (por 2,
+      4 ou 8), desde que o lado maior continue >= min_lado
+    """
+    k = decode_factor(image_size(dados), min_lado) if min_lado else 1
+    flag = _REDUZIDA[(bool(cinza), k)] if k > 1 else (cv2.IMREAD_GRAYSCALE if cinza else cv2.IMREAD_COLOR)
+    if isinstance(dados, (bytes, bytearray, memoryview)):
+        return cv2.imdecode(np.frombuffer(dados, np.uint8), flag)
+    return cv2.imread(str(dados), flag)
+
+
+def preparar_gabarito(img_key, metodo="auto_fallback", debug_dir=None, cache=None, tempos=None,
+                      threshold=0.25, diff_min=0.08):
+    """
+    Alinha o gabarito, aprende o layout e extrai as respostas corretas.
+    Com cache (LayoutCache), um gabarito já visto pula todo esse trabalho.
+    Retorna (layout, ans_key, warped_key); warped_key é None quando vem do cache.
+    - tempos: dict que recebe os segundos de cada etapa (ver src.metrics)
+    - threshold/diff_min: regra de marcação usada nas respostas do gabarito
+    """
+    if tempos is None:
+        tempos = {}
+    key = None
+    if cache is not None:
+        key = image_key(img_key, metodo=metodo, threshold=threshold, diff_min=diff_min)
+        hit = cache.get(key)
+        # entradas de antes do marcador de versão são aprendidas de novo
+        if hit is not None and "marcador_versao" in hit[0]:
+            layout, ans_key = hit
+            return layout, ans_key, None
+
+    with cronometrar(tempos, "gabarito_alinhamento"):
+        warped_key, metodo_key, ok_key = align_image(img_key, metodo=metodo, debug_dir=debug_dir)
+    if not ok_key:
+        raise RuntimeError("Falha no alinhamento do gabarito")
+
+    sheet_key = Sheet(warped_key)
+    with cronometrar(tempos, "layout"):
+        layout, _ = learn_layout_from_key(sheet_key)
+    layout["alinhamento"] = metodo_key  # referencial do layout, tentado primeiro nas provas
+    layout["marcador_versao"] = marcador_versao(warped=warped_key)  # provas com várias versões
+    with cronometrar(tempos, "gabarito_extracao"):
+        ans_key, _ = choose_option(sheet_key, layout, threshold=threshold, diff_min=diff_min)
+
+    if cache is not None:
+        cache.put(key, layout, ans_key)
+    return layout, ans_key, warped_key
+
+
+def make_context(layout, ans_key, pdf_dir, metodo="auto_fallback", debug_dir=None, meta=None,
+                 esparso=False, pdf=True, threshold=0.25, diff_min=0.08, cinza=True,
+                 min_lado=DECODE_MIN_LADO, triagem=True, versoes=None):
+    """
+    Monta o contexto compartilhado pelos workers.
+    - meta: campos fixos do relatório (materia, turma, escola, data)
+    - threshold/diff_min: regra de marcação do choose_option
+    - cinza/min_lado: decodificação das provas (ver decode_image); com cinza
+      todo o caminho (warp, binarização) roda em um canal
+    - pdf: gera o PDF de cada aluno durante a correção; com False a correção
+      não espera pelos PDFs, que depois são gerados em lote (export_reports)
+    - esparso: lê só as regiões das bolhas pela homografia, sem retificar a
+      folha inteira (cai no modo normal quando só o deskew funciona)
+    - triagem: antes do alinhamento, reprova fotos escuras, desfocadas,
+      cortadas ou sem folha (src/triage.py), que iriam para revisão
+    - versoes: RegistroVersoes (src/versions.py) de uma prova com várias
+      versões; cada folha é corrigida com o layout e o gabarito da versão
+      identificada depois do alinhamento. layout/ans_key podem ser None e
+      ficam os da primeira versão
+    """
+    if versoes is not None and len(versoes) > 1:
+        primeira = next(iter(versoes))
+        layout, ans_key = primeira.layout, primeira.ans_key
+    else:
+        versoes = None
+    return {
+        "layout": layout,
+        "layout_id": layout_id(layout),
+        "ans_key": {int(k): v for k, v in ans_key.items()},
+        "metodo": metodo,
+        "pdf_dir": str(pdf_dir),
+        "debug_dir": str(debug_dir) if debug_dir else None,
+        "meta": dict(meta or {}),
+        "esparso": bool(esparso),
+        "pdf": bool(pdf),
+        "threshold": threshold,
+        "diff_min": diff_min,
+        "cinza": bool(cinza),
+        "min_lado": min_lado,
+        "triagem": bool(triagem),
+        "versoes": versoes,
+    }
+
+
+# -------------------------
+# Correção de uma prova
+# -------------------------
+def _novo_resultado(nome):
+    return {"aluno": nome, "ok": False, "metodo": None, "alinhamento": [], "erro": None,
+            "stats": None, "pdf": None, "esparso": False, "relatorio": None, "tempos": {},
+            "hash": None, "ratios": None, "reaproveitado": False,
+            "phash": None, "mini": None, "duplicata": None, "triagem": None, "versao": None}
+
+
+def _layouts(ctx):
+    """
+    (layout_id, versão) de cada layout do contexto; versão é None com um só layout.
+    """
+    if not ctx.get("versoes"):
+        return [(ctx["layout_id"], None)]
+    return [(v.layout_id, v.nome) for v in ctx["versoes"]]
+
+
+def _ctx_versao(ctx, versao):
+    """
+    Contexto com o layout e o gabarito de uma versão (None: o próprio ctx).
+    """
+    if versao is None:
+        return ctx
+    v = ctx["versoes"][versao]
+    return dict(ctx, layout=v.layout, layout_id=v.layout_id, ans_key=v.ans_key)
+
+
+def _identificar_versao(result, ctx, tempos, img=None, M=None, warped=None):
+    """
+    Com várias versões, identifica a da folha alinhada (src/versions.py) e
+    devolve o contexto dela; None (com result["erro"]) se nenhuma servir.
+    """
+    if not ctx.get("versoes"):
+        return ctx
+    with cronometrar(tempos, "versao"):
+        v, _ = ctx["versoes"].identificar(img, M, warped)
+    if v is None:
+        result["erro"] = "Versão da prova não identificada"
+        return None
+    result["versao"] = v.nome
+    return _ctx_versao(ctx, v.nome)
+
+
+def _decode_item(ctx, item):
+    """
+    Estágio 1: bytes/caminho -> imagem. Os bytes são descartados aqui.
+    Passa adiante o hash do arquivo (chave do RatioStore), um dict com os
+    segundos gastos em cada estágio e o resultado da busca por cópias (dedupe).
+    """
+    nome, dados = item
+    tempos = {}
+    dup = {}
+    with cronometrar(tempos, "decode"):
+        try:
+            if not isinstance(dados, (bytes, bytearray, memoryview)):
+                dados = Path(dados).read_bytes()
+        except OSError:
+            return nome, None, None, tempos, dup
+        h = content_hash(dados)
+        if ctx.get("dedupe"):
+            for lid, versao in _layouts(ctx):
+                entry = ctx["store"].get(lid, h)
+                if entry is not None:
+                    # mesmo arquivo já corrigido com este layout: nem decodifica
+                    dup = {"entry": entry, "tipo": "exata", "distancia": 0, "versao": versao}
+                    return nome, None, h, tempos, dup
+        img = decode_image(dados, cinza=ctx.get("cinza", False), min_lado=ctx.get("min_lado"))
+    if img is not None and ctx.get("dedupe"):
+        with cronometrar(tempos, "dedupe"):
+            dup = _buscar_copia(ctx, img)
+    return nome, img, h, tempos, dup
+
+
+def _buscar_copia(ctx, img):
+    """
+    Procura no índice do layout (de cada versão) uma prova já corrigida que
+    seja a mesma foto (pHash próximo e miniatura igual). Retorna {"mini",
+    "phash"} e, se achar, também "entry", "tipo", "distancia" e "versao".
+    """
+    store, cfg = ctx["store"], ctx["dedupe"]
+    mini = miniatura(img)
+    ph = phash(mini)
+    dup = {"mini": mini, "phash": ph}
+    for lid, versao in _layouts(ctx):
+        for dist, h2 in store.parecidas(lid, ph, cfg["dist_max"]):
+            if mesma_imagem(mini, store.get_mini(lid, h2), cfg["dif_max"]):
+                entry = store.get(lid, h2)
+                if entry is not None:
+                    dup.update({"entry": entry, "tipo": "parecida", "distancia": dist, "versao": versao})
+                    return dup
+    return dup
+
+
+def _grade_decoded(ctx, item):
+    """
+    Estágio 2: triagem -> alinhamento -> versão -> extração -> comparação (ou,
+    no modo esparso, homografia -> versão -> extração só nas regiões das
+    bolhas -> comparação). A versão só é identificada com várias versões.
+    Cópias de provas já corrigidas são refeitas pelas proporções guardadas.
+    Provas reprovadas na triagem param antes do alinhamento (r["triagem"]).
+    Retorna (resultado, meta) para o estágio de exportação.
+    """
+    nome, img, h, tempos, dup = item
+    if dup.get("entry") is not None:
+        return _reaproveitar(nome, h, dup, ctx, tempos)
+    result = _novo_resultado(nome)
+    result["tempos"] = tempos
+    result["hash"] = h
+    result["phash"] = dup.get("phash")
+    result["mini"] = dup.get("mini")
+    if img is None:
+        result["erro"] = "Falha ao abrir a imagem"
+        return result, None
+
+    if ctx.get("triagem"):
+        with cronometrar(tempos, "triagem"):
+            result["triagem"] = avaliar(img, ctx["metodo"], ctx["layout"].get("alinhamento"))
+        if not result["triagem"]["ok"]:
+            result["erro"] = f"Triagem: {result['triagem']['descricao']}"
+            return result, None
+
+    tracker = ctx["tracker"]
+    metodo = ctx["metodo"]
+    alinhamento = []
+    opcoes = {"threshold": ctx["threshold"], "diff_min": ctx["diff_min"]}
+    denso = True
+    try:
+        if ctx.get("esparso"):
+            with cronometrar(tempos, "alinhamento"):
+                M, metodo_usado, ok = estimate_homography(img, metodo=metodo, tracker=tracker)
+            alinhamento = list(tracker.ultimas)
+            if ok:
+                result["esparso"] = True
+                denso = False
+            elif metodo == "auto_fallback":
+                metodo = "deskew"  # ArUco e contorno já falharam: só resta o deskew
+            else:
+                denso = False  # o método pedido falhou; na folha inteira falharia igual
+        if denso:
+            with cronometrar(tempos, "alinhamento"):
+                warped, metodo_usado, ok = align_image(img, metodo=metodo, debug_dir=ctx["debug_dir"],
+                                                       tracker=tracker)
+            alinhamento += tracker.ultimas
+    except Exception as e:
+        result["erro"] = f"Falha no alinhamento: {e}"
+        return result, None
+    result["metodo"] = metodo_usado
+    result["alinhamento"] = [{"metodo": m, "ok": a_ok, "ms": round(dt * 1000, 2)}
+                             for m, a_ok, dt in alinhamento]
+    if not ok:
+        result["erro"] = "Falha no alinhamento"
+        return result, None
+
+    if denso:
+        ctx = _identificar_versao(result, ctx, tempos, warped=warped)
+    else:
+        ctx = _identificar_versao(result, ctx, tempos, img=img, M=M)
+    if ctx is None:
+        return result, None
+    layout = ctx["layout"]
+    with cronometrar(tempos, "extracao"):
+        if denso:
+            ans_stu, metrics_stu = choose_option(Sheet(warped), layout, **opcoes)
+        else:
+            ans_stu, metrics_stu, _ = choose_option_sparse(img, M, layout, **opcoes)
+    result["ratios"] = [metrics_stu[q["qid"]]["ratios"] if q["qid"] in metrics_stu else []
+                        for q in layout["questions"]]
+    return _comparar(result, ans_stu, ctx, multiplas(metrics_stu))
+
+
+def multiplas(metrics):
+    """
+    Questões lidas com múltipla marcação, a partir das métricas de choose_option.
+    """
+    return {qid for qid, m in metrics.items() if m.get("res") == "multi"}
+
+
+def _comparar(result, ans_stu, ctx, multi_qids=()):
+    """
+    Compara com o gabarito e monta os metadados do relatório.
+    Retorna (resultado, meta).
+    """
+    with cronometrar(result["tempos"], "comparacao"):
+        stats = compare_answers(ans_stu, ctx["ans_key"], multi_qids)
+    stats["total"] = len(ctx["ans_key"])
+
+    meta = dict(ctx["meta"])
+    meta.update({
+        "aluno": result["aluno"],
+        "score": stats["score"],
+        "correct": stats["correct"],
+        "total": stats["total"],
+        "percentual": stats["score"],
+    })
+    result.update({"ok": True, "stats": stats, "relatorio": meta})
+    return result, meta
+
+
+def resultado_de_respostas(nome, ans_stu, ctx, multi_qids=(), **campos):
+    """
+    Resultado completo (o mesmo dict de grade_batch, com stats e relatório)
+    para respostas lidas fora do lote, ex.: no modo vídeo (src/video.py).
+    - multi_qids: questões lidas com múltipla marcação (ver multiplas)
+    - campos: chaves do resultado a preencher (metodo, ratios, tempos, ...)
+    """
+    result = _novo_resultado(nome)
+    result.update(campos)
+    return _comparar(result, ans_stu, ctx, multi_qids)[0]
+
+
+def _reaproveitar(nome, h, dup, ctx, tempos=None):
+    """
+    Correção de uma cópia a partir da extração guardada no RatioStore
+    (dup["entry"]): refaz respostas e comparação, sem alinhar. Marca em
+    result["duplicata"] de qual prova ela é cópia.
+    Retorna (resultado, meta).
+    """
+    entry = dup["entry"]
+    ctx = _ctx_versao(ctx, dup.get("versao"))
+    result = _novo_resultado(nome)
+    result.update({"hash": h, "ratios": entry["ratios"], "metodo": entry["metodo"],
+                   "alinhamento": entry["alinhamento"], "esparso": entry["esparso"],
+                   "reaproveitado": True, "versao": dup.get("versao"), "tempos": tempos if tempos is not None else {},
+                   "phash": entry.get("phash"),
+                   "duplicata": {"tipo": dup["tipo"], "aluno": entry.get("aluno"),
+                                 "distancia": dup["distancia"]}})
+    with cronometrar(result["tempos"], "extracao"):
+        ans_stu, multi_qids = answers_from_ratios(entry["ratios"], ctx["layout"],
+                                                  threshold=ctx["threshold"], diff_min=ctx["diff_min"])
+    return _comparar(result, ans_stu, ctx, multi_qids)
+
+
+def _export_result(ctx, item):
+    """
+    Estágio 3: PDF individual do aluno (se o contexto pedir PDF na correção).
+    """
+    result, meta = item
+    if result["ok"] and ctx["pdf"]:
+        pdf_path = os.path.join(ctx["pdf_dir"], f"{result['aluno']}.pdf")
+        with cronometrar(result["tempos"], "pdf"):
+            export_pdf(pdf_path, meta, result["stats"]["per_q"])
+        result["pdf"] = pdf_path
+    return result
+
+
+def _grade_one(item):
+    """
+    Corrige uma prova no worker do pool (contexto em _CTX): decode ->
+    alinhamento -> extração -> comparação -> PDF.
+    Sempre retorna um dict com "aluno", "ok" e "erro".
+    """
+    return _export_result(_CTX, _grade_decoded(_CTX, _decode_item(_CTX, item)))
+
+
+# -------------------------
+# Lote
+# -------------------------
+def grade_batch(itens, ctx, workers=None, queue_depth=2, store=None, dedupe=False,
+                dist_max=DIST_MAX, dif_max=DIF_MAX):
+    """
+    Corrige um lote de provas em fluxo, em paralelo quando workers > 1.
+    - itens: iterável de (nome, dados), com dados em bytes ou caminho;
+      é consumido aos poucos, nunca inteiro
+    - ctx: contexto criado por make_context
+    - queue_depth: itens em espera entre estágios (por worker no modo paralelo)
+    - store: RatioStore onde guardar a extração de cada prova corrigida
+      (gravada no processo principal, conforme os resultados saem); antes do
+      lote roda a eviction do store, no máximo uma vez por store.intervalo
+    - dedupe: antes de alinhar, procura a prova no store (mesmo arquivo, ou a
+      mesma foto recomprimida/redimensionada: pHash a até dist_max bits e
+      miniatura igual, ver src/dedupe.py) e, se achar, corrige pelas
+      proporções guardadas. r["duplicata"] diz de qual prova ela é cópia.
+    Gera os resultados na mesma ordem dos itens. A memória de pico depende
+    de queue_depth e workers, não do tamanho do lote.
+    """
+    if store is None:
+        yield from _grade_batch(itens, ctx, workers, queue_depth)
+        return
+    store.manter()  # eviction periódica: o store não cresce sem limite
+    if dedupe:
+        ctx = dict(ctx, dedupe={"cache_dir": store.cache_dir, "dist_max": dist_max, "dif_max": dif_max})
+    for r in _grade_batch(itens, ctx, workers, queue_depth):
+        if r["ok"] and not r["reaproveitado"]:
+            store.put(_ctx_versao(ctx, r["versao"])["layout_id"], r)
+        r.pop("mini", None)
+        yield r
+
+
+def _grade_batch(itens, ctx, workers, queue_depth):
+    workers = resolve_workers(workers)
+    Path(ctx["pdf_dir"]).mkdir(parents=True, exist_ok=True)
+
+    if workers == 1:
+        # leitura -> decode -> alinhamento/extração -> PDF, cada um numa thread,
+        # todos com o contexto deste lote
+        lote = _contexto_lote(ctx)
+        estagios = [partial(fn, lote) for fn in (_decode_item, _grade_decoded, _export_result)]
+        yield from staged(itens, estagios, maxsize=queue_depth)
+        return
+
+    # no modo paralelo cada worker faz decode + correção + PDF; o processo
+    # principal só lê a entrada e mantém um número limitado de provas em voo
+    cv_threads = max(1, (os.cpu_count() or 1) // workers)
+    max_inflight = workers * queue_depth
+    with mp.Pool(workers, initializer=_init_worker, initargs=(ctx, cv_threads)) as pool:
+        em_voo = deque()
+        for item in prefetch(itens, maxsize=queue_depth):
+            em_voo.append(pool.apply_async(_grade_one, (item,)))
+            if len(em_voo) >= max_inflight:
+                yield em_voo.popleft().get()
+        while em_voo:
+            yield em_voo.popleft().get()
+
+
+def regrade_batch(itens, ctx, store, workers=None, queue_depth=2):
+    """
+    Recorreção incremental: provas já extraídas com este layout (o mesmo
+    arquivo ou uma cópia dele no store) são recorrigidas só pelas proporções
+    guardadas, com o gabarito e o limiar do ctx; as demais passam pela
+    correção normal (e entram no store). Gera os resultados na mesma ordem dos itens.
+    """
+    return grade_batch(itens, ctx, workers=workers, queue_depth=queue_depth, store=store, dedupe=True)
+
+
+# -------------------------
+# Relatórios em lote
+# -------------------------
+def export_reports(resultados, pdf_dir, workers=None, turma_pdf=None):
+    """
+    Gera os PDFs de um lote já corrigido (make_context com pdf=False), em
+    paralelo e fora do caminho da correção. Preenche r["pdf"] de cada resultado
+    e r["tempos"]["pdf"] (tempo de parede entre um PDF e o seguinte).
+    - turma_pdf: caminho de um PDF único da turma (índice + marcadores), opcional
+    """
+    oks = [r for r in resultados if r["ok"]]
+    Path(pdf_dir).mkdir(parents=True, exist_ok=True)
+    itens = ((os.path.join(str(pdf_dir), f"{r['aluno']}.pdf"), r["relatorio"], r["stats"]["per_q"])
+             for r in oks)
+    workers = min(resolve_workers(workers), max(1, len(oks) // 8))
+    t0 = time.perf_counter()
+    for r, pdf_path in zip(oks, render_batch(itens, workers=workers)):
+        t1 = time.perf_counter()
+        r["pdf"] = pdf_path
+        r.setdefault("tempos", {})["pdf"] = t1 - t0
+        t0 = t1
+
+    if turma_pdf:
+        export_class_pdf(str(turma_pdf), [(r["relatorio"], r["stats"]["per_q"]) for r in oks])
+    return resultados
@@ -1,76 +1,253 @@
 #!/usr/bin/env python3
 # -- coding: utf-8 --
+import os
+import multiprocessing as mp
+
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import cm
 from reportlab.lib import colors
 
+# Cor e símbolo de cada resultado (a legenda usa os quatro primeiros)
+_RESULTADOS = {
+    "ok": (colors.green, "✅", "Correto"),
+    "wrong": (colors.red, "❌", "Errado"),
+    "blank": (colors.blue, "⭕", "Em branco"),
+    "multi": (colors.orange, "⚠", "Múltipla"),
+}
+_LEGENDA_X = (2*cm, 5*cm, 8*cm, 12*cm)
+_CAMPOS_FIXOS = ("turma", "escola", "materia", "data")
+# Fonte das linhas de questão (também a da legenda)
+_FONTE_LINHA = ("Helvetica", 11)
+
+
+class ReportRenderer:
+    """
+    Gera os relatórios de correção (um PDF por aluno ou um PDF da turma).
+    O que é igual para toda a prova é montado uma vez e reaproveitado:
+    - cabeçalho fixo (título, turma/escola/matéria/data e legenda) vira um
+      Form XObject, desenhado com um único doForm em cada relatório
+    - o código PDF de cada linha de questão (gabarito, resposta, resultado)
+      fica em cache e é só posicionado na página
+    """
+
+    def __init__(self, pagesize=A4, line_height=18, max_linhas=50000):
+        self.pagesize = pagesize
+        self.line_height = line_height
+        self.max_linhas = max_linhas
+        self._linhas = {}
+
+    # -------------------------
+    # Documento
+    # -------------------------
+    def _cabecalho(self, c, forms, meta):
+        """
+        Nome do form com o cabeçalho fixo para os campos da prova em meta
+        (criado no documento na primeira vez). forms: {campos: nome} do documento.
+        """
+        chave = tuple(str(meta.get(k, "")) for k in _CAMPOS_FIXOS)
+        nome = forms.get(chave)
+        if nome is not None:
+            return nome
+
+        nome = f"cabecalho{len(forms)}"
+        width, height = self.pagesize
+        c.beginForm(nome)
+        c.setFont("Helvetica-Bold", 16)
+        c.drawCentredString(width/2, height - 80, "Relatório de Correção - CorriJá")
+
+        c.setFont("Helvetica", 12)
+        c.drawString(2*cm, height - 140, f"Turma: {meta.get('turma','')}   Escola: {meta.get('escola','')}")
+        c.drawString(2*cm, height - 160, f"Matéria: {meta.get('materia','')}   Data: {meta.get('data','')}")
+
+        # Legenda (registra a fonte das linhas e as dos símbolos)
+        c.setFont(*_FONTE_LINHA)
+        legenda_y = height - 210
+        for x, (cor, mark, texto) in zip(_LEGENDA_X, _RESULTADOS.values()):
+            c.setFillColor(cor)
+            c.drawString(x, legenda_y, f"{mark} {texto}")
+        c.setFillColor(colors.black)
+        c.endForm()
+
+        forms[chave] = nome
+        return nome
+
+    def _linha(self, c, qid, info):
+        """
+        Código PDF (BT..ET) de uma linha de questão, na altura y = 0.
+        A chave inclui tudo o que aparece na linha, então serve para todos os alunos.
+        O código referencia as fontes pelo nome interno do documento (/F1, /F2...,
+        na ordem em que foram usadas). Todo documento começa pelo cabeçalho, que
+        usa a fonte da linha e, na legenda, os símbolos dos resultados (com as
+        fontes de substituição deles), sempre na mesma ordem: os nomes internos
+        são os mesmos em todos os documentos. Textos que precisariam de outra
+        fonte de substituição (fora do WinAnsi) não entram no cache.
+        """
+        student = info["student"] if info["student"] != "" else "-"
+        key = str(info["key"])
+        chave = (qid, key, student, info["result"]) + _FONTE_LINHA
+        code = self._linhas.get(chave)
+        if code is None:
+            cor, mark = _RESULTADOS.get(info["result"], (colors.black, "?", ""))[:2]
+            t = c.beginText(2*cm, 0)
+            t.setFont(*_FONTE_LINHA)
+            t.setFillColor(cor)
+            t.textOut(f"Q{qid:02d} - Gabarito: {key} | Aluno: {student}")
+            t.setTextOrigin(10*cm, 0)
+            t.textOut(f"Resultado: {mark}")
+            code = t.getCode()
+            try:
+                (key + student).encode("cp1252")
+            except UnicodeEncodeError:
+                return code  # usaria uma fonte que o cabeçalho não registrou: não reaproveitável
+            if len(self._linhas) >= self.max_linhas:
+                self._linhas.clear()
+            self._linhas[chave] = code
+        return code
+
+    def _paginas(self, n_questoes):
+        """
+        Número de páginas de um relatório com n_questoes linhas.
+        """
+        height = self.pagesize[1]
+        primeira = int((height - 240 - 3*cm) // self.line_height) + 1
+        demais = int((height - 100 - 3*cm) // self.line_height) + 1
+        if n_questoes <= primeira:
+            return 1
+        return 1 + -(-(n_questoes - primeira) // demais)
+
+    def _desenhar(self, c, forms, meta, per_q):
+        """
+        Desenha um relatório a partir da página atual e termina com showPage().
+        """
+        width, height = self.pagesize
+        c.doForm(self._cabecalho(c, forms, meta))
+
+        c.setFont("Helvetica", 12)
+        c.drawString(2*cm, height - 120, f"Aluno: {meta.get('aluno','')}")
+        c.drawString(2*cm, height - 180, f"Nota: {meta.get('score',0):.1f} ({meta.get('correct',0)}/{meta.get('total',0)} acertos)")
+
+        # Questões: cada linha é o código em cache, deslocado até y
+        y = height - 240
+        for qid, info in per_q.items():
+            if y < 3*cm:  # quebra de página
+                c.showPage()
+                y = height - 100
+            c.addLiteral(f"q 1 0 0 1 0 {y:g} cm {self._linha(c, qid, info)} Q")
+            y -= self.line_height
+
+        c.showPage()
+
+    # -------------------------
+    # Saídas
+    # -------------------------
+    def render(self, out_path, meta, per_q):
+        """
+        PDF individual do aluno.
+        - meta: dict com aluno, turma, materia, escola, data, score, correct, total
+        - per_q: dict com detalhes por questão {qid: {"key": x, "student": y, "result": res}}
+        """
+        c = canvas.Canvas(out_path, pagesize=self.pagesize)
+        self._desenhar(c, {}, meta, per_q)
+        c.save()
+        return out_path
+
+    def render_turma(self, out_path, relatorios, titulo="Relatórios da turma"):
+        """
+        Um único PDF com todos os alunos: índice na primeira página (com links)
+        e um marcador por aluno.
+        - relatorios: lista de (meta, per_q), na ordem em que devem aparecer
+        """
+        relatorios = list(relatorios)
+        width, height = self.pagesize
+        c = canvas.Canvas(out_path, pagesize=self.pagesize)
+        c.setTitle(titulo)
+        forms = {}
+        if relatorios:
+            # cabeçalho antes do índice: as fontes da legenda ficam registradas
+            # na mesma ordem dos PDFs individuais, e o cache de linhas vale aqui também
+            self._cabecalho(c, forms, relatorios[0][0])
+
+        # Índice: páginas calculadas antes de desenhar os relatórios
+        por_pagina = int((height - 130 - 2*cm) // 16) + 1
+        paginas_indice = max(1, -(-len(relatorios) // por_pagina))
+        pagina = paginas_indice + 1
+        y = None
+        for i, (meta, per_q) in enumerate(relatorios):
+            if i % por_pagina == 0:
+                if i:
+                    c.showPage()
+                c.setFont("Helvetica-Bold", 16)
+                c.drawCentredString(width/2, height - 80, titulo)
+                c.setFont("Helvetica", 11)
+                y = height - 130
+            texto = f"{meta.get('aluno','')}  —  nota {meta.get('score',0):.1f}"
+            c.drawString(2*cm, y, texto)
+            c.drawRightString(width - 2*cm, y, f"p. {pagina}")
+            c.linkRect("", f"aluno{i}", (2*cm, y - 3, width - 2*cm, y + 11), relative=0)
+            pagina += self._paginas(len(per_q))
+            y -= 16
+        c.showPage()
+
+        for i, (meta, per_q) in enumerate(relatorios):
+            c.bookmarkPage(f"aluno{i}")
+            c.addOutlineEntry(str(meta.get("aluno", i + 1)), f"aluno{i}", level=0)
+            self._desenhar(c, forms, meta, per_q)
+
+        c.showOutline()
+        c.save()
+        return out_path
+
+
+# -------------------------
+# Uso direto e em lote
+# -------------------------
+_RENDERER = None
+
+
+def get_renderer():
+    """
+    Renderer do processo (o cache de linhas é compartilhado por todos os relatórios).
+    """
+    global _RENDERER
+    if _RENDERER is None:
+        _RENDERER = ReportRenderer()
+    return _RENDERER
+
+
 def export_pdf(out_path, meta, per_q):
     """
     Gera relatório PDF individual do aluno.
     - meta: dict com aluno, turma, materia, escola, data, score, correct, total
     - per_q: dict com detalhes por questão {qid: {"key": x, "student": y, "result": res}}
     """
-    c = canvas.Canvas(out_path, pagesize=A4)
-    width, height = A4
-
-    # Cabeçalho
-    c.setFont("Helvetica-Bold", 16)
-    c.drawCentredString(width/2, height - 80, "Relatório de Correção - CorriJá")
-
-    c.setFont("Helvetica", 12)
-    c.drawString(2*cm, height - 120, f"Aluno: {meta.get('aluno','')}")
-    c.drawString(2*cm, height - 140, f"Turma: {meta.get('turma','')}   Escola: {meta.get('escola','')}")
-    c.drawString(2*cm, height - 160, f"Matéria: {meta.get('materia','')}   Data: {meta.get('data','')}")
-    c.drawString(2*cm, height - 180, f"Nota: {meta.get('score',0):.1f} ({meta.get('correct',0)}/{meta.get('total',0)} acertos)")
-
-    # Legenda
-    c.setFont("Helvetica", 11)
-    legenda_y = height - 210
-    c.setFillColor(colors.green);  c.drawString(2*cm, legenda_y, "✅ Correto")
-    c.setFillColor(colors.red);    c.drawString(5*cm, legenda_y, "❌ Errado")
-    c.setFillColor(colors.blue);   c.drawString(8*cm, legenda_y, "⭕ Em branco")
-    c.setFillColor(colors.orange); c.drawString(12*cm, legenda_y, "⚠ Múltipla")
-    c.setFillColor(colors.black)
-
-    # Questões
-    start_y = legenda_y - 30
-    x_col1 = 2*cm
-    x_col2 = 10*cm
-    y = start_y
-    line_height = 18
-
-    for qid, info in per_q.items():
-        if y < 3*cm:  # quebra de página
-            c.showPage()
-            y = height - 100
-            c.setFont("Helvetica", 11)
-
-        key = info["key"]
-        student = info["student"] if info["student"] != "" else "-"
-        result = info["result"]
-
-        if result == "ok":
-            c.setFillColor(colors.green)
-            mark = "✅"
-        elif result == "wrong":
-            c.setFillColor(colors.red)
-            mark = "❌"
-        elif result == "blank":
-            c.setFillColor(colors.blue)
-            mark = "⭕"
-        elif result == "multi":
-            c.setFillColor(colors.orange)
-            mark = "⚠"
-        else:
-            c.setFillColor(colors.black)
-            mark = "?"
-
-        c.drawString(x_col1, y, f"Q{qid:02d} - Gabarito: {key} | Aluno: {student}")
-        c.drawString(x_col2, y, f"Resultado: {mark}")
-
-        y -= line_height
-
-    c.setFillColor(colors.black)
-    c.showPage()
-    c.save()
\ No newline at end of file
+    return get_renderer().render(out_path, meta, per_q)
+
+
+def _render_item(item):
+    out_path, meta, per_q = item
+    return export_pdf(out_path, meta, per_q)
+
+
+def render_batch(itens, workers=1, chunksize=8):
+    """
+    Gera vários PDFs individuais, em paralelo quando workers > 1.
+    - itens: iterável de (out_path, meta, per_q)
+    Gera os caminhos na mesma ordem dos itens.
+    """
+    if workers is None or workers <= 0:
+        workers = os.cpu_count() or 1
+    if workers == 1:
+        for item in itens:
+            yield _render_item(item)
+        return
+
+    with mp.Pool(workers) as pool:
+        yield from pool.imap(_render_item, itens, chunksize=chunksize)
+
+
+def export_class_pdf(out_path, relatorios, titulo="Relatórios da turma"):
+    """
+    PDF único da turma (índice + um marcador por aluno). relatorios: [(meta, per_q)].
+    """
+    return get_renderer().render_turma(out_path, relatorios, titulo=titulo)
@@ -3,90 +3,200 @@
 import cv2
 import numpy as np
 
+from src.sheet import as_sheet
+
 # -----------------------------
 # Funções auxiliares
 # -----------------------------
-def _fill_ratio_masked(patch_bin):
+def _bubble_patch(x, y, w, h, img_h, img_w):
     """
-    Calcula a proporção de preenchimento considerando
-    apenas uma máscara circular no centro da bolha.
+    Recorte (com margem) usado para medir uma bolha, já limitado às bordas da imagem.
     """
-    h, w = patch_bin.shape
-    mask = np.zeros_like(patch_bin, dtype=np.uint8)
-    radius = min(h, w) // 2 - 2
-    cv2.circle(mask, (w//2, h//2), radius, 255, -1)
-    filled = cv2.countNonZero(cv2.bitwise_and(patch_bin, mask))
-    total = cv2.countNonZero(mask)
-    return filled / float(total + 1e-6)
+    pad = max(1, int(min(w, h) * 0.20))
+    xs, ys = max(0, x - pad), max(0, y - pad)
+    xe, ye = min(img_w, x + w + pad), min(img_h, y + h + pad)
+    return xs, ys, xe, ye
 
 
-def choose_option(warped_bgr, layout, thr_img=None, threshold=0.25, diff_min=0.08, debug=False):
+def _build_bubble_index(boxes_per_q, img_shape):
+    """
+    Pré-calcula, uma vez por layout, os pixels de todas as máscaras circulares.
+    Retorna (idx, starts, counts, n_opts):
+    - idx: índices lineares (na imagem achatada) dos pixels de cada máscara, concatenados
+    - starts/counts: início e quantidade de pixels de cada bolha em idx
+    - n_opts: número de alternativas por questão
+    """
+    img_h, img_w = img_shape[:2]
+    idx, counts = [], []
+    for boxes in boxes_per_q:
+        for (x, y, w, h) in boxes:
+            xs, ys, xe, ye = _bubble_patch(x, y, w, h, img_h, img_w)
+            ph, pw = max(0, ye - ys), max(0, xe - xs)
+            mask = np.zeros((ph, pw), dtype=np.uint8)
+            radius = min(ph, pw) // 2 - 2
+            if radius >= 0:
+                cv2.circle(mask, (pw//2, ph//2), radius, 255, -1)
+            my, mx = np.nonzero(mask)
+            idx.append((my + ys) * img_w + (mx + xs))
+            counts.append(len(my))
+
+    counts = np.array(counts, dtype=np.int64)
+    starts = np.zeros_like(counts)
+    if len(counts) > 1:
+        starts[1:] = np.cumsum(counts)[:-1]
+    idx = np.concatenate(idx).astype(np.intp) if idx else np.zeros(0, dtype=np.intp)
+    n_opts = np.array([len(b) for b in boxes_per_q], dtype=np.int64)
+    return idx, starts, counts, n_opts
+
+
+_INDEX_CACHE = {}
+_INDEX_CACHE_MAX = 8
+
+
+def _bubble_index(layout, img_shape):
+    """
+    Índice de máscaras do layout para o tamanho de imagem dado (com cache).
+    """
+    boxes_per_q = tuple(tuple(map(tuple, q["boxes"])) for q in layout["questions"])
+    key = (boxes_per_q, tuple(img_shape[:2]))
+    index = _INDEX_CACHE.get(key)
+    if index is None:
+        if len(_INDEX_CACHE) >= _INDEX_CACHE_MAX:
+            _INDEX_CACHE.pop(next(iter(_INDEX_CACHE), None), None)  # outra thread pode ter removido
+        index = _build_bubble_index(boxes_per_q, img_shape)
+        _INDEX_CACHE[key] = index
+    return index
+
+
+def fill_ratios(thr_img, layout):
+    """
+    Proporção de preenchimento de todas as bolhas da folha, em poucas operações NumPy.
+    Retorna matriz (questões x alternativas); posições sem bolha ficam com -1.
+    """
+    idx, starts, counts, n_opts = _bubble_index(layout, thr_img.shape)
+    n_q = len(n_opts)
+    max_opts = int(n_opts.max()) if n_q else 0
+    ratios = np.full((n_q, max_opts), -1.0, dtype=np.float64)
+    if n_q == 0:
+        return ratios
+
+    on = thr_img.reshape(-1)[idx] > 0
+    filled = np.zeros(len(counts), dtype=np.int64)
+    nz = counts > 0
+    if nz.any():
+        filled[nz] = np.add.reduceat(on, starts[nz], dtype=np.int64)
+    flat = filled / (counts + 1e-6)
+
+    rows = np.repeat(np.arange(n_q), n_opts)
+    cols = np.arange(len(flat)) - np.repeat(np.cumsum(n_opts) - n_opts, n_opts)
+    ratios[rows, cols] = flat
+    return ratios
+
+
+def _decidir(ratios_all, threshold, diff_min):
+    """
+    Decisão por questão a partir da matriz de proporções (questões x alternativas).
+    Retorna (best_idx, best, second, blank, multi), um valor por questão.
+    Sem uma bolha clara (best < threshold, ou a segunda a menos de diff_min
+    dela) a resposta é "". Isso é múltipla só se duas ou mais bolhas passam
+    do limiar e ficam diff_min acima da bolha mais vazia da questão: bolhas
+    vazias também passam de threshold (o contorno conta, ~0.26-0.32), e uma
+    questão em branco não pode ser contada como múltipla.
+    """
+    ratios_f32 = np.asarray(ratios_all, dtype=np.float32)
+    best_idx_all = np.argmax(ratios_f32, axis=1) if len(ratios_f32) else np.zeros(0, dtype=np.int64)
+    sorted_all = np.sort(ratios_f32, axis=1)
+    best_all = sorted_all[:, -1] if len(ratios_f32) else np.zeros(0, dtype=np.float32)
+    if ratios_f32.shape[1] > 1:
+        second_all = np.maximum(sorted_all[:, -2], 0.0)
+    else:
+        second_all = np.zeros(len(ratios_f32), dtype=np.float32)
+
+    blank = best_all < threshold
+    multi = ~blank & ((best_all - second_all) < diff_min) & (second_all >= threshold)
+    if len(ratios_f32):
+        vazia = np.where(ratios_f32 >= 0, ratios_f32, np.inf).min(axis=1)
+        marcadas = (ratios_f32 >= np.maximum(threshold, vazia + diff_min)[:, None]).sum(axis=1)
+        blank |= multi & (marcadas < 2)
+        multi &= marcadas >= 2
+    return best_idx_all, best_all, second_all, blank, multi
+
+
+def answers_from_ratios(ratios, layout, threshold=0.25, diff_min=0.08):
+    """
+    Refaz as respostas a partir das proporções já medidas (metrics[qid]["ratios"]
+    de choose_option, na ordem das questões do layout), sem tocar na imagem.
+    Mesma regra de choose_option: serve para recorrigir com outro limiar.
+    Retorna (respostas, qids lidos como múltipla marcação).
+    """
+    questions = layout["questions"]
+    max_opts = max([len(r) for r in ratios], default=0)
+    ratios_all = np.full((len(ratios), max_opts), -1.0, dtype=np.float64)
+    for i, r in enumerate(ratios):
+        ratios_all[i, :len(r)] = r
+    best_idx_all, _, _, blank, multi = _decidir(ratios_all, threshold, diff_min)
+
+    options = layout["options"]
+    answers = {}
+    for i, q in enumerate(questions):
+        answers[q["qid"]] = "" if blank[i] or multi[i] else options[int(best_idx_all[i])]
+    return answers, {q["qid"] for i, q in enumerate(questions) if multi[i]}
+
+
+def choose_option(warped, layout, thr_img=None, threshold=0.25, diff_min=0.08, debug=False):
     """
     Detecta alternativas marcadas com base em pixels (máscara circular).
-    Retorna respostas e métricas.
+    Retorna respostas e métricas. Questões em branco e com múltipla marcação
+    têm resposta ""; metrics[qid]["res"] diz qual ("blank", "multi" ou "marcada").
+    - warped: folha alinhada (imagem ou Sheet); sem thr_img, usa a binarização
+      de extração da Sheet (Sheet.thr_extracao, calculada uma única vez por folha)
     - threshold: % mínima de preenchimento para considerar marcada
     - diff_min: diferença mínima entre a bolha mais marcada e a segunda colocada
     - debug: se True, retorna imagem com bolhas coloridas
     """
+    sheet = as_sheet(warped)
     if thr_img is None:
-        gray = cv2.cvtColor(warped_bgr, cv2.COLOR_BGR2GRAY)
-        thr_img = cv2.adaptiveThreshold(
-            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY_INV, 35, 10
-        )
+        thr_img = sheet.thr_extracao
 
     answers = {}
     metrics = {}
-    dbg_img = warped_bgr.copy()
+    dbg_img = sheet.debug_canvas() if debug else None
+
+    ratios_all = fill_ratios(thr_img, layout)
+    best_idx_all, best_all, second_all, blank, multi = _decidir(ratios_all, threshold, diff_min)
+    options = layout["options"]
 
-    for q in layout["questions"]:
+    for i, q in enumerate(layout["questions"]):
         qid = q["qid"]
-        ratios = []
-
-        for b in q["boxes"]:
-            x, y, w, h = b
-            pad = max(1, int(min(w, h) * 0.20))
-            xs, ys = max(0, x - pad), max(0, y - pad)
-            xe, ye = x + w + pad, y + h + pad
-            patch = thr_img[ys:ye, xs:xe]
-            r = _fill_ratio_masked(patch)
-            ratios.append(r)
-
-        ratios_np = np.array(ratios, dtype=np.float32)
-        best_idx = int(np.argmax(ratios_np))
-        best_val = ratios_np[best_idx]
-
-        sorted_idx = np.argsort(ratios_np)[::-1]
-        second_val = ratios_np[sorted_idx[1]] if len(sorted_idx) > 1 else 0.0
-
-        if best_val < threshold:
-            ans = ""   # nenhuma marcada
-            res = "blank"
+        n = len(q["boxes"])
+        best_idx = int(best_idx_all[i])
+
+        if blank[i]:
+            ans, res = "", "blank"   # nenhuma marcada
             color = (255, 0, 0)  # azul
-        elif (best_val - second_val) < diff_min and second_val >= threshold:
-            ans = ""   # múltipla
-            res = "multi"
+        elif multi[i]:
+            ans, res = "", "multi"   # múltipla
             color = (0, 255, 255)  # amarelo
         else:
-            ans = layout["options"][best_idx]
-            res = "marked"
+            ans, res = options[best_idx], "marcada"
             color = (0, 255, 0)  # verde
 
         answers[qid] = ans
         metrics[qid] = {
-            "ratios": [float(x) for x in ratios],
+            "ratios": ratios_all[i, :n].tolist(),
             "best_idx": best_idx,
-            "best_val": float(best_val),
-            "second_val": float(second_val),
+            "best_val": float(best_all[i]),
+            "second_val": float(second_all[i]),
+            "res": res,
             "threshold": threshold,
             "diff_min": diff_min
         }
 
         # Debug visual (desenha círculo colorido sobre a bolha escolhida)
         if debug:
-            for i, (x, y, w, h) in enumerate(q["boxes"]):
+            for j, (x, y, w, h) in enumerate(q["boxes"]):
                 cx, cy = x + w//2, y + h//2
-                if i == best_idx:
+                if j == best_idx:
                     cv2.circle(dbg_img, (cx, cy), max(w, h)//2, color, 2)
                 else:
                     cv2.circle(dbg_img, (cx, cy), max(w, h)//2, (200, 200, 200), 1)
@@ -96,9 +206,11 @@ def choose_option(warped_bgr, layout, thr_img=None, threshold=0.25, diff_min=0.0
     return answers, metrics
 
 
-def compare_answers(ans_student, ans_key):
+def compare_answers(ans_student, ans_key, multi_qids=()):
     """
     Compara respostas do aluno com o gabarito.
+    - multi_qids: questões lidas com múltipla marcação (resposta ""), contadas
+      em multi e não em blank (ver metrics[qid]["res"] de choose_option)
     Retorna estatísticas e detalhes por questão.
     """
     correct, wrong, blank, multi = 0, 0, 0, 0
@@ -106,7 +218,10 @@ def compare_answers(ans_student, ans_key):
 
     for qid, key in ans_key.items():
         stu = ans_student.get(qid, "")
-        if stu == "":
+        if stu == "" and qid in multi_qids:
+            multi += 1
+            res = "multi"
+        elif stu == "":
             blank += 1
             res = "blank"
         else:
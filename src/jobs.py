@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+import os
+import json
+import time
+import uuid
+import shutil
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+DEFAULT_JOBS_DIR = os.path.join(os.path.expanduser("~"), ".local", "share", "corrija", "jobs")
+
+# recebendo -> fila -> processando -> concluido | erro
+# (processando volta para fila quando a tentativa falha ou o lease expira)
+STATUS = ("recebendo", "fila", "processando", "concluido", "erro")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    total INTEGER,
+    erro TEXT,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    max_tentativas INTEGER NOT NULL,
+    worker TEXT,
+    lease_ate REAL,
+    disponivel_em REAL NOT NULL DEFAULT 0,
+    criado REAL NOT NULL,
+    iniciado REAL,
+    finalizado REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, disponivel_em);
+CREATE TABLE IF NOT EXISTS resultados (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    aluno TEXT NOT NULL,
+    dados TEXT NOT NULL,
+    UNIQUE (job_id, aluno)
+);
+"""
+
+
+def _id_worker():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class Job:
+    """
+    Fotografia de um job lida da fila (não se atualiza sozinha: use fila.get).
+    Entradas (gabarito.jpg, alunos.zip) e saídas ficam em `dir`, no
+    diretório compartilhado da fila.
+    """
+
+    def __init__(self, row, base_dir):
+        self.id = row["id"]
+        self.dir = Path(base_dir) / row["id"]
+        self.params = json.loads(row["params"])
+        self.status = row["status"]
+        self.total = row["total"]
+        self.feitos = row["feitos"] if "feitos" in row.keys() else 0
+        self.erro = row["erro"]
+        self.tentativas = row["tentativas"]
+        self.worker = row["worker"]
+        self.criado = row["criado"]
+        self.finalizado = row["finalizado"]
+
+    @property
+    def out_dir(self):
+        return self.dir / "resultados"
+
+    def terminou(self):
+        return self.status in ("concluido", "erro")
+
+    def info(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "feitos": self.feitos,
+            "erro": self.erro,
+            "tentativas": self.tentativas,
+        }
+
+
+class JobQueue:
+    """
+    Fila de jobs de correção persistente, num SQLite dentro de base_dir
+    (fila.db), sem broker externo. A API só cria e consulta jobs; quem corrige
+    são os Workers (threads na própria API ou processos `python -m src.worker`,
+    em uma ou mais máquinas que enxergam o mesmo base_dir).
+    Um worker pega um job com um lease (lease segundos, renovado enquanto
+    corrige). Se o worker cair, o lease expira e outro worker retoma o job;
+    se a correção falhar, o job volta para a fila com espera crescente até
+    max_tentativas: o valor gravado no job por quem o criou (a API) ou o desta
+    fila, o que for menor, para que um worker possa limitar as tentativas dos
+    jobs que pega. Os resultados por aluno ficam na tabela `resultados`,
+    e os arquivos em base_dir/<job_id>/resultados.
+    - max_age: segundos que um job terminado fica disponível antes de ser apagado
+    - wal: journal WAL do SQLite (desligar se base_dir estiver num sistema de
+      arquivos de rede, onde o WAL não é seguro)
+    """
+
+    def __init__(self, base_dir=None, lease=60, max_tentativas=3, espera=5.0, max_age=7 * 24 * 3600,
+                 wal=None):
+        self.base_dir = Path(base_dir or os.environ.get("CORRIJA_JOBS_DIR", DEFAULT_JOBS_DIR))
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.base_dir / "fila.db"
+        self.lease = lease
+        self.max_tentativas = max_tentativas
+        self.espera = espera
+        self.max_age = max_age
+        self.wal = wal if wal is not None else os.environ.get("CORRIJA_FILA_WAL", "1") != "0"
+        self._local = threading.local()
+        self._db().executescript(_SCHEMA)
+
+    # -------------------------
+    # Conexão
+    # -------------------------
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA busy_timeout = 30000")
+            if self.wal:
+                db.execute("PRAGMA journal_mode = WAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transacao(self):
+        """
+        Transação com lock de escrita desde o início (BEGIN IMMEDIATE), para
+        que dois workers nunca peguem o mesmo job.
+        """
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _job(self, row):
+        return Job(row, self.base_dir) if row is not None else None
+
+    # -------------------------
+    # API: criar e consultar
+    # -------------------------
+    def criar(self, **params):
+        """
+        Cria o job (status "recebendo") e o seu diretório; o chamador grava os
+        arquivos de entrada nele e depois chama enfileirar(job).
+        """
+        self.limpar()
+        job_id = uuid.uuid4().hex
+        (self.base_dir / job_id).mkdir(parents=True)
+        with self._transacao() as db:
+            db.execute("INSERT INTO jobs (id, status, params, max_tentativas, criado) VALUES (?, ?, ?, ?, ?)",
+                       (job_id, "recebendo", json.dumps(params), self.max_tentativas, time.time()))
+        return self.get(job_id)
+
+    def enfileirar(self, job):
+        with self._transacao() as db:
+            db.execute("UPDATE jobs SET status = 'fila', disponivel_em = ? WHERE id = ? AND status = 'recebendo'",
+                       (time.time(), job.id))
+        return self.get(job.id)
+
+    def get(self, job_id):
+        row = self._db().execute(
+            "SELECT j.*, (SELECT COUNT(*) FROM resultados r WHERE r.job_id = j.id) AS feitos "
+            "FROM jobs j WHERE j.id = ?", (job_id,)).fetchone()
+        return self._job(row)
+
+    def por_status(self):
+        """
+        Quantidade de jobs em cada status.
+        """
+        rows = self._db().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {r["status"]: r["n"] for r in rows}
+
+    def resultados(self, job_id, depois=0):
+        """
+        Resultados publicados depois de `depois` (seq), como [(seq, dict)].
+        """
+        rows = self._db().execute("SELECT seq, dados FROM resultados WHERE job_id = ? AND seq > ? ORDER BY seq",
+                                  (job_id, depois)).fetchall()
+        return [(r["seq"], json.loads(r["dados"])) for r in rows]
+
+    def iter_resultados(self, job_id, intervalo=0.5, timeout=None):
+        """
+        Gera os resultados na ordem em que ficam prontos, consultando a fila
+        a cada `intervalo` até o job terminar (ou `timeout` sem novidades).
+        """
+        seq, ultimo = 0, time.time()
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                return
+            novos = self.resultados(job_id, seq)
+            for seq, r in novos:
+                yield r
+            if novos:
+                ultimo = time.time()
+            elif job.terminou():
+                return
+            elif timeout is not None and time.time() - ultimo > timeout:
+                return
+            else:
+                time.sleep(intervalo)
+
+    def esperar(self, job_id, timeout=None, intervalo=0.5):
+        """
+        Bloqueia até o job terminar; retorna o Job (ou o último estado, no timeout).
+        """
+        limite = None if timeout is None else time.time() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job.terminou() or (limite is not None and time.time() >= limite):
+                return job
+            time.sleep(intervalo)
+
+    # -------------------------
+    # Workers: lease, progresso e fim
+    # -------------------------
+    def pegar(self, worker):
+        """
+        Pega o job mais antigo disponível (na fila ou com lease expirado) e
+        o marca como processando por `worker`. Retorna o Job ou None.
+        """
+        agora = time.time()
+        with self._transacao() as db:
+            # lease expirado sem tentativas sobrando: desiste do job
+            db.execute("UPDATE jobs SET status = 'erro', finalizado = ?, "
+                       "erro = COALESCE(erro, 'worker parou de responder') "
+                       "WHERE status = 'processando' AND lease_ate < ? AND tentativas >= MIN(max_tentativas, ?)",
+                       (agora, agora, self.max_tentativas))
+            row = db.execute("SELECT id FROM jobs WHERE (status = 'fila' AND disponivel_em <= ?) "
+                             "OR (status = 'processando' AND lease_ate < ?) ORDER BY criado LIMIT 1",
+                             (agora, agora)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET status = 'processando', worker = ?, lease_ate = ?, "
+                       "tentativas = tentativas + 1, iniciado = COALESCE(iniciado, ?) WHERE id = ?",
+                       (worker, agora + self.lease, agora, row["id"]))
+        return self.get(row["id"])
+
+    def renovar(self, job_id, worker):
+        """
+        Estende o lease. Retorna False se o job não é mais deste worker.
+        """
+        with self._transacao() as db:
+            cur = db.execute("UPDATE jobs SET lease_ate = ? WHERE id = ? AND worker = ? AND status = 'processando'",
+                             (time.time() + self.lease, job_id, worker))
+        return cur.rowcount == 1
+
+    def definir_total(self, job_id, total):
+        with self._transacao() as db:
+            db.execute("UPDATE jobs SET total = ? WHERE id = ?", (total, job_id))
+
+    def publicar(self, job_id, resultado):
+        """
+        Grava o resultado de um aluno. Numa nova tentativa o mesmo aluno
+        substitui o anterior (mantendo a posição no fluxo).
+        """
+        with self._transacao() as db:
+            db.execute("INSERT INTO resultados (job_id, aluno, dados) VALUES (?, ?, ?) "
+                       "ON CONFLICT (job_id, aluno) DO UPDATE SET dados = excluded.dados",
+                       (job_id, str(resultado["aluno"]), json.dumps(resultado, ensure_ascii=False)))
+
+    def concluir(self, job_id, worker):
+        with self._transacao() as db:
+            db.execute("UPDATE jobs SET status = 'concluido', erro = NULL, finalizado = ?, lease_ate = NULL "
+                       "WHERE id = ? AND worker = ? AND status = 'processando'", (time.time(), job_id, worker))
+
+    def falhar(self, job_id, worker, erro):
+        """
+        Tentativa falhou: volta para a fila (espera dobrando a cada tentativa)
+        ou, sem tentativas sobrando, termina em erro.
+        """
+        agora = time.time()
+        with self._transacao() as db:
+            row = db.execute("SELECT tentativas, max_tentativas FROM jobs WHERE id = ? AND worker = ? "
+                             "AND status = 'processando'", (job_id, worker)).fetchone()
+            if row is None:
+                return
+            if row["tentativas"] < min(row["max_tentativas"], self.max_tentativas):
+                db.execute("UPDATE jobs SET status = 'fila', erro = ?, lease_ate = NULL, disponivel_em = ? "
+                           "WHERE id = ?", (erro, agora + self.espera * 2 ** (row["tentativas"] - 1), job_id))
+            else:
+                db.execute("UPDATE jobs SET status = 'erro', erro = ?, lease_ate = NULL, finalizado = ? "
+                           "WHERE id = ?", (erro, agora, job_id))
+
+    def limpar(self):
+        """
+        Remove jobs terminados há mais de max_age segundos (registros e arquivos).
+        """
+        if not self.max_age:
+            return
+        limite = time.time() - self.max_age
+        with self._transacao() as db:
+            velhos = [r["id"] for r in db.execute(
+                "SELECT id FROM jobs WHERE status IN ('concluido', 'erro') AND finalizado < ?", (limite,))]
+            for job_id in velhos:
+                db.execute("DELETE FROM resultados WHERE job_id = ?", (job_id,))
+                db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        for job_id in velhos:
+            shutil.rmtree(self.base_dir / job_id, ignore_errors=True)
+
+
+class Worker:
+    """
+    Consome a fila: pega um job, roda run_fn(job, publicar) mantendo o lease
+    renovado e marca o job como concluído ou falho.
+    - run_fn(job, publicar): faz a correção e chama publicar(resultado) por aluno
+    - intervalo: segundos entre consultas quando a fila está vazia
+    """
+
+    def __init__(self, fila, run_fn, nome=None, intervalo=1.0):
+        self.fila = fila
+        self.run_fn = run_fn
+        self.nome = nome or _id_worker()
+        self.intervalo = intervalo
+        self.parar = threading.Event()
+
+    def executar_um(self):
+        """
+        Corrige um job, se houver algum disponível. Retorna True se pegou um.
+        """
+        job = self.fila.pegar(self.nome)
+        if job is None:
+            return False
+
+        fim = threading.Event()
+
+        def manter_lease():
+            while not fim.wait(self.fila.lease / 3):
+                if not self.fila.renovar(job.id, self.nome):
+                    print(f"[WARN] job {job.id}: lease perdido por {self.nome}")
+                    return
+
+        t = threading.Thread(target=manter_lease, daemon=True, name=f"corrija-lease-{job.id[:8]}")
+        t.start()
+        try:
+            self.run_fn(job, lambda r: self.fila.publicar(job.id, r))
+        except Exception as e:
+            print(f"[ERRO] job {job.id} (tentativa {job.tentativas}): {e}")
+            self.fila.falhar(job.id, self.nome, str(e))
+        else:
+            self.fila.concluir(job.id, self.nome)
+        finally:
+            fim.set()
+            t.join()
+        return True
+
+    def rodar(self):
+        """
+        Loop até parar.set().
+        """
+        while not self.parar.is_set():
+            if not self.executar_um():
+                self.parar.wait(self.intervalo)
+
+    def iniciar(self):
+        """
+        Roda o loop numa thread de fundo (ex.: workers dentro da própria API).
+        """
+        t = threading.Thread(target=self.rodar, daemon=True, name=f"corrija-worker-{self.nome}")
+        t.start()
+        return t
@@ -3,8 +3,11 @@
 import cv2
 import numpy as np
 
-def preprocess(img_bgr):
-    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+def preprocess(img):
+    """
+    Binarização da folha. Aceita BGR ou já em cinza.
+    """
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
     gray = clahe.apply(gray)
     blurred = cv2.GaussianBlur(gray, (3,3), 0)
@@ -13,59 +16,129 @@ def preprocess(img_bgr):
     thr = cv2.morphologyEx(thr, cv2.MORPH_OPEN, np.ones((3,3), np.uint8), iterations=1)
     return thr
 
+# colunas do array de bolhas retornado por detect_bubbles
+CX, CY, X, Y, W, H, AREA, CIRC = range(8)
+
 def detect_bubbles(thr_img, min_area=120, max_area=5000, min_circ=0.65):
+    """
+    Retorna array float32 (N, 8) com cx, cy, x, y, w, h, área e circularidade
+    de cada bolha, ordenado por (cy, cx). Os contornos não são guardados.
+    """
     contours, _ = cv2.findContours(thr_img, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    bubbles = []
+    bubbles = np.empty((len(contours), 8), dtype=np.float32)
+    n = 0
     for cnt in contours:
         area = cv2.contourArea(cnt)
         if area < min_area or area > max_area:
             continue
         peri = cv2.arcLength(cnt, True)
-        if peri == 0: 
+        if peri == 0:
             continue
         circularity = 4.0*np.pi*area/(peri*peri)
         if circularity < min_circ:
             continue
         x,y,w,h = cv2.boundingRect(cnt)
-        cx,cy = x+w/2, y+h/2
-        bubbles.append((cx,cy,x,y,w,h,area,circularity,cnt))
-    bubbles.sort(key=lambda b: (b[1], b[0]))
-    return bubbles
+        bubbles[n] = (x+w/2, y+h/2, x, y, w, h, area, circularity)
+        n += 1
+    bubbles = bubbles[:n]
+    return bubbles[np.lexsort((bubbles[:, CX], bubbles[:, CY]))]
 
 def cluster_rows(bubbles, y_tol=12):
+    """
+    Agrupa as bolhas em linhas com uma varredura única sobre cy ordenado:
+    a bolha entra na linha atual se estiver a até y_tol da média dela.
+    Retorna [{'items': array (k, 8) ordenado por cx, 'y_mean': float}], por y.
+    """
+    if len(bubbles) == 0:
+        return []
+    order = np.argsort(bubbles[:, CY], kind="stable")
+    ys = bubbles[order, CY].tolist()
+
+    labels = np.empty(len(ys), dtype=np.int64)
+    row, soma, cont = 0, ys[0], 1
+    labels[0] = 0
+    for i in range(1, len(ys)):
+        if abs(ys[i] - soma/cont) <= y_tol:
+            soma += ys[i]
+            cont += 1
+        else:
+            row += 1
+            soma, cont = ys[i], 1
+        labels[i] = row
+
     rows = []
-    for b in bubbles:
-        placed = False
-        for row in rows:
-            if abs(row['y_mean'] - b[1]) <= y_tol:
-                row['items'].append(b)
-                row['y_mean'] = np.mean([it[1] for it in row['items']])
-                placed = True
-                break
-        if not placed:
-            rows.append({'items':[b], 'y_mean': b[1]})
-    rows.sort(key=lambda r: r['y_mean'])
-    for r in rows:
-        r['items'].sort(key=lambda it: it[0])
+    limites = np.flatnonzero(np.diff(labels)) + 1
+    for idx in np.split(order, limites):
+        items = bubbles[idx]
+        items = items[np.argsort(items[:, CX], kind="stable")]
+        rows.append({'items': items, 'y_mean': float(items[:, CY].mean())})
     return rows
 
-def learn_layout_from_key(warped_bgr, expected_options=5):
-    thr = preprocess(warped_bgr)
+def split_blocks(items, expected_options, gap_factor=1.6, spacing=None):
+    """
+    Divide uma linha (ordenada por cx) em blocos de colunas, quebrando onde o
+    espaço entre bolhas vizinhas passa de gap_factor x o espaçamento típico.
+    Blocos maiores que expected_options são fatiados de expected_options em
+    expected_options; sobras menores são descartadas.
+    """
+    if len(items) < expected_options:
+        return []
+    dx = np.diff(items[:, CX])
+    if spacing is None:
+        spacing = float(np.median(dx)) if len(dx) else 0.0
+    cortes = np.flatnonzero(dx > gap_factor * spacing) + 1 if spacing > 0 else []
+    blocks = []
+    for bloco in np.split(items, cortes):
+        for i in range(0, len(bloco) - expected_options + 1, expected_options):
+            blocks.append(bloco[i:i+expected_options])
+    return blocks
+
+def _cluster_1d(values, tol):
+    """
+    Rótulos de agrupamento 1D (ordenar e varrer): vizinhos a até tol ficam juntos.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.argsort(values, kind="stable")
+    novo = np.concatenate(([0], (np.diff(values[order]) > tol).astype(np.int64)))
+    labels = np.empty(len(values), dtype=np.int64)
+    labels[order] = np.cumsum(novo)
+    return labels
+
+def learn_layout_from_key(warped, expected_options=5):
+    """
+    Aprende o layout a partir do gabarito alinhado (imagem ou Sheet).
+    Retorna (layout, thr).
+    """
+    if hasattr(warped, "thr"):
+        thr = warped.thr
+    else:
+        thr = preprocess(warped)
     bubbles = detect_bubbles(thr)
     rows = cluster_rows(bubbles, y_tol=14)
     filtered = [r for r in rows if len(r['items']) >= expected_options]
+
+    # espaçamento típico entre alternativas, medido em todas as linhas
+    dxs = [np.diff(r['items'][:, CX]) for r in filtered if len(r['items']) > 1]
+    spacing = float(np.median(np.concatenate(dxs))) if dxs else 0.0
+
     questions = []
     qid = 1
-    for r in filtered:
-        items = r['items']
-        for i in range(0, len(items), expected_options):
-            block = items[i:i+expected_options]
-            if len(block) < expected_options:
-                continue
-            boxes = []
-            for it in block:
-                _,_,x,y,w,h,_,_,_ = it
-                boxes.append([int(x),int(y),int(w),int(h)])
-            questions.append({"qid": qid, "boxes": boxes})
+    for row_idx, r in enumerate(filtered):
+        for block in split_blocks(r['items'], expected_options, spacing=spacing):
+            boxes = block[:, [X, Y, W, H]].astype(np.int64).tolist()
+            questions.append({"qid": qid, "boxes": boxes, "row": row_idx,
+                              "x0": float(block[0, CX])})
             qid += 1
-    return {"questions": questions, "options": ["A","B","C","D","E"]}, thr
+
+    # modelo de grade: linhas x colunas (blocos) x alternativas
+    cols = _cluster_1d([q.pop("x0") for q in questions], tol=max(spacing, 1.0))
+    for q, c in zip(questions, cols.tolist()):
+        q["col"] = c
+    grid = {
+        "rows": len(filtered),
+        "cols": int(cols.max()) + 1 if len(cols) else 0,
+        "options": expected_options,
+    }
+    return {"questions": questions, "options": ["A","B","C","D","E"], "grid": grid}, thr
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+
+# Incrementar quando o algoritmo de aprendizado do layout mudar,
+# para que entradas antigas deixem de ser usadas.
+LAYOUT_VERSION = 2
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "corrija")
+
+
+def image_key(img, **params):
+    """
+    Chave de conteúdo do gabarito: hash da imagem decodificada + parâmetros do layout.
+    """
+    h = hashlib.sha256()
+    h.update(str(img.shape).encode())
+    h.update(str(img.dtype).encode())
+    h.update(memoryview(img).cast("B") if img.flags["C_CONTIGUOUS"] else img.tobytes())
+    params = dict(params, layout_version=LAYOUT_VERSION)
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+class LayoutCache:
+    """
+    Cache em disco de layouts aprendidos ({"questions", "options"}) e respostas do gabarito.
+    Cada entrada é um JSON nomeado pela chave de conteúdo. A eviction remove entradas
+    sem uso há mais de max_age (segundos) e, depois, as menos usadas até caber em
+    max_entries/max_bytes.
+    """
+
+    def __init__(self, cache_dir=None, max_entries=256, max_bytes=64 * 1024 * 1024,
+                 max_age=30 * 24 * 3600):
+        cache_dir = cache_dir or os.environ.get("CORRIJA_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.dir = Path(cache_dir) / "layouts"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def _path(self, key):
+        return self.dir / f"{key}.json"
+
+    def get(self, key):
+        """
+        Retorna (layout, ans_key) ou None se não houver entrada válida.
+        """
+        path = self._path(key)
+        try:
+            if self.max_age and time.time() - path.stat().st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            os.utime(path)  # marca como usada recentemente (LRU pelo mtime)
+        except OSError:
+            pass
+        ans_key = {int(k): v for k, v in entry["ans_key"].items()}
+        return entry["layout"], ans_key
+
+    def put(self, key, layout, ans_key):
+        entry = {
+            "created": time.time(),
+            "layout_version": LAYOUT_VERSION,
+            "layout": layout,
+            "ans_key": {str(k): v for k, v in ans_key.items()},
+        }
+        path = self._path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        now = time.time()
+        for p in self.dir.glob("*.json"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            if self.max_age and now - st.st_mtime > self.max_age:
+                p.unlink(missing_ok=True)
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+
+        entries.sort(reverse=True)  # mais recentes primeiro
+        total = 0
+        for i, (_, size, p) in enumerate(entries):
+            total += size
+            if i >= self.max_entries or total > self.max_bytes:
+                p.unlink(missing_ok=True)
+
+
+_DEFAULT_CACHE = None
+
+
+def get_default_cache():
+    """
+    Cache padrão (diretório em CORRIJA_CACHE_DIR ou ~/.cache/corrija).
+    """
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        _DEFAULT_CACHE = LayoutCache()
+    return _DEFAULT_CACHE
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Estágios medidos. "gabarito_*" e "layout" acontecem uma vez por lote.
+ESTAGIOS = ("decode", "dedupe", "triagem", "alinhamento", "versao", "extracao", "comparacao", "pdf",
+            "gabarito_alinhamento", "layout", "gabarito_extracao")
+
+# Limites (segundos) dos buckets do histograma exposto em /metrics
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PREFIXO = "corrija"
+
+
+@contextmanager
+def cronometrar(tempos, estagio):
+    """
+    Soma em tempos[estagio] os segundos gastos dentro do bloco.
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        tempos[estagio] = tempos.get(estagio, 0.0) + time.perf_counter() - t0
+
+
+class Metrics:
+    """
+    Tempos por estágio e contadores de uma execução (ou acumulados no processo).
+    - amostras: guarda cada tempo para calcular percentis no JSON da execução;
+      sem isso só ficam contagem, soma e buckets (memória constante)
+    - pai: outro Metrics que recebe tudo o que for registrado aqui (ex.: o
+      registro global exposto em /metrics)
+    """
+
+    def __init__(self, amostras=False, pai=None):
+        self.amostras = amostras
+        self.pai = pai
+        self.inicio = time.time()
+        self.fim = None
+        self._lock = threading.Lock()
+        self._hist = {}       # estagio -> [buckets..., +Inf], soma, contagem
+        self._valores = {}    # estagio -> [segundos]
+        self._contadores = {}  # (nome, (("label", "valor"), ...)) -> valor
+
+    # -------------------------
+    # Registro
+    # -------------------------
+    def observar(self, estagio, segundos):
+        with self._lock:
+            h = self._hist.get(estagio)
+            if h is None:
+                h = self._hist[estagio] = {"buckets": [0] * (len(BUCKETS) + 1), "soma": 0.0, "n": 0}
+            h["buckets"][bisect.bisect_left(BUCKETS, segundos)] += 1
+            h["soma"] += segundos
+            h["n"] += 1
+            if self.amostras:
+                self._valores.setdefault(estagio, []).append(segundos)
+        if self.pai is not None:
+            self.pai.observar(estagio, segundos)
+
+    def inc(self, nome, valor=1, **labels):
+        chave = (nome, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+        if self.pai is not None:
+            self.pai.inc(nome, valor, **labels)
+
+    def registrar_tempos(self, tempos):
+        for estagio, segundos in (tempos or {}).items():
+            self.observar(estagio, segundos)
+
+    def registrar_gabarito(self, tempos, cache_hit):
+        """
+        Tempos do gabarito (alinhamento, layout, extração) e uso do cache de layouts.
+        """
+        self.registrar_tempos(tempos)
+        self.inc("gabarito_cache_total", resultado="hit" if cache_hit else "miss")
+
+    def registrar_resultado(self, r):
+        """
+        Um resultado de grade_batch/regrade_batch: tempos dos estágios, status,
+        método de alinhamento usado, tentativas que falharam, reprovações na
+        triagem (por motivo) e contagem por tipo de resposta.
+        """
+        self.registrar_tempos(r.get("tempos"))
+        self.inc("provas_total", status="ok" if r["ok"] else "erro")
+        if r.get("reaproveitado"):
+            # recorrigida pelas proporções guardadas: nenhum alinhamento nesta execução
+            self.inc("provas_reaproveitadas_total")
+            if r.get("duplicata"):
+                self.inc("provas_duplicadas_total", tipo=r["duplicata"]["tipo"])
+        else:
+            triagem = r.get("triagem")
+            if triagem and not triagem["ok"]:
+                self.inc("provas_triagem_total", motivo=triagem["motivo"])
+            if r.get("metodo"):
+                self.inc("alinhamento_metodo_total", metodo=r["metodo"])
+            for tentativa in r.get("alinhamento") or []:
+                if not tentativa["ok"]:
+                    self.inc("alinhamento_falhas_total", metodo=tentativa["metodo"])
+        if r.get("esparso"):
+            self.inc("provas_esparsas_total")
+        stats = r.get("stats")
+        if stats:
+            for resultado, campo in (("ok", "correct"), ("wrong", "wrong"),
+                                     ("blank", "blank"), ("multi", "multi")):
+                self.inc("questoes_total", stats.get(campo, 0), resultado=resultado)
+
+    def registrar_pdfs(self, resultados):
+        """
+        Tempos do estágio de PDF em lote (engine.export_reports), registrados
+        depois dos resultados.
+        """
+        for r in resultados:
+            segundos = (r.get("tempos") or {}).get("pdf")
+            if segundos is not None:
+                self.observar("pdf", segundos)
+
+    def finalizar(self):
+        self.fim = time.time()
+        return self
+
+    # -------------------------
+    # Saídas
+    # -------------------------
+    def resumo(self):
+        """
+        Dict serializável: tempos por estágio (com percentis quando há amostras)
+        e contadores agrupados por nome.
+        """
+        with self._lock:
+            estagios = {}
+            for estagio, h in self._hist.items():
+                e = {"n": h["n"], "total_s": round(h["soma"], 4),
+                     "media_ms": round(h["soma"] / h["n"] * 1000, 2) if h["n"] else 0.0}
+                valores = self._valores.get(estagio)
+                if valores:
+                    import numpy as np
+                    ms = np.array(valores) * 1000
+                    e.update({"p50_ms": round(float(np.percentile(ms, 50)), 2),
+                              "p95_ms": round(float(np.percentile(ms, 95)), 2),
+                              "max_ms": round(float(ms.max()), 2)})
+                estagios[estagio] = e
+
+            contadores = {}
+            for (nome, labels), valor in sorted(self._contadores.items()):
+                chave = ",".join(f"{k}={v}" for k, v in labels) or "total"
+                contadores.setdefault(nome, {})[chave] = valor
+
+        fim = self.fim or time.time()
+        return {
+            "inicio": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.inicio)),
+            "duracao_s": round(fim - self.inicio, 3),
+            "estagios": estagios,
+            "contadores": contadores,
+        }
+
+    def salvar(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.resumo(), f, ensure_ascii=False, indent=2)
+        return path
+
+    def prometheus(self):
+        """
+        Texto no formato de exposição do Prometheus (histograma por estágio + contadores).
+        """
+        linhas = []
+        with self._lock:
+            nome = f"{PREFIXO}_estagio_segundos"
+            linhas.append(f"# HELP {nome} Tempo gasto em cada estágio da correção.")
+            linhas.append(f"# TYPE {nome} histogram")
+            for estagio, h in sorted(self._hist.items()):
+                acumulado = 0
+                for limite, n in zip(BUCKETS + ("+Inf",), h["buckets"]):
+                    acumulado += n
+                    linhas.append(f'{nome}_bucket{{estagio="{estagio}",le="{limite}"}} {acumulado}')
+                linhas.append(f'{nome}_sum{{estagio="{estagio}"}} {h["soma"]:.6f}')
+                linhas.append(f'{nome}_count{{estagio="{estagio}"}} {h["n"]}')
+
+            vistos = set()
+            for (cnome, labels), valor in sorted(self._contadores.items()):
+                cnome = f"{PREFIXO}_{cnome}"
+                if cnome not in vistos:
+                    linhas.append(f"# TYPE {cnome} counter")
+                    vistos.add(cnome)
+                rot = ",".join(f'{k}="{v}"' for k, v in labels)
+                linhas.append(f"{cnome}{{{rot}}} {valor}" if rot else f"{cnome} {valor}")
+        return "\n".join(linhas) + "\n"
+
+
+_REGISTRY = None
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_registry():
+    """
+    Métricas acumuladas do processo (o que a API expõe em /metrics).
+    """
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            _REGISTRY = Metrics()
+        return _REGISTRY
+
+
+def nova_execucao():
+    """
+    Métricas de uma execução (com percentis), repassadas ao registro do processo.
+    """
+    return Metrics(amostras=True, pai=get_registry())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+import threading
+import queue
+from pathlib import Path
+
+IMG_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+_FIM = object()  # sentinela de fim de fluxo
+
+
+# -------------------------
+# Leitura do ZIP
+# -------------------------
+def zip_entradas(zf, exts=IMG_EXTS):
+    """
+    Caminhos das imagens dentro do ZIP, na ordem do ZIP (só o índice, sem ler
+    as imagens). Identificam cada prova mesmo quando duas têm o mesmo nome
+    em pastas diferentes (t1/ana.jpg, t2/ana.jpg).
+    """
+    return [info.filename for info in zf.infolist()
+            if not info.is_dir() and info.filename.lower().endswith(exts)]
+
+
+def iter_zip_images(zf, exts=IMG_EXTS, entradas=None):
+    """
+    Lê as imagens do ZIP uma a uma, sem carregar o arquivo inteiro.
+    Gera (nome, bytes) na ordem do ZIP, com nome = nome do arquivo sem extensão.
+    - entradas: só essas entradas (ver zip_entradas), nessa ordem
+    """
+    for name in (entradas if entradas is not None else zip_entradas(zf, exts)):
+        with zf.open(name) as f:
+            yield Path(name).stem, f.read()
+
+
+# -------------------------
+# Estágios com filas limitadas
+# -------------------------
+class _Erro:
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def _put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _FIM
+
+
+def _produzir(source, outq, stop):
+    try:
+        for item in source:
+            if not _put(outq, item, stop):
+                return
+    except BaseException as e:
+        _put(outq, _Erro(e), stop)
+        return
+    _put(outq, _FIM, stop)
+
+
+def _consumir(fn, inq, outq, stop):
+    while True:
+        item = _get(inq, stop)
+        if item is _FIM or isinstance(item, _Erro):
+            _put(outq, item, stop)
+            return
+        try:
+            out = fn(item)
+        except BaseException as e:
+            _put(outq, _Erro(e), stop)
+            return
+        if not _put(outq, out, stop):
+            return
+
+
+def staged(source, stages, maxsize=2):
+    """
+    Encadeia source -> stages[0] -> stages[1] -> ... cada um em sua thread,
+    com filas de tamanho maxsize entre eles. Um estágio lento bloqueia os
+    anteriores (backpressure), então a memória depende de maxsize e não do
+    tamanho da entrada. Gera as saídas do último estágio na ordem de entrada.
+    """
+    stop = threading.Event()
+    filas = [queue.Queue(maxsize=maxsize) for _ in range(len(stages) + 1)]
+    threads = [threading.Thread(target=_produzir, args=(source, filas[0], stop), daemon=True)]
+    for fn, inq, outq in zip(stages, filas[:-1], filas[1:]):
+        threads.append(threading.Thread(target=_consumir, args=(fn, inq, outq, stop), daemon=True))
+    for t in threads:
+        t.start()
+
+    try:
+        while True:
+            item = filas[-1].get()
+            if item is _FIM:
+                return
+            if isinstance(item, _Erro):
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+
+
+def prefetch(source, maxsize=2):
+    """
+    Lê source numa thread separada, mantendo no máximo maxsize itens à frente.
+    """
+    return staged(source, [], maxsize=maxsize)
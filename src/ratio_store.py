@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from src.dedupe import distancias
+from src.layout_cache import LAYOUT_VERSION, DEFAULT_CACHE_DIR
+
+
+def content_hash(dados):
+    """
+    Hash do arquivo da prova (bytes como vieram, sem decodificar).
+    - dados: bytes ou caminho em disco
+    """
+    if not isinstance(dados, (bytes, bytearray, memoryview)):
+        with open(dados, "rb") as f:
+            dados = f.read()
+    return hashlib.sha256(dados).hexdigest()
+
+
+def layout_id(layout):
+    """
+    Identificador do layout: hash das caixas das bolhas e das alternativas.
+    Proporções medidas com um layout só valem para o mesmo layout.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps({
+        "questions": [[q["qid"], q["boxes"]] for q in layout["questions"]],
+        "options": layout["options"],
+        "layout_version": LAYOUT_VERSION,
+    }, sort_keys=True, default=str).encode())
+    return h.hexdigest()[:24]
+
+
+class RatioStore:
+    """
+    Cache em disco do resultado da extração de cada prova: proporção de
+    preenchimento de todas as bolhas e o alinhamento usado, indexados pelo
+    hash do arquivo + id do layout. Com isso uma nova correção (gabarito
+    corrigido, outro limiar) refaz respostas, notas e PDFs sem decodificar
+    nem alinhar nenhuma imagem.
+    Também guarda, pelo hash do arquivo do gabarito, o layout e as respostas
+    corretas, para que a recorreção não precise abrir o gabarito.
+    Para achar cópias que não são o mesmo arquivo (foto recomprimida ou
+    redimensionada), cada layout tem um índice de hashes perceptuais
+    (phash.idx, uma linha "phash hash" por prova) e a miniatura de cada
+    prova (<hash>.mini.npy), ver src/dedupe.py.
+    A eviction (evict, chamada por manter no começo de cada lote) remove as
+    provas sem uso há mais de max_age (segundos), deixa no máximo
+    max_por_layout provas (as mais recentes) em cada layout, para que o índice
+    perceptual e a busca por cópias não cresçam sem limite, e, depois, remove
+    as menos usadas até o store caber em max_bytes.
+    """
+
+    def __init__(self, cache_dir=None, max_age=90 * 24 * 3600, max_bytes=512 * 1024 * 1024,
+                 max_por_layout=5000, intervalo=3600):
+        self.cache_dir = str(cache_dir or os.environ.get("CORRIJA_CACHE_DIR", DEFAULT_CACHE_DIR))
+        self.dir = Path(self.cache_dir) / "ratios"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.max_por_layout = max_por_layout
+        self.intervalo = intervalo
+        self._indices = {}  # lid -> {"ino", "pos": bytes lidos, "phash": [...], "hash": [...]}
+
+    # -------------------------
+    # Arquivos
+    # -------------------------
+    def _ler(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _gravar(self, path, entry):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    # -------------------------
+    # Provas
+    # -------------------------
+    def get(self, lid, h):
+        """
+        Retorna a entrada da prova ({"ratios", "metodo", "alinhamento", "esparso"})
+        ou None se ela ainda não foi corrigida com este layout.
+        """
+        path = self.dir / lid / f"{h}.json"
+        entry = self._ler(path)
+        if entry is not None:
+            try:
+                os.utime(path)  # marca como usada recentemente (LRU pelo mtime)
+            except OSError:
+                pass
+        return entry
+
+    def put(self, lid, result):
+        """
+        Guarda a extração de um resultado de grade_batch (precisa de "hash" e "ratios").
+        """
+        if not result.get("hash") or result.get("ratios") is None:
+            return
+        self._gravar(self.dir / lid / f"{result['hash']}.json", {
+            "created": time.time(),
+            "aluno": result["aluno"],
+            "ratios": result["ratios"],
+            "metodo": result["metodo"],
+            "alinhamento": result["alinhamento"],
+            "esparso": result["esparso"],
+            "phash": result.get("phash"),
+        })
+        if result.get("phash") is not None and result.get("mini") is not None:
+            mini = self.dir / lid / f"{result['hash']}.mini.npy"
+            tmp = mini.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, result["mini"])
+            os.replace(tmp, mini)
+            # uma linha curta por prova, acrescentada de uma vez (O_APPEND)
+            with open(self.dir / lid / "phash.idx", "a", encoding="ascii") as f:
+                f.write(f"{result['phash']:016x} {result['hash']}\n")
+
+    # -------------------------
+    # Cópias parecidas
+    # -------------------------
+    def _indice(self, lid):
+        """
+        Índice de hashes perceptuais do layout, lido de forma incremental
+        (só as linhas acrescentadas desde a última leitura). Quando a eviction
+        reescreve o arquivo (outro inode), ele é lido de novo do começo.
+        """
+        idx = self._indices.get(lid)
+        try:
+            with open(self.dir / lid / "phash.idx", "rb") as f:
+                ino = os.fstat(f.fileno()).st_ino
+                if idx is None or idx["ino"] != ino:
+                    idx = self._indices[lid] = {"ino": ino, "pos": 0, "phash": [], "hash": [], "arr": None}
+                f.seek(idx["pos"])
+                novo = f.read()
+        except OSError:
+            return idx or {"phash": [], "hash": [], "arr": None}
+        fim = novo.rfind(b"\n") + 1  # ignora uma linha ainda pela metade
+        for linha in novo[:fim].decode("ascii", "replace").splitlines():
+            partes = linha.split()
+            if len(partes) == 2:
+                idx["phash"].append(int(partes[0], 16))
+                idx["hash"].append(partes[1])
+        if fim:
+            idx["pos"] += fim
+            idx["arr"] = np.array(idx["phash"], dtype=np.uint64)
+        return idx
+
+    def parecidas(self, lid, ph, dist_max):
+        """
+        Provas do layout com pHash a até dist_max bits de ph, como
+        [(distância, hash)] da mais próxima para a mais distante.
+        """
+        idx = self._indice(lid)
+        if idx["arr"] is None or not len(idx["arr"]):
+            return []
+        d = distancias(ph, idx["arr"])
+        perto = np.flatnonzero(d <= dist_max)
+        return sorted((int(d[i]), idx["hash"][i]) for i in perto)
+
+    def get_mini(self, lid, h):
+        try:
+            return np.load(self.dir / lid / f"{h}.mini.npy")
+        except (OSError, ValueError):
+            return None
+
+    # -------------------------
+    # Gabarito
+    # -------------------------
+    def get_gabarito(self, h):
+        """
+        Retorna (layout, ans_key) do gabarito com esse hash de arquivo, ou None.
+        """
+        entry = self._ler(self.dir / "gabaritos" / f"{h}.json")
+        if entry is None:
+            return None
+        return entry["layout"], {int(k): v for k, v in entry["ans_key"].items()}
+
+    def put_gabarito(self, h, layout, ans_key):
+        self._gravar(self.dir / "gabaritos" / f"{h}.json", {
+            "created": time.time(),
+            "layout_id": layout_id(layout),
+            "layout": layout,
+            "ans_key": {str(k): v for k, v in ans_key.items()},
+        })
+
+    # -------------------------
+    # Eviction
+    # -------------------------
+    def _remover(self, path):
+        path.unlink(missing_ok=True)
+        if path.parent.name != "gabaritos":
+            (path.parent / f"{path.name[:-len('.json')]}.mini.npy").unlink(missing_ok=True)
+
+    def evict(self):
+        """
+        Remove as entradas (com a miniatura) sem uso há mais de max_age
+        segundos, as que passam de max_por_layout no seu layout e, depois, as
+        menos usadas até o store caber em max_bytes. Os índices perceptuais
+        são reescritos só com as provas que continuam no store (uma linha por
+        prova).
+        """
+        agora = time.time()
+        entradas = []
+        for p in self.dir.glob("*/*.json"):
+            mini = p.parent / f"{p.name[:-len('.json')]}.mini.npy"
+            try:
+                st = p.stat()
+                tamanho = st.st_size + (mini.stat().st_size if mini.exists() else 0)
+            except OSError:
+                continue
+            if self.max_age and agora - st.st_mtime > self.max_age:
+                self._remover(p)
+                continue
+            entradas.append((st.st_mtime, tamanho, p))
+
+        entradas.sort(reverse=True)  # mais recentes primeiro
+        total = 0
+        por_layout = {}
+        for _, tamanho, p in entradas:
+            lid = p.parent.name
+            por_layout[lid] = por_layout.get(lid, 0) + 1
+            if self.max_por_layout and lid != "gabaritos" and por_layout[lid] > self.max_por_layout:
+                self._remover(p)
+                continue
+            total += tamanho
+            if self.max_bytes and total > self.max_bytes:
+                self._remover(p)
+
+        # miniaturas sem entrada (ex.: gravação interrompida)
+        for mini in self.dir.glob("*/*.mini.npy"):
+            if not (mini.parent / f"{mini.name[:-len('.mini.npy')]}.json").exists():
+                mini.unlink(missing_ok=True)
+
+        # índices perceptuais: só as provas que continuam no store
+        for idx in self.dir.glob("*/phash.idx"):
+            try:
+                linhas = idx.read_text(encoding="ascii").splitlines(keepends=True)
+            except OSError:
+                continue
+            vivas, vistas = [], set()
+            for l in reversed(linhas):  # a linha mais nova de cada prova
+                partes = l.split()
+                if len(partes) == 2 and partes[1] not in vistas and (idx.parent / f"{partes[1]}.json").exists():
+                    vistas.add(partes[1])
+                    vivas.append(l)
+            vivas.reverse()
+            if len(vivas) < len(linhas):
+                tmp = idx.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp.write_text("".join(vivas), encoding="ascii")
+                os.replace(tmp, idx)
+        self._indices.clear()
+
+    def manter(self):
+        """
+        Roda a eviction se a última foi há mais de intervalo segundos (em
+        qualquer processo: a marca é o mtime de ratios/.evict). Chamada no
+        começo de cada lote (grade_batch com store).
+        """
+        marca = self.dir / ".evict"
+        try:
+            if time.time() - marca.stat().st_mtime < self.intervalo:
+                return False
+        except OSError:
+            pass
+        marca.touch()
+        self.evict()
+        return True
+
+
+_DEFAULT_STORE = None
+
+
+def get_default_store():
+    """
+    Store padrão (em CORRIJA_CACHE_DIR ou ~/.cache/corrija, ao lado dos layouts).
+    """
+    global _DEFAULT_STORE
+    if _DEFAULT_STORE is None:
+        _DEFAULT_STORE = RatioStore()
+    return _DEFAULT_STORE
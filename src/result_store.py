@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+import os
+import csv
+import json
+import time
+import hashlib
+from pathlib import Path
+
+import numpy as np
+
+from src.extract import compare_answers
+from src.scoring import BRANCO, MULTIPLA, codificar_respostas, respostas_de
+
+VERSAO = 5
+
+# Colunas escalares (nome -> dtype). As respostas ficam numa matriz int8
+# (alunos x questões, códigos de src.scoring) ao lado delas.
+COLUNAS = {
+    "aluno": str,
+    "entrada": str,
+    "ok": np.bool_,
+    "erro": str,
+    "metodo": str,
+    "esparso": np.bool_,
+    "nota": np.float64,
+    "acertos": np.int32,
+    "erros": np.int32,
+    "brancos": np.int32,
+    "multiplas": np.int32,
+    "total": np.int32,
+    "duplicata_de": str,
+    "triagem": str,
+    "versao": str,
+}
+
+# Colunas que vêm de result["stats"] (o resto vem direto do resultado)
+_CAMPOS_STATS = {"nota": "score", "acertos": "correct", "erros": "wrong", "brancos": "blank",
+                 "multiplas": "multi", "total": "total"}
+
+
+def duplicata_de(r):
+    """
+    Aluno de quem a prova é cópia, quando é outro nome (possível envio em
+    dobro); "" se não é cópia ou se é o mesmo aluno reenviando a prova.
+    """
+    dup = r.get("duplicata")
+    if not dup or not dup.get("aluno") or dup["aluno"] == r["aluno"]:
+        return ""
+    return dup["aluno"]
+
+
+def motivo_triagem(r):
+    """
+    Motivo da reprovação na triagem (chave de src.triage.MOTIVOS); "" se passou
+    ou não foi triada.
+    """
+    t = r.get("triagem")
+    return t["motivo"] if t and not t["ok"] else ""
+
+
+def assinatura(layout_id, ans_key, **params):
+    """
+    Identifica uma execução: mesmo layout, mesmo gabarito e mesmos parâmetros.
+    Só se retoma uma correção interrompida com a mesma assinatura.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps({"layout_id": layout_id,
+                         "ans_key": {str(k): v for k, v in ans_key.items()},
+                         "params": params}, sort_keys=True, default=str).encode())
+    return h.hexdigest()[:24]
+
+
+class ResultStore:
+    """
+    Resultados de um lote em colunas, gravados em blocos .npz de até
+    linhas_por_bloco alunos, mais um manifesto (manifest.json) com os blocos
+    já confirmados. Um bloco só entra no manifesto depois de gravado (e depois
+    de ao_gravar, ex.: os PDFs), então uma execução interrompida perde no
+    máximo o bloco em andamento e é retomada pulando as provas que já estão
+    em algum bloco. CSV e JSON são gerados a partir dos blocos.
+    feitos tem a entrada de cada prova gravada (o caminho no ZIP ou o nome do
+    arquivo, ver adicionar), e não o nome do aluno: duas provas com o mesmo
+    nome em pastas diferentes são retomadas cada uma. Ele muda a cada
+    adicionar; quem filtra as provas a corrigir usa uma cópia.
+    - qids, options: questões e alternativas (colunas da matriz de respostas);
+      numa prova com várias versões, a união das questões de todas elas
+    - chave: assinatura da execução; com outra assinatura o diretório é zerado
+    - ao_gravar(resultados): chamado com os resultados do bloco antes de confirmá-lo
+    """
+
+    def __init__(self, out_dir, qids, options, chave="", linhas_por_bloco=64, ao_gravar=None):
+        self.dir = Path(out_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.qids = list(qids)
+        self.options = list(options)
+        self.chave = chave
+        self.linhas_por_bloco = linhas_por_bloco
+        self.ao_gravar = ao_gravar
+        self._buffer = []
+        self.manifest = self._abrir()
+        self.feitos = set()
+        for bloco in self._blocos():
+            self.feitos.update(bloco["entrada"].tolist())
+
+    # -------------------------
+    # Manifesto e blocos
+    # -------------------------
+    @property
+    def _manifest_path(self):
+        return self.dir / "manifest.json"
+
+    def _novo_manifest(self):
+        return {"versao": VERSAO, "chave": self.chave, "qids": self.qids, "options": self.options,
+                "criado": time.time(), "linhas": 0, "blocos": []}
+
+    def _abrir(self):
+        try:
+            with open(self._manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+        if manifest is not None and manifest.get("concluido"):
+            manifest = None  # execução anterior terminou: nada a retomar
+        elif manifest is not None and (manifest.get("versao") != VERSAO or manifest.get("chave") != self.chave
+                                       or manifest.get("qids") != self.qids
+                                       or manifest.get("options") != self.options):
+            print("[WARN] Resultados anteriores são de outra correção (gabarito ou parâmetros); recomeçando")
+            manifest = None
+        if manifest is None:
+            for p in self.dir.glob("bloco_*.npz"):
+                p.unlink(missing_ok=True)
+            manifest = self._novo_manifest()
+            self._salvar_manifest(manifest)
+        return manifest
+
+    def _salvar_manifest(self, manifest):
+        tmp = self._manifest_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp, self._manifest_path)
+
+    def _blocos(self):
+        """
+        Gera os blocos confirmados, um de cada vez (dict coluna -> array).
+        """
+        for info in self.manifest["blocos"]:
+            with np.load(self.dir / info["arquivo"]) as z:
+                yield {k: z[k] for k in z.files}
+
+    # -------------------------
+    # Escrita
+    # -------------------------
+    def __len__(self):
+        return self.manifest["linhas"] + len(self._buffer)
+
+    def adicionar(self, r, entrada=None):
+        """
+        Acrescenta um resultado de grade_batch. Grava o bloco quando enche.
+        - entrada: de onde veio a prova (caminho no ZIP, nome do arquivo);
+          sem ela, o nome do aluno
+        """
+        r["entrada"] = entrada or r.get("entrada") or r["aluno"]
+        self._buffer.append(r)
+        self.feitos.add(r["entrada"])
+        if len(self._buffer) >= self.linhas_por_bloco:
+            self.gravar()
+
+    def gravar(self):
+        """
+        Grava o bloco em andamento (se houver) e o confirma no manifesto.
+        """
+        if not self._buffer:
+            return
+        bloco = self._buffer
+        if self.ao_gravar is not None:
+            self.ao_gravar(bloco)
+
+        colunas = {}
+        for nome, tipo in COLUNAS.items():
+            colunas[nome] = np.array([self._valor(r, nome) for r in bloco], dtype=tipo)
+        oks = [r for r in bloco if r["ok"]]
+        respostas = np.full((len(bloco), len(self.qids)), BRANCO, dtype=np.int8)
+        if oks:
+            linhas = [i for i, r in enumerate(bloco) if r["ok"]]
+            respostas[linhas] = codificar_respostas((respostas_de(r["stats"]["per_q"]) for r in oks),
+                                                    self.qids, self.options)
+        colunas["respostas"] = respostas
+
+        arquivo = f"bloco_{len(self.manifest['blocos']):05d}.npz"
+        tmp = self.dir / f"{arquivo}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **colunas)
+        os.replace(tmp, self.dir / arquivo)
+
+        self.manifest["blocos"].append({"arquivo": arquivo, "linhas": len(bloco),
+                                        "primeiro": bloco[0]["aluno"], "ultimo": bloco[-1]["aluno"]})
+        self.manifest["linhas"] += len(bloco)
+        self.manifest["atualizado"] = time.time()
+        self._salvar_manifest(self.manifest)
+        self._buffer = []
+
+    def fechar(self):
+        self.gravar()
+        self.manifest["concluido"] = True
+        self._salvar_manifest(self.manifest)
+
+    @staticmethod
+    def _valor(r, nome):
+        if nome == "duplicata_de":
+            return duplicata_de(r)
+        if nome == "triagem":
+            return motivo_triagem(r)
+        if nome in _CAMPOS_STATS:
+            return (r.get("stats") or {}).get(_CAMPOS_STATS[nome], 0)
+        return r.get(nome) or COLUNAS[nome]()
+
+    # -------------------------
+    # Leitura e exportação
+    # -------------------------
+    def linhas(self, so_ok=True):
+        """
+        Gera um dict por aluno (colunas escalares), na ordem em que foram corrigidos.
+        Só lê blocos confirmados: chame gravar()/fechar() antes.
+        """
+        for bloco in self._blocos():
+            n = len(bloco["aluno"])
+            cols = {nome: bloco[nome].tolist() for nome in COLUNAS}
+            for i in range(n):
+                if so_ok and not cols["ok"][i]:
+                    continue
+                yield {nome: cols[nome][i] for nome in COLUNAS}
+
+    def matriz(self, versao=None, qids=None):
+        """
+        Turma corrigida como (alunos, R), com R int8 alunos x questões (ver src.scoring).
+        - versao: só os alunos dessa versão da prova
+        - qids: só essas colunas, nessa ordem (ex.: as questões da versão)
+        """
+        cols = [self.qids.index(q) for q in qids] if qids is not None else slice(None)
+        alunos, partes = [], []
+        for bloco in self._blocos():
+            ok = bloco["ok"]
+            if versao is not None:
+                ok = ok & (bloco["versao"] == str(versao))
+            alunos.extend(bloco["aluno"][ok].tolist())
+            partes.append(bloco["respostas"][ok][:, cols])
+        n = len(qids) if qids is not None else len(self.qids)
+        R = np.concatenate(partes) if partes else np.zeros((0, n), dtype=np.int8)
+        return alunos, R
+
+    def relatorios(self, ans_key, meta=None, chaves=None):
+        """
+        Gera (meta, per_q) de cada aluno corrigido, refeitos a partir das
+        respostas guardadas (ex.: para o PDF da turma).
+        - chaves: {versão: gabarito} de uma prova com várias versões; cada
+          aluno é comparado com o da sua versão (ans_key nas demais)
+        """
+        chaves = chaves or {}
+        for bloco in self._blocos():
+            for i in np.flatnonzero(bloco["ok"]):
+                linha = bloco["respostas"][i]
+                ans = {qid: self.options[c] if c >= 0 else "" for qid, c in zip(self.qids, linha.tolist())}
+                multi = {qid for qid, c in zip(self.qids, linha.tolist()) if c == MULTIPLA}
+                chave = chaves.get(str(bloco["versao"][i]), ans_key)
+                stats = compare_answers(ans, chave, multi)
+                m = dict(meta or {})
+                m.update({"aluno": str(bloco["aluno"][i]), "score": stats["score"],
+                          "correct": stats["correct"], "total": len(chave),
+                          "percentual": stats["score"]})
+                yield m, stats["per_q"]
+
+    def exportar_csv(self, path, campos, so_ok=True, formatos=None):
+        """
+        CSV com as colunas pedidas. formatos: {coluna: "{:.1f}"} opcional.
+        """
+        formatos = formatos or {}
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(campos)
+            for linha in self.linhas(so_ok=so_ok):
+                writer.writerow([formatos[c].format(linha[c]) if c in formatos else linha[c] for c in campos])
+        return path
+
+    def exportar_revisao(self, path):
+        """
+        CSV das provas que não foram corrigidas e precisam de um olhar humano:
+        aluno, motivo (da triagem, ou "erro" para falhas depois dela) e a mensagem.
+        """
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["aluno", "motivo", "erro"])
+            for linha in self.linhas(so_ok=False):
+                if not linha["ok"]:
+                    writer.writerow([linha["aluno"], linha["triagem"] or "erro", linha["erro"]])
+        return path
+
+    def exportar_json(self, path, campos, so_ok=True):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([{c: linha[c] for c in campos} for linha in self.linhas(so_ok=so_ok)],
+                      f, ensure_ascii=False, indent=2)
+        return path
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+import csv
+
+import numpy as np
+
+# Códigos da matriz de respostas (valores >= 0 são o índice da alternativa)
+BRANCO = -1
+MULTIPLA = -2
+
+# Fração da turma em cada grupo (superior/inferior) do índice de discriminação
+GRUPO_DISCRIMINACAO = 0.27
+
+
+# -------------------------
+# Matrizes (alunos x questões)
+# -------------------------
+def codificar_respostas(linhas, qids, options):
+    """
+    Matriz int8 (alunos x questões) com o índice da alternativa marcada,
+    BRANCO para "" e MULTIPLA para listas com mais de uma letra (ou para o
+    próprio código MULTIPLA, ver respostas_de).
+    - linhas: iterável de dicts {qid: letra}, um por aluno
+    """
+    col = {qid: j for j, qid in enumerate(qids)}
+    idx = {op: i for i, op in enumerate(options)}
+    linhas = list(linhas)
+    R = np.full((len(linhas), len(qids)), BRANCO, dtype=np.int8)
+    for i, resp in enumerate(linhas):
+        for qid, ans in resp.items():
+            j = col.get(qid)
+            if j is None or ans == "":
+                continue
+            if isinstance(ans, int) and ans == MULTIPLA:
+                R[i, j] = MULTIPLA
+            elif isinstance(ans, (list, tuple)):
+                if len(ans) > 1:
+                    R[i, j] = MULTIPLA
+                elif ans:
+                    R[i, j] = idx.get(ans[0], BRANCO)
+            else:
+                R[i, j] = idx.get(ans, BRANCO)
+    return R
+
+
+def respostas_de(per_q):
+    """
+    Respostas de um aluno ({qid: letra}) a partir do per_q de compare_answers,
+    com MULTIPLA nas questões lidas com múltipla marcação (resposta "").
+    """
+    return {qid: MULTIPLA if d["result"] == "multi" else d["student"] for qid, d in per_q.items()}
+
+
+def codificar_chave(ans_key, qids, options):
+    """
+    Máscara bool (questões x alternativas) do gabarito; uma questão pode ter
+    várias alternativas corretas (lista). Questão sem resposta no gabarito
+    ("") fica sem nenhuma correta, como em compare_answers.
+    """
+    idx = {op: i for i, op in enumerate(options)}
+    K = np.zeros((len(qids), len(options)), dtype=bool)
+    for j, qid in enumerate(qids):
+        key = ans_key.get(qid, "")
+        for op in (key if isinstance(key, (list, tuple)) else [key]):
+            if op in idx:
+                K[j, idx[op]] = True
+    return K
+
+
+def matriz_de_resultados(resultados, ans_key, options):
+    """
+    Monta a turma a partir dos resultados de grade_batch (só os corrigidos).
+    Retorna (alunos, qids, R, K).
+    """
+    qids = list(ans_key.keys())
+    oks = [r for r in resultados if r["ok"]]
+    alunos = [r["aluno"] for r in oks]
+    R = codificar_respostas((respostas_de(r["stats"]["per_q"]) for r in oks), qids, options)
+    return alunos, qids, R, codificar_chave(ans_key, qids, options)
+
+
+# -------------------------
+# Correção vetorizada
+# -------------------------
+def corrigir_turma(R, K):
+    """
+    Corrige a turma inteira de uma vez.
+    - R: matriz de respostas (alunos x questões), ver codificar_respostas
+    - K: máscara do gabarito (questões x alternativas), ver codificar_chave
+    Retorna dict com a matriz de acertos e, por aluno, correct/wrong/blank/multi/score
+    (mesmas contas de compare_answers).
+    """
+    n_q = R.shape[1]
+    marcada = R >= 0
+    acerto = marcada & K[np.arange(n_q), np.maximum(R, 0)]
+    correct = acerto.sum(axis=1)
+    blank = (R == BRANCO).sum(axis=1)
+    multi = (R == MULTIPLA).sum(axis=1)
+    return {
+        "acerto": acerto,
+        "correct": correct,
+        "wrong": marcada.sum(axis=1) - correct,
+        "blank": blank,
+        "multi": multi,
+        "score": correct * (100.0 / n_q) if n_q else np.zeros(len(R)),
+    }
+
+
+# -------------------------
+# Análise de itens
+# -------------------------
+def analise_itens(R, K, acerto=None, grupo=GRUPO_DISCRIMINACAO):
+    """
+    Estatísticas por questão, todas vetorizadas sobre a turma:
+    - p: índice de acerto (dificuldade)
+    - discriminacao: acerto do grupo superior - acerto do grupo inferior
+      (grupos = `grupo` da turma com maior e menor total)
+    - bisserial: correlação ponto-bisserial entre acertar a questão e o
+      total nas demais questões
+    - contagem: alunos por alternativa (questões x alternativas)
+    - brancos, multiplas: alunos por questão
+    - distrator: alternativa errada mais escolhida (-1 se nenhuma)
+    """
+    if acerto is None:
+        acerto = corrigir_turma(R, K)["acerto"]
+    n_alunos, n_q = R.shape
+    n_op = K.shape[1]
+    X = acerto.astype(np.float64)
+    total = X.sum(axis=1)
+    p = X.mean(axis=0) if n_alunos else np.zeros(n_q)
+
+    # grupos superior e inferior pelo total (ordem estável para empates)
+    discriminacao = np.zeros(n_q)
+    if n_alunos:
+        n_grupo = max(1, int(round(n_alunos * grupo)))
+        ordem = np.argsort(total, kind="stable")
+        discriminacao = X[ordem[-n_grupo:]].mean(axis=0) - X[ordem[:n_grupo]].mean(axis=0)
+
+    # ponto-bisserial corrigido: item contra o total sem ele (resto = total - X).
+    # Como X é 0/1, as somas saem de um único produto X.T @ total.
+    sx = X.sum(axis=0)
+    xt = X.T @ total
+    media_resto = (total.sum() - sx) / max(n_alunos, 1)
+    cov = (xt - sx) - sx * media_resto
+    var_x = sx - sx * p
+    var_resto = (total @ total - 2 * xt + sx) - n_alunos * media_resto ** 2
+    den = np.sqrt(np.maximum(var_x * var_resto, 0.0))
+    bisserial = np.divide(cov, den, out=np.zeros(n_q), where=den > 1e-12)
+
+    # contagem por alternativa: um bincount só para a matriz inteira
+    marcada = R >= 0
+    cols = np.broadcast_to(np.arange(n_q), R.shape)[marcada]
+    contagem = np.bincount(cols * n_op + R[marcada].astype(np.int64),
+                           minlength=n_q * n_op).reshape(n_q, n_op)
+    erradas = np.where(K, -1, contagem)
+    distrator = np.where(erradas.max(axis=1) > 0, erradas.argmax(axis=1), -1)
+
+    return {
+        "p": p,
+        "discriminacao": discriminacao,
+        "bisserial": bisserial,
+        "contagem": contagem,
+        "brancos": (R == BRANCO).sum(axis=0),
+        "multiplas": (R == MULTIPLA).sum(axis=0),
+        "distrator": distrator,
+    }
+
+
+def tabela_itens(analise, qids, options, K):
+    """
+    Linhas (dicts) da análise de itens, uma por questão, para CSV/JSON.
+    """
+    linhas = []
+    for j, qid in enumerate(qids):
+        linha = {
+            "questao": qid,
+            "gabarito": "/".join(op for op, ok in zip(options, K[j]) if ok),
+            "p": round(float(analise["p"][j]), 4),
+            "discriminacao": round(float(analise["discriminacao"][j]), 4),
+            "bisserial": round(float(analise["bisserial"][j]), 4),
+            "brancos": int(analise["brancos"][j]),
+            "multiplas": int(analise["multiplas"][j]),
+            "distrator": options[analise["distrator"][j]] if analise["distrator"][j] >= 0 else "",
+        }
+        for i, op in enumerate(options):
+            linha[op] = int(analise["contagem"][j, i])
+        linhas.append(linha)
+    return linhas
+
+
+def salvar_itens_csv(path, linhas):
+    if not linhas:
+        return path
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(linhas[0].keys()))
+        writer.writeheader()
+        writer.writerows(linhas)
+    return path
+
+
+def analisar_matriz(R, ans_key, options):
+    """
+    Atalho: matriz de respostas (colunas na ordem de ans_key) -> linhas da análise de itens.
+    """
+    qids = list(ans_key.keys())
+    K = codificar_chave(ans_key, qids, options)
+    return tabela_itens(analise_itens(R, K), qids, options, K)
+
+
+def analisar_resultados(resultados, ans_key, options):
+    """
+    Atalho: resultados de grade_batch -> linhas da análise de itens.
+    """
+    _, qids, R, K = matriz_de_resultados(resultados, ans_key, options)
+    return tabela_itens(analise_itens(R, K), qids, options, K)
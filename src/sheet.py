@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+import cv2
+
+from src.layout import preprocess
+
+
+class Sheet:
+    """
+    Buffers de uma folha alinhada (cinza, binarizações, imagem de debug),
+    calculados só quando alguém pede e no máximo uma vez. Extração, overlays
+    de debug e demais estágios compartilham o mesmo objeto.
+    """
+
+    def __init__(self, warped):
+        self.img = warped
+        self._gray = None
+        self._thr = None
+        self._thr_extracao = None
+
+    @property
+    def shape(self):
+        return self.img.shape[:2]
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = self.img if self.img.ndim == 2 else cv2.cvtColor(self.img, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    @property
+    def thr(self):
+        """
+        Binarização usada no aprendizado do layout (CLAHE + blur + limiar
+        adaptativo + abertura), que limpa os contornos das bolhas.
+        """
+        if self._thr is None:
+            self._thr = preprocess(self.gray)
+        return self._thr
+
+    @property
+    def thr_extracao(self):
+        """
+        Binarização usada na leitura das bolhas: só o limiar adaptativo
+        gaussiano. A abertura do preprocess apaga marcas fracas.
+        """
+        if self._thr_extracao is None:
+            self._thr_extracao = cv2.adaptiveThreshold(self.gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                                       cv2.THRESH_BINARY_INV, 35, 10)
+        return self._thr_extracao
+
+    def debug_canvas(self):
+        """
+        Cópia colorida para desenhar overlays (criada a cada chamada, só para debug).
+        """
+        if self.img.ndim == 2:
+            return cv2.cvtColor(self.img, cv2.COLOR_GRAY2BGR)
+        return self.img.copy()
+
+
+def as_sheet(img_or_sheet):
+    return img_or_sheet if isinstance(img_or_sheet, Sheet) else Sheet(img_or_sheet)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+import cv2
+import numpy as np
+
+from src.extract import choose_option
+from src.sheet import Sheet
+
+# Margem (px no referencial) em volta das bolhas de cada questão. Cobre a
+# janela do limiar adaptativo (35x35) da extração, para que a binarização
+# das bolhas seja a mesma da folha inteira.
+ROI_MARGIN = 20
+
+
+# -------------------------
+# Plano de recortes (um por layout)
+# -------------------------
+def _bbox(boxes, ref_w, ref_h, margin):
+    b = np.array(boxes, dtype=np.int64)
+    return [max(0, int(b[:, 0].min()) - margin),
+            max(0, int(b[:, 1].min()) - margin),
+            min(ref_w, int((b[:, 0] + b[:, 2]).max()) + margin),
+            min(ref_h, int((b[:, 1] + b[:, 3]).max()) + margin)]
+
+
+def _merge_regions(caixas):
+    """
+    Junta regiões que se sobrepõem (questões vizinhas numa mesma coluna),
+    para que nenhum pixel seja amostrado duas vezes. Retorna
+    [(bbox, [índices das questões])].
+    """
+    grupos = []
+    for i in sorted(range(len(caixas)), key=lambda i: (caixas[i][1], caixas[i][0])):
+        x0, y0, x1, y1 = caixas[i]
+        for g in grupos:
+            gx0, gy0, gx1, gy1 = g[0]
+            if x0 < gx1 and gx0 < x1 and y0 < gy1 and gy0 < y1:
+                g[0] = [min(x0, gx0), min(y0, gy0), max(x1, gx1), max(y1, gy1)]
+                g[1].append(i)
+                break
+        else:
+            grupos.append([[x0, y0, x1, y1], [i]])
+    return grupos
+
+
+def _build_plan(boxes_per_q, ref_w, ref_h, margin):
+    """
+    Regiões (caixa das bolhas + margem, unidas quando se sobrepõem) empilhadas
+    num mosaico de largura fixa. Retorna (regioes, largura, altura, boxes_mosaico),
+    com regioes = [(x0, y0, h, y_mosaico)].
+    """
+    com_bolhas = [i for i, boxes in enumerate(boxes_per_q) if boxes]
+    caixas = [_bbox(boxes_per_q[i], ref_w, ref_h, margin) for i in com_bolhas]
+    grupos = _merge_regions(caixas)
+
+    largura = max([x1 - x0 for (x0, _, x1, _), _ in grupos], default=0)
+    boxes_mosaico = [[] for _ in boxes_per_q]
+    regioes = []
+    y_mosaico = 0
+    for (x0, y0, _, y1), membros in grupos:
+        h = y1 - y0
+        regioes.append((x0, y0, h, y_mosaico))
+        for j in membros:
+            q = com_bolhas[j]
+            boxes_mosaico[q] = [[x - x0, y - y0 + y_mosaico, w, bh] for (x, y, w, bh) in boxes_per_q[q]]
+        y_mosaico += h
+    return regioes, largura, y_mosaico, boxes_mosaico
+
+
+_PLAN_CACHE = {}
+_PLAN_CACHE_MAX = 8
+
+
+def sparse_plan(layout, ref_w=1000, ref_h=1400, margin=ROI_MARGIN):
+    """
+    Plano de amostragem do layout (com cache): regiões no referencial e um
+    layout "virtual" com as bolhas nas coordenadas do mosaico.
+    """
+    boxes_per_q = tuple(tuple(map(tuple, q["boxes"])) for q in layout["questions"])
+    key = (boxes_per_q, ref_w, ref_h, margin)
+    plan = _PLAN_CACHE.get(key)
+    if plan is None:
+        if len(_PLAN_CACHE) >= _PLAN_CACHE_MAX:
+            _PLAN_CACHE.pop(next(iter(_PLAN_CACHE), None), None)  # outra thread pode ter removido
+        regioes, largura, altura, boxes_mosaico = _build_plan(boxes_per_q, ref_w, ref_h, margin)
+        virtual = {
+            "questions": [dict(q, boxes=b) for q, b in zip(layout["questions"], boxes_mosaico)],
+            "options": layout["options"],
+        }
+        plan = {
+            "regioes": regioes,
+            "largura": largura,
+            "altura": altura,
+            "layout": virtual,
+            "fracao": (largura * altura) / float(ref_w * ref_h),
+        }
+        _PLAN_CACHE[key] = plan
+    return plan
+
+
+# -------------------------
+# Amostragem pela homografia
+# -------------------------
+def sample_regions(img, M, plan):
+    """
+    Monta o mosaico das regiões do plano direto da foto: cada faixa é um
+    warpPerspective pequeno com a homografia inversa composta com a translação
+    da região. A página inteira nunca é retificada.
+    - M: homografia foto -> referencial (estimate_homography)
+    """
+    largura, altura = plan["largura"], plan["altura"]
+    shape = (altura, largura) if img.ndim == 2 else (altura, largura, img.shape[2])
+    mosaico = np.empty(shape, dtype=img.dtype)
+    Minv = np.linalg.inv(M)
+    for (x0, y0, h, ym) in plan["regioes"]:
+        T = np.array([[1, 0, x0], [0, 1, y0], [0, 0, 1]], dtype=np.float64)
+        cv2.warpPerspective(img, Minv @ T, (largura, h), dst=mosaico[ym:ym + h],
+                            flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP)
+    return mosaico
+
+
+def choose_option_sparse(img, M, layout, ref_w=1000, ref_h=1400, **kwargs):
+    """
+    Igual a choose_option sobre a folha alinhada, mas lendo só as regiões das
+    bolhas. Retorna (answers, metrics, fracao), com fracao = pixels amostrados /
+    pixels da folha de referência.
+    """
+    plan = sparse_plan(layout, ref_w, ref_h)
+    if not plan["regioes"]:
+        return {q["qid"]: "" for q in layout["questions"]}, {}, 0.0
+    mosaico = Sheet(sample_regions(img, M, plan))
+    answers, metrics = choose_option(mosaico, plan["layout"], **kwargs)
+    return answers, metrics, plan["fracao"]
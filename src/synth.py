@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+import os
+import json
+import argparse
+
+import cv2
+import numpy as np
+
+LETRAS = "ABCDEFGH"
+REF_W, REF_H = 1000, 1400
+PADROES = ("cheio", "parcial", "x", "fraco")
+MARCADORES = ("aruco", "borda")
+
+
+# -------------------------
+# Folha (no referencial)
+# -------------------------
+def posicoes_bolhas(n_questoes, n_opcoes=5, colunas=2, ref_w=REF_W, ref_h=REF_H):
+    """
+    Centro das bolhas e raio. Retorna (centros, raio), com centros[i] = lista
+    de (cx, cy) da questão i+1. A numeração segue a do learn_layout_from_key:
+    linha a linha, da esquerda para a direita.
+    """
+    linhas = -(-n_questoes // colunas)
+    util = ref_w - 280  # fora das faixas dos marcadores
+    passo_y = min(55.0, (ref_h - 380) / max(linhas, 1))
+    passo_x = min(50.0, util / (colunas * (n_opcoes - 1) + (colunas - 1) * 2.5))
+    raio = int(max(8, min(15, passo_y * 0.28, passo_x * 0.3)))
+    largura_bloco = (n_opcoes - 1) * passo_x
+    espaco = (util - colunas * largura_bloco) / (colunas - 1) if colunas > 1 else 0.0
+    x_ini = (ref_w - (colunas * largura_bloco + (colunas - 1) * espaco)) / 2
+
+    centros = []
+    for q in range(n_questoes):
+        linha, col = divmod(q, colunas)
+        cy = 200 + linha * passo_y
+        x0 = x_ini + col * (largura_bloco + espaco)
+        centros.append([(int(round(x0 + o * passo_x)), int(round(cy))) for o in range(n_opcoes)])
+    return centros, raio
+
+
+def _marcar(img, cx, cy, raio, padrao):
+    r = raio - 3
+    if padrao == "cheio":
+        cv2.circle(img, (cx, cy), raio, (0, 0, 0), -1)  # cobre o anel, como caneta
+    elif padrao == "parcial":
+        cv2.circle(img, (cx, cy), int(r * 0.7), (0, 0, 0), -1)
+    elif padrao == "x":
+        d = int(r * 0.75)
+        cv2.line(img, (cx - d, cy - d), (cx + d, cy + d), (0, 0, 0), 4)
+        cv2.line(img, (cx - d, cy + d), (cx + d, cy - d), (0, 0, 0), 4)
+    elif padrao == "fraco":
+        cv2.circle(img, (cx, cy), r, (110, 110, 110), -1)
+    else:
+        raise ValueError(f"Padrão de preenchimento desconhecido: {padrao}")
+
+
+def desenhar_folha(marcas, n_opcoes=5, colunas=2, marcador="aruco", padrao="cheio",
+                   ref_w=REF_W, ref_h=REF_H, versao=None):
+    """
+    Folha limpa no referencial (ref_w x ref_h).
+    - marcas: por questão, índices das alternativas marcadas
+    - marcador: "aruco" (IDs 0..3 em TL, TR, BR, BL) ou "borda" (moldura impressa,
+      aberta no meio de cada lado: uma moldura fechada envolveria as bolhas e o
+      detect_bubbles, que só olha contornos externos, não as veria)
+    - padrao: como a bolha é preenchida (PADROES)
+    - versao: ID ArUco (>= 4) do marcador de versão, no alto, ao centro (None: sem)
+    """
+    img = np.full((ref_h, ref_w, 3), 255, np.uint8)
+    d = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
+    s = 80
+    if marcador == "aruco":
+        for i, (x, y) in enumerate([(20, 20), (ref_w - 100, 20), (ref_w - 100, ref_h - 100), (20, ref_h - 100)]):
+            img[y:y + s, x:x + s] = cv2.aruco.generateImageMarker(d, i, s)[..., None]
+    elif marcador == "borda":
+        x0, y0, x1, y1 = 30, 30, ref_w - 31, ref_h - 31
+        dx, dy = int((x1 - x0) * 0.4), int((y1 - y0) * 0.4)
+        for (cx, cy, sx, sy) in [(x0, y0, 1, 1), (x1, y0, -1, 1), (x1, y1, -1, -1), (x0, y1, 1, -1)]:
+            cv2.line(img, (cx, cy), (cx + sx * dx, cy), (0, 0, 0), 8)
+            cv2.line(img, (cx, cy), (cx, cy + sy * dy), (0, 0, 0), 8)
+    else:
+        raise ValueError(f"Marcador desconhecido: {marcador}")
+    if versao is not None:
+        x = (ref_w - s) // 2
+        img[40:40 + s, x:x + s] = cv2.aruco.generateImageMarker(d, int(versao), s)[..., None]
+
+    centros, raio = posicoes_bolhas(len(marcas), n_opcoes, colunas, ref_w, ref_h)
+    for bolhas, marcadas in zip(centros, marcas):
+        for o, (cx, cy) in enumerate(bolhas):
+            cv2.circle(img, (cx, cy), raio, (0, 0, 0), 2)
+            if o in marcadas:
+                _marcar(img, cx, cy, raio, padrao)
+    return img
+
+
+# -------------------------
+# "Foto" da folha
+# -------------------------
+def fotografar(folha, rng, megapixels=4.0, angulo=0.0, perspectiva=0.0, blur=0.0, ruido=0.0,
+               fundo=60):
+    """
+    Simula a foto: folha sobre um fundo, girada `angulo` graus, com os cantos
+    deslocados até `perspectiva` x lado (perspectiva), redimensionada para
+    ~megapixels, com desfoque gaussiano (sigma = blur) e ruído (desvio = ruido).
+    """
+    h, w = folha.shape[:2]
+    pad = int(0.12 * max(h, w))
+    src = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+
+    # rotação em torno do centro + deslocamento aleatório de cada canto
+    centro = np.float32([w / 2, h / 2])
+    t = np.deg2rad(angulo)
+    R = np.float32([[np.cos(t), np.sin(t)], [-np.sin(t), np.cos(t)]])
+    dst = (src - centro) @ R.T + centro
+    dst += rng.uniform(-perspectiva, perspectiva, size=(4, 2)).astype(np.float32) * min(w, h)
+
+    # enquadra com margem de fundo e escala para o tamanho pedido
+    dst -= dst.min(axis=0) - pad
+    out_w, out_h = dst.max(axis=0) + pad
+    escala = np.sqrt(megapixels * 1e6 / (out_w * out_h))
+    dst *= escala
+    out_w, out_h = int(out_w * escala), int(out_h * escala)
+
+    M = cv2.getPerspectiveTransform(src, dst.astype(np.float32))
+    foto = cv2.warpPerspective(folha, M, (out_w, out_h), flags=cv2.INTER_LINEAR,
+                               borderMode=cv2.BORDER_CONSTANT, borderValue=(fundo, fundo, fundo))
+    if blur > 0:
+        foto = cv2.GaussianBlur(foto, (0, 0), blur)
+    if ruido > 0:
+        n = rng.standard_normal((out_h, out_w, 1), dtype=np.float32) * ruido
+        foto = np.clip(foto + n, 0, 255).astype(np.uint8)
+    return foto
+
+
+# -------------------------
+# Gabarito e lote com verdade conhecida
+# -------------------------
+def _foto_params(rng, angulo_max, perspectiva, blur, ruido, megapixels):
+    return {
+        "megapixels": megapixels,
+        "angulo": float(rng.uniform(-angulo_max, angulo_max)),
+        "perspectiva": perspectiva,
+        "blur": blur,
+        "ruido": ruido,
+    }
+
+
+def gerar_gabarito(seed=0, n_questoes=40, n_opcoes=5, colunas=2, marcador="aruco",
+                   megapixels=4.0, angulo_max=4.0, perspectiva=0.02, blur=0.8, ruido=4.0, versao=None):
+    """
+    Gabarito sintético: uma alternativa cheia por questão. versao: ID do
+    marcador de versão impresso na folha (desenhar_folha), repetido nas provas
+    dos alunos.
+    Retorna dict com nome, img, respostas ({qid: letra}) e params.
+    """
+    rng = np.random.default_rng([seed, 0])
+    corretas = rng.integers(0, n_opcoes, n_questoes)
+    folha = desenhar_folha([(int(c),) for c in corretas], n_opcoes, colunas, marcador, "cheio", versao=versao)
+    params = _foto_params(rng, angulo_max, perspectiva, blur, ruido, megapixels)
+    return {
+        "nome": "gabarito",
+        "img": fotografar(folha, rng, **params),
+        "respostas": {q + 1: LETRAS[int(c)] for q, c in enumerate(corretas)},
+        "params": dict(params, marcador=marcador, n_opcoes=n_opcoes, colunas=colunas, versao=versao),
+    }
+
+
+def _sortear_marcas(rng, corretas, n_opcoes, acerto, p_branco, p_multipla):
+    """
+    Marcas de um aluno (índices por questão) e as respostas esperadas.
+    """
+    marcas, respostas = [], {}
+    for q, c in enumerate(corretas):
+        escolha = c if rng.random() < acerto else int(rng.integers(0, n_opcoes))
+        sorteio = rng.random()
+        if sorteio < p_branco:
+            marcas.append(())
+            respostas[q + 1] = ""
+        elif sorteio < p_branco + p_multipla:
+            outra = (escolha + 1 + int(rng.integers(0, n_opcoes - 1))) % n_opcoes
+            marcas.append((escolha, outra))
+            respostas[q + 1] = ""
+        else:
+            marcas.append((escolha,))
+            respostas[q + 1] = LETRAS[escolha]
+    return marcas, respostas
+
+
+def gerar_lote(n, gabarito, seed=0, acerto=0.7, p_branco=0.05, p_multipla=0.02, padroes=PADROES,
+               megapixels=None, angulo_max=4.0, perspectiva=0.02, blur=0.8, ruido=4.0):
+    """
+    Gera n provas de alunos para o gabarito, uma a uma (deterministicamente a
+    partir de seed). Cada prova é um dict com nome, img, respostas ({qid: letra,
+    "" para branco ou múltipla}), multiplas (qids com duas marcas) e params.
+    - acerto: probabilidade de marcar a alternativa correta
+    - padroes: padrões de preenchimento sorteados por prova
+    """
+    gp = gabarito["params"]
+    n_opcoes, colunas, marcador = gp["n_opcoes"], gp["colunas"], gp["marcador"]
+    corretas = [LETRAS.index(a) for _, a in sorted(gabarito["respostas"].items())]
+    megapixels = megapixels or gp["megapixels"]
+
+    for i in range(n):
+        rng = np.random.default_rng([seed, i + 1])
+        padrao = padroes[int(rng.integers(0, len(padroes)))]
+        marcas, respostas = _sortear_marcas(rng, corretas, n_opcoes, acerto, p_branco, p_multipla)
+        folha = desenhar_folha(marcas, n_opcoes, colunas, marcador, padrao, versao=gp.get("versao"))
+        params = _foto_params(rng, angulo_max, perspectiva, blur, ruido, megapixels)
+        yield {
+            "nome": f"aluno{i:04d}",
+            "img": fotografar(folha, rng, **params),
+            "respostas": respostas,
+            "multiplas": [q + 1 for q, m in enumerate(marcas) if len(m) > 1],
+            "params": dict(params, padrao=padrao),
+        }
+
+
+def encode_jpeg(img, qualidade=90):
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, qualidade])
+    if not ok:
+        raise RuntimeError("Falha ao codificar JPEG")
+    return buf.tobytes()
+
+
+# -------------------------
+# Vídeo: folhas mostradas uma a uma para a câmera
+# -------------------------
+def _fundo_video(rng, largura, altura):
+    fundo = rng.normal(90, 25, (altura // 8, largura // 8)).astype(np.float32)
+    fundo = cv2.resize(cv2.GaussianBlur(fundo, (0, 0), 2), (largura, altura), interpolation=cv2.INTER_LINEAR)
+    return cv2.cvtColor(np.clip(fundo, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+
+
+def gerar_video(path, gabarito, n_folhas=3, seed=0, largura=1280, altura=720, fps=25,
+                entrada=12, parada=40, saida=12, vazio=8, tremor=0.4, ruido=3.0, acerto=0.7):
+    """
+    Grava um vídeo sintético (mp4) em que n_folhas provas de alunos entram no
+    quadro, ficam paradas `parada` quadros (com um leve tremor de mão, em px)
+    e saem, com `vazio` quadros sem folha entre uma e outra.
+    Retorna a verdade: por folha, respostas e o intervalo de quadros parada.
+    """
+    gp = gabarito["params"]
+    n_opcoes, colunas, marcador = gp["n_opcoes"], gp["colunas"], gp["marcador"]
+    corretas = [LETRAS.index(a) for _, a in sorted(gabarito["respostas"].items())]
+    rng = np.random.default_rng([seed, 1000])
+    fundo = _fundo_video(rng, largura, altura)
+    src = np.float32([[0, 0], [REF_W, 0], [REF_W, REF_H], [0, REF_H]])
+
+    escritor = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (largura, altura))
+    if not escritor.isOpened():
+        raise RuntimeError(f"Falha ao criar o vídeo: {path}")
+    verdade, quadro = [], 0
+
+    def gravar(img):
+        if ruido > 0:
+            img = np.clip(img + rng.normal(0, ruido, img.shape[:2])[..., None], 0, 255).astype(np.uint8)
+        escritor.write(img)
+
+    try:
+        for i in range(n_folhas):
+            marcas, respostas = _sortear_marcas(rng, corretas, n_opcoes, acerto, 0.05, 0.02)
+            folha = desenhar_folha(marcas, n_opcoes, colunas, marcador, "cheio", versao=gp.get("versao"))
+
+            # posição parada: folha com ~90% da altura, girada e em perspectiva leve
+            escala = 0.9 * altura / REF_H
+            t = np.deg2rad(rng.uniform(-6, 6))
+            R = np.float32([[np.cos(t), -np.sin(t)], [np.sin(t), np.cos(t)]])
+            centro = np.float32([largura / 2 + rng.uniform(-0.1, 0.1) * largura, altura / 2])
+            base = (src - src.mean(axis=0)) * escala @ R.T + centro
+            base += rng.uniform(-0.015, 0.015, (4, 2)).astype(np.float32) * altura
+
+            fora = largura * 0.5 + REF_W * escala
+            deslocamentos = ([fora * (1 - k / entrada) for k in range(entrada)] + [0.0] * parada
+                             + [-fora * (k + 1) / saida for k in range(saida)])
+            inicio = quadro + entrada
+            tremor_xy = np.zeros(2, np.float32)
+            for dx in deslocamentos:
+                tremor_xy = 0.7 * tremor_xy + rng.normal(0, tremor, 2).astype(np.float32)
+                dst = base + np.float32([dx, 0]) + tremor_xy
+                M = cv2.getPerspectiveTransform(src, dst.astype(np.float32))
+                img = cv2.warpPerspective(folha, M, (largura, altura), dst=fundo.copy(),
+                                          borderMode=cv2.BORDER_TRANSPARENT)
+                gravar(img)
+                quadro += 1
+            verdade.append({"respostas": respostas, "parada": (inicio, inicio + parada)})
+
+            for _ in range(vazio):
+                gravar(fundo)
+                quadro += 1
+    finally:
+        escritor.release()
+    return verdade
+
+
+# -------------------------
+# CLI: grava um conjunto de teste em disco
+# -------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Gera provas sintéticas com respostas conhecidas")
+    parser.add_argument("--out", required=True, help="Diretório de saída")
+    parser.add_argument("--n", type=int, default=20, help="Número de provas de alunos")
+    parser.add_argument("--questoes", type=int, default=40)
+    parser.add_argument("--opcoes", type=int, default=5)
+    parser.add_argument("--colunas", type=int, default=2)
+    parser.add_argument("--marcador", default="aruco", choices=MARCADORES)
+    parser.add_argument("--mp", type=float, default=4.0, help="Megapixels das fotos")
+    parser.add_argument("--versao", type=int, help="ID ArUco (>= 4) do marcador de versão da prova")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    alunos_dir = os.path.join(args.out, "alunos")
+    os.makedirs(alunos_dir, exist_ok=True)
+    gab = gerar_gabarito(args.seed, args.questoes, args.opcoes, args.colunas, args.marcador, megapixels=args.mp,
+                         versao=args.versao)
+    cv2.imwrite(os.path.join(args.out, "gabarito.jpg"), gab["img"])
+
+    verdade = {"gabarito": gab["respostas"], "alunos": {}}
+    for prova in gerar_lote(args.n, gab, seed=args.seed):
+        cv2.imwrite(os.path.join(alunos_dir, f"{prova['nome']}.jpg"), prova["img"])
+        verdade["alunos"][prova["nome"]] = {"respostas": prova["respostas"], "params": prova["params"]}
+
+    with open(os.path.join(args.out, "verdade.json"), "w", encoding="utf-8") as f:
+        json.dump(verdade, f, ensure_ascii=False, indent=2)
+    print(f"[OK] {args.n} provas em {args.out}")
+
+
+if __name__ == "__main__":
+    main()
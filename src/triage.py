@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+import time
+
+import cv2
+import numpy as np
+
+from src.align.align import _get_aruco_detector, _downscale, find_page_corners, DETECT_MAX_DIM
+
+# Maior lado da miniatura em que as medidas são feitas
+TRIAGEM_LADO = 640
+
+# Exposição (percentis 1 e 99 dos tons de cinza da miniatura): sem papel
+# claro, sem tinta escura, ou quase sem diferença entre os dois
+ESCURA_P99 = 60
+ESTOURADA_P1 = 170
+CONTRASTE_MIN = 40
+
+# Nitidez: variância do laplaciano da miniatura / contraste² (x 1000).
+# Fotos nítidas ficam entre 35 e 115; com desfoque de até sigma 4 px (em
+# 2400 px), que ainda é lido tão bem quanto a foto nítida, entre 6 e 14; com
+# sigma 6, que já erra a maioria das questões, abaixo de 4.
+NITIDEZ_MIN = 5.0
+
+# Fração da imagem coberta pelo contorno da página para ele contar como folha
+# (folhas inteiras na foto ficam acima de 0.3; contornos soltos, abaixo de 0.1)
+COBERTURA_MIN = 0.15
+
+MOTIVOS = {
+    "escura": "imagem escura demais",
+    "estourada": "imagem clara demais (estourada)",
+    "sem_contraste": "imagem sem contraste",
+    "desfocada": "imagem desfocada",
+    "marcadores_faltando": "folha cortada ou coberta (faltam marcadores ArUco)",
+    "sem_folha": "nenhuma folha encontrada (sem marcadores nem contorno da página)",
+}
+
+
+# -------------------------
+# Medidas
+# -------------------------
+def _miniatura(img, lado):
+    """
+    Miniatura em cinza com o maior lado <= lado. O fator inteiro deixa o
+    INTER_AREA (média de blocos, sem aliasing) rápido mesmo em fotos de 12 MP.
+    """
+    h, w = img.shape[:2]
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    k = int(np.ceil(max(h, w) / float(lado)))
+    if k <= 1:
+        return img
+    return cv2.resize(img, None, fx=1.0 / k, fy=1.0 / k, interpolation=cv2.INTER_AREA)
+
+
+def _percentis(gray, ps):
+    """
+    Percentis de uma imagem uint8 pelo histograma (sem ordenar os pixels).
+    """
+    acum = np.cumsum(cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel())
+    return [int(np.searchsorted(acum, p / 100.0 * acum[-1])) for p in ps]
+
+
+def contar_marcadores(gray, max_dim=None):
+    """
+    Quantos dos marcadores ArUco 0..3 aparecem na imagem.
+    """
+    small, _ = _downscale(gray, max_dim)
+    _, ids, _ = _get_aruco_detector().detectMarkers(small)
+    if ids is None:
+        return 0
+    return len({0, 1, 2, 3} & set(ids.ravel().tolist()))
+
+
+def cobertura_pagina(gray):
+    """
+    Fração da imagem dentro do contorno quadrilátero da página (0 se não achar).
+    """
+    try:
+        cantos = find_page_corners(gray, max_dim=None)
+    except Exception:
+        return 0.0
+    return float(cv2.contourArea(np.float32(cantos))) / (gray.shape[0] * gray.shape[1])
+
+
+# -------------------------
+# Decisão
+# -------------------------
+def avaliar(img, metodo="auto_fallback", preferido=None, lado=TRIAGEM_LADO):
+    """
+    Triagem barata de uma prova decodificada, antes do alinhamento: nitidez,
+    exposição, cobertura da página e presença dos marcadores ArUco ou do
+    contorno da folha, medidos numa miniatura.
+    - metodo/preferido: método pedido e o do referencial do layout; com ArUco,
+      marcadores faltando (1 a 3) reprovam a prova
+    Retorna {"ok", "motivo", "descricao", "medidas"}; motivo é uma chave de
+    MOTIVOS (None quando aprovada).
+    """
+    t0 = time.perf_counter()
+    mini = _miniatura(img, lado)
+    p1, p99 = _percentis(mini, (1, 99))
+    contraste = p99 - p1
+    lap = cv2.Laplacian(mini, cv2.CV_32F)
+    nitidez = float(lap.var()) / max(contraste, 1) ** 2 * 1000
+    medidas = {"p1": p1, "p99": p99, "nitidez": round(nitidez, 1)}
+
+    motivo = None
+    if p99 < ESCURA_P99:
+        motivo = "escura"
+    elif p1 > ESTOURADA_P1:
+        motivo = "estourada"
+    elif contraste < CONTRASTE_MIN:
+        motivo = "sem_contraste"
+    elif nitidez < NITIDEZ_MIN:
+        motivo = "desfocada"
+    else:
+        aruco = "aruco" in (metodo, preferido)
+        marcadores = contar_marcadores(mini)
+        if marcadores < 4 and aruco and max(img.shape[:2]) > lado:
+            # marcadores pequenos podem sumir na miniatura: confirma na resolução da detecção
+            marcadores = contar_marcadores(img, DETECT_MAX_DIM)
+        medidas["marcadores"] = marcadores
+        if marcadores < 4:
+            medidas["cobertura"] = round(cobertura_pagina(mini), 3)
+            if aruco and marcadores > 0:
+                motivo = "marcadores_faltando"
+            elif medidas["cobertura"] < COBERTURA_MIN:
+                motivo = "sem_folha"
+
+    medidas["ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    return {"ok": motivo is None, "motivo": motivo, "descricao": MOTIVOS.get(motivo), "medidas": medidas}
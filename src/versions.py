@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+"""
+Provas com várias versões (A, B, C, ...), cada uma com seu layout e seu
+gabarito. O registro guarda as versões e identifica a versão de cada folha
+já alinhada por uma assinatura barata da grade de bolhas (e, entre versões
+com a mesma grade, pelo marcador ArUco de versão), sem corrigir a folha com
+todos os layouts.
+"""
+import cv2
+import numpy as np
+
+from src.align.align import _get_aruco_detector
+from src.ratio_store import layout_id
+
+# A assinatura é comparada no referencial reduzido 1/ESCALA (125 x 175)
+ESCALA = 8
+
+# A versão escolhida precisa de correlação CORR_MIN com a folha e de
+# MARGEM_MIN acima da melhor versão com outra grade. Folhas da versão certa
+# ficam entre 0.45 e 0.65, com margem de 0.13 ou mais mesmo quando a outra
+# grade contém a dela (40 e 50 questões); as demais versões, abaixo de 0.37.
+CORR_MIN = 0.35
+MARGEM_MIN = 0.1
+
+# Versões com assinaturas mais parecidas que isso têm a mesma grade de
+# bolhas (gabaritos fotografados diferentes do mesmo modelo ficam acima de
+# 0.9) e só se separam pelo marcador de versão
+MESMA_GRADE = 0.8
+
+# Marcadores ArUco dos cantos da folha; qualquer outro ID na folha alinhada
+# é o marcador de versão
+CANTOS = (0, 1, 2, 3)
+
+
+# -------------------------
+# Assinaturas
+# -------------------------
+def _normalizar(a):
+    a = a - a.mean()
+    n = float(np.linalg.norm(a))
+    return a / n if n > 0 else a
+
+
+def assinatura_layout(layout, ref_w=1000, ref_h=1400, escala=ESCALA):
+    """
+    Impressão digital da grade de bolhas do layout: um disco por bolha no
+    referencial reduzido, com média 0 e norma 1.
+    """
+    canvas = np.zeros((ref_h // escala, ref_w // escala), np.float32)
+    for q in layout["questions"]:
+        for x, y, w, h in q["boxes"]:
+            centro = (int(round((x + w / 2.0) / escala)), int(round((y + h / 2.0) / escala)))
+            cv2.circle(canvas, centro, max(1, int(round(min(w, h) / 2.0 / escala))), 1.0, -1, cv2.LINE_AA)
+    return _normalizar(canvas)
+
+
+def referencial_reduzido(img=None, M=None, warped=None, ref_w=1000, ref_h=1400, escala=ESCALA):
+    """
+    Folha alinhada em 1/escala, em cinza: reduzida da folha retificada
+    (warped) ou, no modo esparso, retificada direto da foto pela homografia M
+    (em 4x o tamanho final, depois média de blocos).
+    """
+    tam = (ref_w // escala, ref_h // escala)
+    if warped is None:
+        S = np.diag([4.0 / escala, 4.0 / escala, 1.0])
+        warped = cv2.warpPerspective(img, S @ M, (4 * tam[0], 4 * tam[1]), flags=cv2.INTER_LINEAR)
+    if warped.ndim == 3:
+        warped = cv2.cvtColor(warped, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(warped, tam, interpolation=cv2.INTER_AREA)
+
+
+def assinatura_folha(reduzida):
+    """
+    Onde a folha alinhada (referencial reduzido) é mais escura que a
+    vizinhança, com média 0 e norma 1. Bolhas vazias e marcadas contam igual.
+    """
+    escuro = 255.0 - reduzida.astype(np.float32)
+    escuro -= cv2.blur(escuro, (9, 9))
+    return _normalizar(np.maximum(escuro, 0))
+
+
+def marcador_versao(img=None, M=None, warped=None, ref_w=1000, ref_h=1400):
+    """
+    ID do marcador ArUco de versão (qualquer um fora dos cantos) na folha
+    alinhada em meia resolução, ou None.
+    """
+    if warped is None:
+        S = np.diag([0.5, 0.5, 1.0])
+        warped = cv2.warpPerspective(img, S @ M, (ref_w // 2, ref_h // 2), flags=cv2.INTER_LINEAR)
+    else:
+        warped = cv2.resize(warped, (ref_w // 2, ref_h // 2), interpolation=cv2.INTER_AREA)
+    if warped.ndim == 3:
+        warped = cv2.cvtColor(warped, cv2.COLOR_BGR2GRAY)
+    _, ids, _ = _get_aruco_detector().detectMarkers(warped)
+    if ids is None:
+        return None
+    extras = sorted(int(i) for i in ids.ravel() if int(i) not in CANTOS)
+    return extras[0] if extras else None
+
+
+# -------------------------
+# Registro
+# -------------------------
+class Versao:
+    """
+    Uma versão da prova: layout, gabarito ({qid: resposta}) e assinaturas.
+    """
+
+    def __init__(self, nome, layout, ans_key):
+        self.nome = str(nome)
+        self.layout = layout
+        self.ans_key = {int(k): v for k, v in ans_key.items()}
+        self.layout_id = layout_id(layout)
+        self.assinatura = assinatura_layout(layout)
+        self.marcador = layout.get("marcador_versao")
+
+
+class RegistroVersoes:
+    """
+    Versões de uma prova, na ordem em que foram adicionadas. Versões com a
+    mesma grade de bolhas formam um grupo e precisam de marcadores de versão
+    diferentes (validar).
+    """
+
+    def __init__(self):
+        self.versoes = {}
+        self._grupos = None
+
+    def __len__(self):
+        return len(self.versoes)
+
+    def __iter__(self):
+        return iter(self.versoes.values())
+
+    def __getitem__(self, nome):
+        return self.versoes[nome]
+
+    def adicionar(self, nome, layout, ans_key):
+        if str(nome) in self.versoes:
+            raise ValueError(f"Versão repetida: {nome}")
+        v = Versao(nome, layout, ans_key)
+        self.versoes[v.nome] = v
+        self._grupos = None
+        return v
+
+    def grupos(self):
+        """
+        Lista de grupos (listas de versões) com a mesma grade de bolhas.
+        """
+        if self._grupos is None:
+            grupos = []
+            for v in self.versoes.values():
+                for g in grupos:
+                    if float(np.sum(g[0].assinatura * v.assinatura)) >= MESMA_GRADE:
+                        g.append(v)
+                        break
+                else:
+                    grupos.append([v])
+            self._grupos = grupos
+        return self._grupos
+
+    def validar(self):
+        """
+        Garante que toda versão pode ser identificada. ValueError se duas versões
+        com a mesma grade não têm marcadores de versão (diferentes).
+        """
+        for g in self.grupos():
+            if len(g) < 2:
+                continue
+            marcadores = [v.marcador for v in g]
+            if None in marcadores or len(set(marcadores)) < len(marcadores):
+                nomes = ", ".join(v.nome for v in g)
+                raise ValueError(f"As versões {nomes} têm a mesma grade de bolhas e só podem ser "
+                                 f"separadas por marcadores de versão diferentes (ArUco fora dos cantos)")
+        return self
+
+    def identificar(self, img=None, M=None, warped=None):
+        """
+        Versão de uma folha alinhada (warped, ou foto + homografia M).
+        Retorna (versao, detalhes); versao é None quando a folha não se parece
+        o bastante com nenhuma. detalhes: correlação, margem e marcador lido.
+        """
+        sig = assinatura_folha(referencial_reduzido(img, M, warped))
+        corr = [(max(float(np.sum(v.assinatura * sig)) for v in g), g) for g in self.grupos()]
+        corr.sort(key=lambda c: c[0], reverse=True)
+        melhor, grupo = corr[0]
+        margem = melhor - corr[1][0] if len(corr) > 1 else melhor
+        detalhes = {"correlacao": round(melhor, 3), "margem": round(margem, 3)}
+        if melhor < CORR_MIN or margem < MARGEM_MIN:
+            return None, detalhes
+        if len(grupo) == 1:
+            return grupo[0], detalhes
+
+        marcador = marcador_versao(img, M, warped)
+        detalhes["marcador"] = marcador
+        for v in grupo:
+            if v.marcador == marcador:
+                return v, detalhes
+        return None, detalhes
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+"""
+Correção em tempo real por vídeo (webcam, celular ou arquivo). A folha é
+detectada uma vez (ArUco/contorno, como nas fotos) e depois acompanhada
+quadro a quadro por fluxo óptico, que só atualiza a homografia. Quando a
+folha fica parada, as bolhas são lidas pela homografia (modo esparso) e sai
+um resultado por folha.
+
+    python -m src.video --gabarito gabarito.jpg --fonte 0 --out saida_video
+    python -m src.video --gabarito gabarito.jpg --fonte aula.mp4 --gravar anotado.mp4
+"""
+import os
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from src.align.align import estimate_homography, DETECT_MAX_DIM
+from src.sparse import choose_option_sparse
+from src.engine import (decode_image, preparar_gabarito, make_context, export_reports,
+                        resultado_de_respostas, multiplas, DECODE_MIN_LADO)
+from src.result_store import ResultStore, assinatura
+
+# Maior lado dos quadros na detecção da folha (ArUco/contorno). Os cantos são
+# refinados na resolução original, então dá para detectar bem menor que nas fotos.
+VIDEO_DETECT_MAX_DIM = 960
+
+# Maior lado do quadro reduzido em que o fluxo óptico roda
+TRACK_MAX_DIM = 640
+
+
+# -------------------------
+# Rastreamento da folha
+# -------------------------
+class RastreadorFolha:
+    """
+    Acompanha a homografia M (quadro -> referencial) entre quadros: pontos
+    (cantos fortes) dentro da folha são seguidos por Lucas-Kanade piramidal no
+    quadro reduzido, e a homografia entre os dois quadros (RANSAC) é composta
+    com a M anterior. Muito mais barato que detectar a folha de novo.
+    - min_pontos: abaixo disso (ou de inliers) a folha é dada como perdida
+    """
+
+    def __init__(self, ref_w=1000, ref_h=1400, max_dim=TRACK_MAX_DIM, max_pontos=200, min_pontos=25):
+        self.ref_w = ref_w
+        self.ref_h = ref_h
+        self.max_dim = max_dim
+        self.max_pontos = max_pontos
+        self.min_pontos = min_pontos
+        self.M = None
+        self._anterior = None
+        self._pontos = None
+        self._escala = 1.0
+
+    def _reduzir(self, gray):
+        h, w = gray.shape[:2]
+        self._escala = min(1.0, self.max_dim / float(max(h, w)))
+        if self._escala >= 1.0:
+            return gray
+        return cv2.resize(gray, (int(w * self._escala), int(h * self._escala)), interpolation=cv2.INTER_AREA)
+
+    def cantos(self):
+        """
+        Cantos da folha no quadro (TL, TR, BR, BL), resolução original.
+        """
+        ref = np.float32([[0, 0], [self.ref_w, 0], [self.ref_w, self.ref_h], [0, self.ref_h]])
+        return cv2.perspectiveTransform(ref[None], np.linalg.inv(self.M))[0]
+
+    def _semear(self, pequeno):
+        mascara = np.zeros(pequeno.shape[:2], np.uint8)
+        cv2.fillConvexPoly(mascara, np.int32(self.cantos() * self._escala), 255)
+        self._pontos = cv2.goodFeaturesToTrack(pequeno, self.max_pontos, 0.01, 7, mask=mascara)
+
+    def iniciar(self, gray, M):
+        self.M = M
+        self._anterior = self._reduzir(gray)
+        self._semear(self._anterior)
+        if self._pontos is None or len(self._pontos) < self.min_pontos:
+            self.M = None
+        return self.M is not None
+
+    def atualizar(self, gray):
+        """
+        Segue a folha até o quadro `gray`. Retorna o movimento (mediana, px da
+        resolução original) ou None se a folha foi perdida (saiu, foi coberta).
+        """
+        pequeno = self._reduzir(gray)
+        p1, st, _ = cv2.calcOpticalFlowPyrLK(self._anterior, pequeno, self._pontos, None,
+                                             winSize=(21, 21), maxLevel=3)
+        ok = st.ravel() == 1 if p1 is not None else np.zeros(0, bool)
+        if ok.sum() < self.min_pontos:
+            return self._perder()
+        a, b = self._pontos[ok].reshape(-1, 2), p1[ok].reshape(-1, 2)
+        H, inliers = cv2.findHomography(a, b, cv2.RANSAC, 2.0)
+        if H is None or inliers.sum() < self.min_pontos:
+            return self._perder()
+        inliers = inliers.ravel() == 1
+
+        # homografia do quadro reduzido para a resolução original: S^-1 H S
+        S = np.diag([self._escala, self._escala, 1.0])
+        H = np.linalg.inv(S) @ H @ S
+        self.M = self.M @ np.linalg.inv(H)
+        movimento = float(np.median(np.linalg.norm(b[inliers] - a[inliers], axis=1))) / self._escala
+
+        self._anterior = pequeno
+        self._pontos = b[inliers].reshape(-1, 1, 2)
+        if len(self._pontos) < 2 * self.min_pontos:
+            self._semear(pequeno)  # repõe os pontos que foram ficando para trás
+            if self._pontos is None or len(self._pontos) < self.min_pontos:
+                return self._perder()
+        return movimento
+
+    def _perder(self):
+        self.M = None
+        self._pontos = None
+        return None
+
+
+# -------------------------
+# Fonte de vídeo
+# -------------------------
+def abrir_fonte(fonte):
+    """
+    cv2.VideoCapture de um arquivo/URL ou de uma câmera ("0", "1", ... ou int).
+    """
+    if isinstance(fonte, str) and fonte.isdigit():
+        fonte = int(fonte)
+    cap = cv2.VideoCapture(fonte)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Não foi possível abrir o vídeo: {fonte}")
+    return cap
+
+
+def _quadros(cap):
+    while True:
+        ok, quadro = cap.read()
+        if not ok:
+            return
+        yield quadro
+
+
+# -------------------------
+# Correção do vídeo
+# -------------------------
+class CorretorVideo:
+    """
+    Máquina de estados da correção por vídeo, um quadro por vez (processar):
+    procurando -> rastreando -> corrigida -> (folha sai ou troca) -> procurando.
+    - ctx: contexto de make_context (layout, gabarito, threshold, meta)
+    - quadros_estaveis: quadros seguidos com movimento < limiar_movimento (px)
+      antes de ler as bolhas
+    - procurar_cada: sem folha, tenta detectar a cada N quadros (a detecção é
+      a parte cara; o rastreamento roda em todo quadro)
+    - conferir_cada: com a folha já corrigida e parada, relê as bolhas a cada N
+      quadros; se `min_diferencas` respostas mudaram, trocaram a folha sem
+      tirá-la do quadro e ela é corrigida como uma nova
+    - reencontro: a folha perdida por até N quadros (mão na frente, tremida) e
+      achada de novo com as mesmas respostas não gera outro resultado
+    """
+
+    def __init__(self, ctx, quadros_estaveis=5, limiar_movimento=1.5, procurar_cada=2,
+                 conferir_cada=15, min_diferencas=3, reencontro=25, prefixo="folha",
+                 max_dim=VIDEO_DETECT_MAX_DIM):
+        self.ctx = ctx
+        # só o método do referencial do layout: o fallback para outro método
+        # (ex.: contorno numa folha com ArUco) leria as bolhas no lugar errado
+        metodo = ctx["metodo"]
+        if metodo == "auto_fallback":
+            metodo = ctx["layout"].get("alinhamento") or "aruco"
+        self.metodo = metodo
+        self.quadros_estaveis = quadros_estaveis
+        self.limiar_movimento = limiar_movimento
+        self.procurar_cada = max(1, procurar_cada)
+        self.conferir_cada = conferir_cada
+        self.min_diferencas = min_diferencas
+        self.reencontro = reencontro
+        self.prefixo = prefixo
+        self.max_dim = max_dim
+        self.rastreador = RastreadorFolha()
+        self.opcoes = {"threshold": ctx["threshold"], "diff_min": ctx["diff_min"]}
+        self.quadro = -1
+        self.folhas = 0
+        self.estado = "procurando"
+        self.estaveis = 0
+        self.lidas = None    # respostas da folha já corrigida
+        self.perdida_em = None
+        self.ultimo = None   # último resultado emitido
+        self.tempos = {"deteccao": 0.0, "rastreamento": 0.0, "leitura": 0.0}
+
+    def _detectar(self, gray, max_dim=None):
+        t0 = time.perf_counter()
+        M, metodo, ok = estimate_homography(gray, self.metodo, max_dim=max_dim or self.max_dim, avisar=False)
+        self.tempos["deteccao"] += time.perf_counter() - t0
+        return M, metodo, ok
+
+    def _ler(self, gray, M):
+        t0 = time.perf_counter()
+        ans, metrics, _ = choose_option_sparse(gray, M, self.ctx["layout"], **self.opcoes)
+        self.tempos["leitura"] += time.perf_counter() - t0
+        return ans, metrics
+
+    def processar(self, quadro, tempo_s=None):
+        """
+        Avança um quadro (BGR ou cinza). Retorna o resultado da folha (mesmo
+        dict de grade_batch, mais quadro e tempo_s) quando uma folha acaba de
+        ser corrigida; senão None.
+        """
+        self.quadro += 1
+        gray = cv2.cvtColor(quadro, cv2.COLOR_BGR2GRAY) if quadro.ndim == 3 else quadro
+
+        if self.estado == "procurando":
+            if self.quadro % self.procurar_cada:
+                return None
+            M, _, ok = self._detectar(gray)
+            if ok and self.rastreador.iniciar(gray, M):
+                self.estado = "rastreando"
+                self.estaveis = 0
+            return None
+
+        t0 = time.perf_counter()
+        movimento = self.rastreador.atualizar(gray)
+        self.tempos["rastreamento"] += time.perf_counter() - t0
+        if movimento is None:
+            self.estado = "procurando"   # a folha saiu do quadro (ou foi coberta)
+            self.perdida_em = self.quadro
+            return None
+        self.estaveis = self.estaveis + 1 if movimento < self.limiar_movimento else 0
+        if self.estaveis < self.quadros_estaveis:
+            return None
+
+        if self.estado == "corrigida":
+            if self.conferir_cada and self.estaveis % self.conferir_cada == 0:
+                ans, _ = self._ler(gray, self.rastreador.M)
+                if self._outra_folha(ans):
+                    self.estado = "rastreando"   # outra folha no mesmo lugar
+                    self.estaveis = 0
+            return None
+        return self._corrigir(gray, tempo_s)
+
+    def _outra_folha(self, ans):
+        if self.lidas is None:
+            return True
+        return sum(ans.get(q) != a for q, a in self.lidas.items()) >= self.min_diferencas
+
+    def _corrigir(self, gray, tempo_s):
+        # uma detecção completa (resolução de foto) no quadro parado tira o erro
+        # acumulado do rastreamento
+        M, metodo, ok = self._detectar(gray, DETECT_MAX_DIM)
+        if ok:
+            self.rastreador.iniciar(gray, M)
+        else:
+            M, metodo = self.rastreador.M, "rastreio"
+        ans, metrics = self._ler(gray, M)
+        self.estado = "corrigida"
+        if (self.perdida_em is not None and self.quadro - self.perdida_em <= self.reencontro
+                and not self._outra_folha(ans)):
+            return None   # a mesma folha, reencontrada
+        self.lidas = ans
+
+        self.folhas += 1
+        ratios = [metrics[q["qid"]]["ratios"] if q["qid"] in metrics else []
+                  for q in self.ctx["layout"]["questions"]]
+        r = resultado_de_respostas(f"{self.prefixo}_{self.folhas:03d}", ans, self.ctx, multiplas(metrics),
+                                   metodo=metodo, esparso=True, ratios=ratios)
+        r["quadro"] = self.quadro
+        r["tempo_s"] = tempo_s
+        self.ultimo = r
+        return r
+
+    def anotar(self, quadro):
+        """
+        Cópia do quadro com o contorno da folha (amarelo rastreando, verde
+        corrigida) e a nota da última folha.
+        """
+        out = quadro.copy() if quadro.ndim == 3 else cv2.cvtColor(quadro, cv2.COLOR_GRAY2BGR)
+        if self.estado != "procurando" and self.rastreador.M is not None:
+            cor = (0, 200, 0) if self.estado == "corrigida" else (0, 220, 255)
+            cv2.polylines(out, [np.int32(self.rastreador.cantos())], True, cor, 3)
+        texto = self.estado
+        if self.ultimo is not None:
+            s = self.ultimo["stats"]
+            texto += f" | {self.ultimo['aluno']}: {s['score']:.1f} ({s['correct']}/{s['total']})"
+        cv2.putText(out, texto, (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 2)
+        return out
+
+
+def corrigir_video(fonte, corretor, max_quadros=None, ao_quadro=None):
+    """
+    Corrige as folhas que aparecem num vídeo. Gera um resultado por folha.
+    - fonte: arquivo/URL, índice de câmera ou um cv2.VideoCapture já aberto
+    - corretor: CorretorVideo (ou o ctx de make_context, para um com os padrões)
+    - ao_quadro: chamado com (corretor, quadro) a cada quadro (ex.: mostrar/gravar)
+    """
+    if not isinstance(corretor, CorretorVideo):
+        corretor = CorretorVideo(corretor)
+    cap = fonte if isinstance(fonte, cv2.VideoCapture) else abrir_fonte(fonte)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    try:
+        for i, quadro in enumerate(_quadros(cap)):
+            if max_quadros is not None and i >= max_quadros:
+                break
+            r = corretor.processar(quadro, tempo_s=round(i / fps, 3) if fps > 0 else None)
+            if ao_quadro is not None:
+                ao_quadro(corretor, quadro)
+            if r is not None:
+                yield r
+    finally:
+        if not isinstance(fonte, cv2.VideoCapture):
+            cap.release()
+
+
+# -------------------------
+# CLI
+# -------------------------
+def main():
+    parser = argparse.ArgumentParser(description="CorriJá - correção por vídeo")
+    parser.add_argument("--gabarito", required=True, help="Imagem do gabarito")
+    parser.add_argument("--fonte", required=True, help="Arquivo de vídeo, URL ou índice da câmera (0, 1, ...)")
+    parser.add_argument("--out", default=None, help="Diretório de saída (resultados.csv e PDFs)")
+    parser.add_argument("--metodo", default="auto_fallback", choices=["auto", "aruco", "auto_fallback"])
+    parser.add_argument("--limiar", type=float, default=0.25, help="Preenchimento mínimo da bolha marcada")
+    parser.add_argument("--diff-min", type=float, default=0.08)
+    parser.add_argument("--estaveis", type=int, default=5, help="Quadros parados antes de corrigir")
+    parser.add_argument("--max-quadros", type=int, default=None)
+    parser.add_argument("--mostrar", action="store_true", help="Mostra o vídeo anotado numa janela")
+    parser.add_argument("--gravar", default=None, help="Grava o vídeo anotado neste arquivo (.mp4)")
+    args = parser.parse_args()
+
+    img_key = decode_image(args.gabarito, cinza=True, min_lado=DECODE_MIN_LADO)
+    if img_key is None:
+        raise FileNotFoundError(f"Gabarito não encontrado: {args.gabarito}")
+    layout, ans_key, _ = preparar_gabarito(img_key, metodo=args.metodo, threshold=args.limiar,
+                                           diff_min=args.diff_min)
+    out_dir = args.out or "."
+    ctx = make_context(layout, ans_key, out_dir, metodo=args.metodo, esparso=True, pdf=False,
+                       threshold=args.limiar, diff_min=args.diff_min)
+
+    resultados = None
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+        # cada execução é um lote novo: o vídeo não é retomável como uma pasta de fotos
+        chave = assinatura(ctx["layout_id"], ctx["ans_key"], fonte=str(args.fonte), inicio=time.time())
+        resultados = ResultStore(os.path.join(args.out, "blocos"), list(ctx["ans_key"]), layout["options"],
+                                 chave=chave, linhas_por_bloco=1,
+                                 ao_gravar=lambda bloco: export_reports(bloco, args.out, workers=1))
+
+    gravador = [None]
+    mostrar = [args.mostrar]
+
+    def ao_quadro(corretor, quadro):
+        if not (args.gravar or mostrar[0]):
+            return
+        anotado = corretor.anotar(quadro)
+        if args.gravar:
+            if gravador[0] is None:
+                h, w = anotado.shape[:2]
+                gravador[0] = cv2.VideoWriter(args.gravar, cv2.VideoWriter_fourcc(*"mp4v"), 25, (w, h))
+            gravador[0].write(anotado)
+        if mostrar[0]:
+            try:
+                cv2.imshow("CorriJa", anotado)
+                cv2.waitKey(1)
+            except cv2.error:
+                print("[WARN] Sem suporte a janelas (opencv headless); use --gravar")
+                mostrar[0] = False
+
+    corretor = CorretorVideo(ctx, quadros_estaveis=args.estaveis)
+    t0 = time.perf_counter()
+    n = 0
+    for r in corrigir_video(args.fonte, corretor, max_quadros=args.max_quadros, ao_quadro=ao_quadro):
+        n += 1
+        s = r["stats"]
+        print(f"[OK] {r['aluno']} (quadro {r['quadro']}): nota {s['score']:.1f} ({s['correct']}/{s['total']})")
+        if resultados is not None:
+            resultados.adicionar(r)
+    dt = time.perf_counter() - t0
+
+    if gravador[0] is not None:
+        gravador[0].release()
+    if resultados is not None:
+        resultados.fechar()
+        resultados.exportar_csv(os.path.join(args.out, "resultados.csv"),
+                                ["aluno", "nota", "acertos", "erros", "brancos", "multiplas"])
+    q = corretor.quadro + 1
+    if q > 0 and dt > 0:
+        tempos = {k: round(v * 1000 / q, 2) for k, v in corretor.tempos.items()}
+        print(f"[OK] {n} folha(s) em {q} quadros, {q / dt:.1f} quadros/s (ms por quadro: {tempos})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+"""
+Aquecimento do processo: importa a pilha de correção (OpenCV, numpy,
+ReportLab), cria o detector ArUco, monta o cabeçalho do PDF e corrige uma
+prova sintética, para que a primeira correção de verdade não pague por isso.
+Mede cada etapa (relatório de inicialização).
+
+    python -m src.warmup [--json inicio.json]
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# Etapas, na ordem em que rodam
+ETAPAS = ("importacoes", "aruco", "pdf", "correcao_sintetica")
+
+
+def idade_processo():
+    """
+    Segundos desde que o processo começou (Linux, /proc); None se não der para saber.
+    """
+    try:
+        with open("/proc/self/stat", "r") as f:
+            campos = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime", "r") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(campos[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class Aquecimento:
+    """
+    Estado e relatório do aquecimento do processo.
+    status: pendente -> aquecendo -> pronto | erro
+    """
+
+    def __init__(self):
+        self.status = "pendente"
+        self.etapas = {}
+        self.erro = None
+        self.sintetica_ok = None
+        self.antes_s = None   # idade do processo quando o aquecimento começou
+        self.pronto_s = None  # idade do processo quando ficou pronto
+        self.pronto = threading.Event()
+
+    @contextmanager
+    def _etapa(self, nome):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.etapas[nome] = round((time.perf_counter() - t0) * 1000, 1)
+
+    def executar(self):
+        """
+        Roda as etapas. Uma exceção (ex.: dependência faltando) deixa o status
+        em "erro"; a prova sintética não ser corrigida só fica registrada.
+        """
+        self.status = "aquecendo"
+        self.antes_s = idade_processo()
+        try:
+            with self._etapa("importacoes"):
+                import numpy as np
+                from src import engine, result_store, scoring, dedupe
+                from src.export_pdf import get_renderer
+                from src.extract import compare_answers
+                from src.align.align import _get_aruco_detector
+
+            with self._etapa("aruco"):
+                _get_aruco_detector().detectMarkers(np.full((64, 64), 255, np.uint8))
+
+            with tempfile.TemporaryDirectory() as tmp:
+                with self._etapa("pdf"):
+                    stats = compare_answers({1: "A", 2: "B", 3: ""}, {1: "A", 2: "C", 3: ["D", "E"]})
+                    get_renderer().render(os.path.join(tmp, "aquecimento.pdf"),
+                                          {"aluno": "aquecimento", "score": stats["score"],
+                                           "correct": stats["correct"], "total": 3}, stats["per_q"])
+
+                with self._etapa("correcao_sintetica"):
+                    self.sintetica_ok = _correcao_sintetica(tmp)
+        except Exception as e:
+            self.erro = str(e)
+            self.status = "erro"
+            print(f"[ERRO] aquecimento: {e}")
+        else:
+            self.status = "pronto"
+        self.pronto_s = idade_processo()
+        self.pronto.set()
+        return self
+
+    def iniciar(self, depois=None):
+        """
+        Aquece numa thread de fundo e, no fim, chama depois() (ex.: iniciar os workers).
+        """
+        def rodar():
+            self.executar()
+            if depois is not None:
+                depois()
+
+        t = threading.Thread(target=rodar, daemon=True, name="corrija-aquecimento")
+        t.start()
+        return t
+
+    # -------------------------
+    # Relatório
+    # -------------------------
+    def relatorio(self):
+        total = sum(self.etapas.values())
+        return {
+            "status": self.status,
+            "erro": self.erro,
+            "processo_ate_aquecer_s": _arred(self.antes_s),
+            "aquecimento_ms": round(total, 1),
+            "etapas_ms": dict(self.etapas),
+            "pronto_em_s": _arred(self.pronto_s),
+            "correcao_sintetica_ok": self.sintetica_ok,
+        }
+
+    def prometheus(self):
+        linhas = ["# TYPE corrija_inicio_segundos gauge"]
+        for nome in ETAPAS:
+            if nome in self.etapas:
+                linhas.append(f'corrija_inicio_segundos{{etapa="{nome}"}} {self.etapas[nome] / 1000:.4f}')
+        if self.antes_s is not None:
+            linhas.append(f'corrija_inicio_segundos{{etapa="processo_ate_aquecer"}} {self.antes_s:.4f}')
+        if self.pronto_s is not None:
+            linhas.append(f'corrija_inicio_segundos{{etapa="pronto"}} {self.pronto_s:.4f}')
+        linhas.append("# TYPE corrija_pronto gauge")
+        linhas.append(f"corrija_pronto {int(self.status == 'pronto')}")
+        return "\n".join(linhas) + "\n"
+
+
+def _arred(v):
+    return round(v, 3) if v is not None else None
+
+
+def _correcao_sintetica(tmp):
+    """
+    Uma prova sintética pequena pelo caminho inteiro (gabarito, alinhamento,
+    extração, comparação), sem cache nem store. Retorna True se corrigiu.
+    """
+    from src.synth import gerar_gabarito, gerar_lote, encode_jpeg
+    from src.engine import decode_image, preparar_gabarito, make_context, grade_batch, DECODE_MIN_LADO
+
+    gab = gerar_gabarito(seed=0, n_questoes=10, megapixels=1.0)
+    img = decode_image(encode_jpeg(gab["img"]), cinza=True, min_lado=DECODE_MIN_LADO)
+    layout, ans_key, _ = preparar_gabarito(img)
+    prova = next(iter(gerar_lote(1, gab, seed=0, megapixels=1.0)))
+    ctx = make_context(layout, ans_key, tmp, pdf=False)
+    r = next(iter(grade_batch([(prova["nome"], encode_jpeg(prova["img"]))], ctx, workers=1)))
+    return bool(r["ok"])
+
+
+_AQUECIMENTO = None
+_AQUECIMENTO_LOCK = threading.Lock()
+
+
+def get_aquecimento():
+    """
+    Aquecimento do processo (único).
+    """
+    global _AQUECIMENTO
+    with _AQUECIMENTO_LOCK:
+        if _AQUECIMENTO is None:
+            _AQUECIMENTO = Aquecimento()
+        return _AQUECIMENTO
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aquece o processo e mostra o tempo de cada etapa")
+    parser.add_argument("--json", default=None, help="Grava o relatório neste arquivo")
+    args = parser.parse_args()
+
+    relatorio = get_aquecimento().executar().relatorio()
+    print(json.dumps(relatorio, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
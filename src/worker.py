@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+"""
+Worker de correção: consome a fila de jobs da API (src/jobs.py) fora do
+processo da API. Rode quantos quiser, em uma ou mais máquinas que enxerguem
+o mesmo CORRIJA_JOBS_DIR:
+
+    python -m src.worker --jobs-dir /dados/corrija_jobs --concorrencia 2
+"""
+import os
+import signal
+import argparse
+
+from src.jobs import JobQueue, Worker
+from src.warmup import get_aquecimento
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker da fila de correção do CorriJá")
+    parser.add_argument("--jobs-dir", default=None,
+                        help="Diretório da fila (padrão: CORRIJA_JOBS_DIR ou ~/.local/share/corrija/jobs)")
+    parser.add_argument("--concorrencia", type=int, default=1,
+                        help="Jobs corrigidos ao mesmo tempo, em threads (cada lote leva o seu contexto; "
+                             "cada um já usa vários processos)")
+    parser.add_argument("--lease", type=float, default=60,
+                        help="Segundos sem sinal do worker até outro retomar o job")
+    parser.add_argument("--tentativas", type=int, default=3,
+                        help="Tentativas por job antes de desistir (limita o valor gravado pela API no job)")
+    parser.add_argument("--intervalo", type=float, default=1.0, help="Segundos entre consultas com a fila vazia")
+    parser.add_argument("--um", action="store_true", help="Corrige no máximo um job e sai")
+    parser.add_argument("--sem-aquecer", action="store_true",
+                        help="Começa a pegar jobs sem o aquecimento (ver src/warmup.py)")
+    args = parser.parse_args()
+
+    if args.jobs_dir:
+        os.environ["CORRIJA_JOBS_DIR"] = args.jobs_dir
+    # a API importa a mesma fila (CORRIJA_JOBS_DIR) e a função que corrige um job
+    from src.app import executar_job
+
+    # aquece antes de pegar o primeiro job: o lease não corre durante o aquecimento
+    if not args.sem_aquecer:
+        inicio = get_aquecimento().executar().relatorio()
+        print(f"[OK] Aquecido em {inicio['aquecimento_ms']:.0f} ms "
+              f"(pronto {inicio['pronto_em_s']} s após iniciar): {inicio['etapas_ms']}")
+
+    fila = JobQueue(args.jobs_dir, lease=args.lease, max_tentativas=args.tentativas)
+    workers = [Worker(fila, executar_job, intervalo=args.intervalo) for _ in range(max(1, args.concorrencia))]
+
+    if args.um:
+        workers[0].executar_um()
+        return
+
+    def parar(*_):
+        print("[OK] Parando: os jobs em andamento terminam antes de sair")
+        for w in workers:
+            w.parar.set()
+
+    signal.signal(signal.SIGTERM, parar)
+    signal.signal(signal.SIGINT, parar)
+    threads = [w.iniciar() for w in workers]
+    print(f"[OK] {len(workers)} worker(s) consumindo {fila.base_dir}")
+    for t in threads:
+        t.join()
+
+
+if __name__ == "__main__":
+    main()